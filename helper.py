@@ -1,43 +1,128 @@
 # Helper functions
 import bpy
-from bpy_extras.view3d_utils import region_2d_to_origin_3d, region_2d_to_vector_3d
+from bpy.app.handlers import persistent
+from bpy_extras.view3d_utils import region_2d_to_origin_3d, region_2d_to_vector_3d, \
+    region_2d_to_location_3d, location_3d_to_region_2d
 from mathutils.geometry import intersect_line_plane
 from mathutils import Vector, Matrix
-import bmesh
+from math import pi
+import numpy as np
+
+from road_core.spatial import Connector_index
+from road_core.record import Road_record
+
+# Snapping radius around the mouse pointer in pixels
+RADIUS_SNAP_PIXELS = 20
+
+class DSC_id_allocator():
+    '''
+        Allocator for OpenDRIVE or OpenSCENARIO IDs. The next free ID is
+        stored in a dummy object so that it is saved with the file. IDs are
+        claimed from the dummy object in blocks and then handed out from
+        memory, so the dummy object is only written once per block. IDs left
+        over in a block at the end of a session are skipped.
+    '''
+
+    def __init__(self, key_next, key_id, id_first, link_function, size_block=64):
+        self.key_next = key_next
+        self.key_id = key_id
+        self.id_first = id_first
+        self.link_function = link_function
+        self.size_block = size_block
+        self.messages = []
+        self.invalidate()
+
+    def invalidate(self):
+        '''
+            Forget the claimed block, e.g. when the dummy object has been
+            reverted by undo or replaced by loading a file.
+        '''
+        self.id_next = 0
+        self.id_end = 0
+
+    def get_dummy_object(self, context):
+        dummy_obj = bpy.data.objects.get(self.key_next)
+        if dummy_obj is None:
+            dummy_obj = bpy.data.objects.new(self.key_next, None)
+            # Do not render
+            dummy_obj.hide_viewport = True
+            dummy_obj.hide_render = True
+            dummy_obj[self.key_next] = self.id_first
+            self.link_function(context, dummy_obj)
+        return dummy_obj
+
+    def reserve(self, context, count):
+        '''
+            Return range of count consecutive new IDs.
+        '''
+        if self.id_end - self.id_next < count:
+            dummy_obj = self.get_dummy_object(context)
+            self.id_next = dummy_obj[self.key_next]
+            self.id_end = self.id_next + max(count, self.size_block)
+            dummy_obj[self.key_next] = self.id_end
+        ids = range(self.id_next, self.id_next + count)
+        self.id_next += count
+        return ids
+
+    def check_collisions(self, collection_name):
+        '''
+            Check the IDs of the objects in the collection and its
+            subcollections against each other and against the stored next ID.
+            Move the stored next ID past the largest ID in use and return the
+            list of IDs used more than once. Messages describing the problems
+            found are kept in self.messages for reporting.
+        '''
+        self.messages = []
+        collection = bpy.data.collections.get(collection_name)
+        dummy_obj = bpy.data.objects.get(self.key_next)
+        if collection is None or dummy_obj is None:
+            return []
+        ids_used = set()
+        ids_duplicate = set()
+        for obj in collection.all_objects:
+            if self.key_id in obj:
+                if obj[self.key_id] in ids_used:
+                    ids_duplicate.add(obj[self.key_id])
+                ids_used.add(obj[self.key_id])
+        if ids_used and max(ids_used) >= dummy_obj[self.key_next]:
+            self.messages.append('Next {} {} already in use, moved it to {}.'.format(
+                self.key_id, dummy_obj[self.key_next], max(ids_used) + 1))
+            dummy_obj[self.key_next] = max(ids_used) + 1
+            self.invalidate()
+        if ids_duplicate:
+            self.messages.append('Duplicate {} in {}: {}'.format(self.key_id, collection_name,
+                sorted(ids_duplicate)))
+        return sorted(ids_duplicate)
+
+# Allocators shared by all operators
+id_allocator_xodr = DSC_id_allocator('id_xodr_next', 'id_xodr', 1,
+    lambda context, obj: link_object_opendrive(context, obj))
+id_allocator_xosc = DSC_id_allocator('id_xosc_next', 'id_xosc', 0,
+    lambda context, obj: link_object_openscenario(context, obj, subcategory=None))
+
+def reserve_ids_opendrive(context, count):
+    '''
+        Reserve and return range of count consecutive new OpenDRIVE IDs.
+    '''
+    return id_allocator_xodr.reserve(context, count)
+
+def reserve_ids_openscenario(context, count):
+    '''
+        Reserve and return range of count consecutive new OpenSCENARIO IDs.
+    '''
+    return id_allocator_xosc.reserve(context, count)
 
 def get_new_id_opendrive(context):
     '''
-        Generate and return new ID for OpenDRIVE objects using a dummy object
-        for storage.
-    '''
-    dummy_obj = context.scene.objects.get('id_xodr_next')
-    if dummy_obj is None:
-        dummy_obj = bpy.data.objects.new('id_xodr_next',None)
-        # Do not render
-        dummy_obj.hide_viewport = True
-        dummy_obj.hide_render = True
-        dummy_obj['id_xodr_next'] = 1
-        link_object_opendrive(context, dummy_obj)
-    id_next = dummy_obj['id_xodr_next']
-    dummy_obj['id_xodr_next'] += 1
-    return id_next
+        Generate and return new ID for OpenDRIVE objects.
+    '''
+    return id_allocator_xodr.reserve(context, 1)[0]
 
 def get_new_id_openscenario(context):
     '''
-        Generate and return new ID for OpenSCENARIO objects using a dummy object
-        for storage.
-    '''
-    dummy_obj = context.scene.objects.get('id_xosc_next')
-    if dummy_obj is None:
-        dummy_obj = bpy.data.objects.new('id_xosc_next',None)
-        # Do not render
-        dummy_obj.hide_viewport = True
-        dummy_obj.hide_render = True
-        dummy_obj['id_xosc_next'] = 0
-        link_object_openscenario(context, dummy_obj, subcategory=None)
-    id_next = dummy_obj['id_xosc_next']
-    dummy_obj['id_xosc_next'] += 1
-    return id_next
+        Generate and return new ID for OpenSCENARIO objects.
+    '''
+    return id_allocator_xosc.reserve(context, 1)[0]
 
 def ensure_collection_opendrive(context):
     if not 'OpenDRIVE' in bpy.data.collections:
@@ -92,15 +177,173 @@ def link_object_openscenario(context, obj, subcategory=None):
         collection = bpy.data.collections.get('OpenSCENARIO').children.get(subcategory)
         collection.objects.link(obj)
 
+class DSC_id_index():
+    '''
+        Index of the OpenDRIVE objects by their ID. Entries store object
+        names and are validated on each lookup. The index is rebuilt from the
+        OpenDRIVE collection after loading a file, after undo/redo and when
+        a lookup fails. IDs still missing after a rebuild are remembered until
+        the next change so repeated failing lookups do not rebuild again.
+    '''
+
+    def __init__(self):
+        self.names = {}
+        self.ids_missing = set()
+        self.valid = False
+
+    def invalidate(self):
+        self.ids_missing = set()
+        self.valid = False
+
+    def rebuild(self):
+        self.names = {}
+        self.ids_missing = set()
+        collection = bpy.data.collections.get('OpenDRIVE')
+        if collection is not None:
+            for obj in collection.objects:
+                if 'id_xodr' in obj:
+                    self.names[obj['id_xodr']] = obj.name
+        self.valid = True
+
+    def add(self, obj):
+        self.names[obj['id_xodr']] = obj.name
+        self.ids_missing = set()
+
+    def lookup(self, id_xodr):
+        '''
+            Return object for ID from the index if the entry is still valid.
+        '''
+        name = self.names.get(id_xodr)
+        if name is None:
+            return None
+        obj = bpy.data.objects.get(name)
+        if obj is None or obj.get('id_xodr') != id_xodr:
+            return None
+        return obj
+
+    def get(self, id_xodr):
+        '''
+            Return object for ID, None if there is no such object.
+        '''
+        if not self.valid:
+            self.rebuild()
+        obj = self.lookup(id_xodr)
+        if obj is None and id_xodr not in self.ids_missing:
+            # Objects might have been renamed or created by other means
+            self.rebuild()
+            obj = self.lookup(id_xodr)
+            if obj is None:
+                self.ids_missing.add(id_xodr)
+        return obj
+
+# Index shared by all operators
+id_index_xodr = DSC_id_index()
+
+def set_id_xodr(obj, id_xodr):
+    '''
+        Set OpenDRIVE ID of object and add it to the ID index.
+    '''
+    obj['id_xodr'] = id_xodr
+    id_index_xodr.add(obj)
+
 def get_object_xodr_by_id(id_xodr):
     '''
         Get reference to OpenDRIVE object by ID, return None if not found.
     '''
-    collection = bpy.data.collections.get('OpenDRIVE')
-    for obj in collection.objects:
-        if 'id_xodr' in obj:
-            if obj['id_xodr'] == id_xodr:
-                return obj
+    return id_index_xodr.get(id_xodr)
+
+class DSC_object_tracker():
+    '''
+        Names of the DSC objects reported as changed by the depsgraph handler
+        since the last query of a cache. Caches rebuild completely if the
+        tracker is not valid, i.e. after loading a file and after undo/redo.
+    '''
+
+    def __init__(self):
+        self.names_dirty = set()
+        self.check_removed = False
+        self.valid = False
+
+    def invalidate(self):
+        self.valid = False
+
+    def mark_dirty(self, name):
+        self.names_dirty.add(name)
+
+    def pop_changes(self):
+        '''
+            Return validity, set of changed object names and whether objects
+            might have been removed, then reset the tracker.
+        '''
+        changes = (self.valid, self.names_dirty, self.check_removed)
+        self.names_dirty = set()
+        self.check_removed = False
+        self.valid = True
+        return changes
+
+# Trackers by name of the cache using them
+object_trackers = {}
+
+def get_object_tracker(name):
+    '''
+        Return object tracker for a cache, create it if necessary.
+    '''
+    tracker = object_trackers.get(name)
+    if tracker is None:
+        tracker = DSC_object_tracker()
+        object_trackers[name] = tracker
+    return tracker
+
+@persistent
+def callback_id_index_invalidate(*args):
+    id_index_xodr.invalidate()
+    connector_index.invalidate()
+    for tracker in object_trackers.values():
+        tracker.invalidate()
+    id_allocator_xodr.invalidate()
+    id_allocator_xosc.invalidate()
+
+@persistent
+def callback_id_index_load(*args):
+    callback_id_index_invalidate()
+    migrate_road_records()
+    id_allocator_xodr.check_collisions('OpenDRIVE')
+    id_allocator_xosc.check_collisions('OpenSCENARIO')
+
+@persistent
+def callback_id_index_depsgraph(scene, depsgraph):
+    # Pick up objects with an OpenDRIVE ID which were added or renamed
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Object):
+            obj = update.id.original
+            if 'id_xodr' in obj and id_index_xodr.lookup(obj['id_xodr']) is not obj:
+                id_index_xodr.add(obj)
+            if 'dsc_category' in obj:
+                connector_index.mark_dirty(obj.name)
+                for tracker in object_trackers.values():
+                    tracker.mark_dirty(obj.name)
+        elif isinstance(update.id, (bpy.types.Collection, bpy.types.Scene)):
+            # Objects might have been deleted
+            connector_index.check_removed = True
+            for tracker in object_trackers.values():
+                tracker.check_removed = True
+
+def register_index_handlers():
+    # Avoid duplicate handlers when the add-on is registered again
+    unregister_index_handlers()
+    bpy.app.handlers.load_post.append(callback_id_index_load)
+    bpy.app.handlers.undo_post.append(callback_id_index_invalidate)
+    bpy.app.handlers.redo_post.append(callback_id_index_invalidate)
+    bpy.app.handlers.depsgraph_update_post.append(callback_id_index_depsgraph)
+
+def unregister_index_handlers():
+    for handlers, callback in [(bpy.app.handlers.load_post, callback_id_index_load),
+                               (bpy.app.handlers.undo_post, callback_id_index_invalidate),
+                               (bpy.app.handlers.redo_post, callback_id_index_invalidate),
+                               (bpy.app.handlers.depsgraph_update_post, callback_id_index_depsgraph)]:
+        # Compare by name since reloading the module creates new functions
+        for handler in [handler for handler in handlers if handler.__name__ == callback.__name__]:
+            handlers.remove(handler)
 
 def create_object_xodr_links(obj, link_type, cp_type_other, id_other, id_junction):
     '''
@@ -187,19 +430,81 @@ def create_object_xodr_links(obj, link_type, cp_type_other, id_other, id_junctio
         # Case: road to junction or junction to junction
         obj_other['incoming_roads'][cp_type_other] = obj['id_xodr']
 
+    # Writing custom properties is not always reported by the depsgraph
+    tracker = get_object_tracker('road_network')
+    tracker.mark_dirty(obj.name)
+    tracker.mark_dirty(obj_other.name)
+
+# Decoded road records by object name together with the packed data they were
+# decoded from, see get_road_record
+road_records = {}
+
+def get_road_record(obj):
+    '''
+        Return the geometry and lane parameters of a road object decoded
+        from its packed record. Each record is only decoded once after it
+        changed, treat the returned record as read-only. Objects from older
+        files without a record are read from their separate custom
+        properties.
+    '''
+    valid, _, check_removed = get_object_tracker('road_records').pop_changes()
+    if not valid:
+        road_records.clear()
+    elif check_removed:
+        for name in [name for name in road_records if bpy.data.objects.get(name) is None]:
+            del road_records[name]
+    if 'road_record' not in obj:
+        params = {name: obj[name] for name in Road_record.__slots__[1:] if name in obj}
+        return Road_record(obj['geometry'].to_dict(), params)
+    data = obj['road_record']
+    cached = road_records.get(obj.name)
+    if cached is not None and cached[0] == data:
+        return cached[1]
+    record = Road_record.unpack(data)
+    road_records[obj.name] = (data, record)
+    return record
+
+def set_road_record(obj, record):
+    '''
+        Store the packed record of a road object.
+    '''
+    data = record.pack()
+    obj['road_record'] = data
+    road_records[obj.name] = (data, record)
+
+def has_road_record(obj):
+    '''
+        Return True if the object stores road parameters, either as packed
+        record or as separate custom properties of an older file.
+    '''
+    return 'road_record' in obj or 'geometry' in obj
+
+def migrate_road_records():
+    '''
+        Replace the separate geometry and lane custom properties of the road
+        objects from older files by the packed record, return the number of
+        migrated roads.
+    '''
+    collection = bpy.data.collections.get('OpenDRIVE')
+    if collection is None:
+        return 0
+    num_migrated = 0
+    for obj in collection.objects:
+        if obj.get('dsc_type') == 'road' and 'geometry' in obj and not 'road_record' in obj:
+            set_road_record(obj, get_road_record(obj))
+            for name in ['geometry'] + list(Road_record.__slots__[1:]):
+                if name in obj:
+                    del obj[name]
+            num_migrated += 1
+    return num_migrated
+
 def get_width_road_sides(obj):
     '''
-        Return the width of the left and right road sid e calculated by suming up
-        all lane widths.
+        Return the width of the left and right road side calculated by summing
+        up all lane widths.
     '''
     # TODO take edge lines and opening/closing lanes into account
-    width_left = 0
-    width_right = 0
-    for width_lane_left in obj['lanes_left_widths']:
-        width_left += width_lane_left
-    for width_lane_right in obj['lanes_right_widths']:
-        width_right += width_lane_right
-    return width_left, width_right
+    return get_road_record(obj).get_width_road_sides()
 
 def select_activate_object(context, obj):
     '''
@@ -209,17 +514,6 @@ def select_activate_object(context, obj):
     obj.select_set(state=True)
     context.view_layer.objects.active = obj
 
-def remove_duplicate_vertices(context, obj):
-    '''
-        Remove duplicate vertices from a object's mesh
-    '''
-    context.view_layer.objects.active = obj
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.remove_doubles(threshold=0.001,
-                use_unselected=True, use_sharp_edge_from_normals=False)
-    bpy.ops.object.editmode_toggle()
-
 def get_mouse_vectors(context, event):
     '''
         Return view vector and ray origin of mouse pointer position.
@@ -281,66 +575,6 @@ def raycast_mouse_to_object(context, event, filter=None):
         # No hit
         return False, point, None
 
-def point_to_road_connector(obj, point):
-    '''
-        Get a snapping point and heading from an existing road.
-    '''
-    dist_start_l = (Vector(obj['cp_start_l']) - point).length
-    dist_start_r = (Vector(obj['cp_start_r']) - point).length
-    dist_end_l = (Vector(obj['cp_end_l']) - point).length
-    dist_end_r = (Vector(obj['cp_end_r']) - point).length
-    distances = [dist_start_l, dist_start_r, dist_end_l, dist_end_r]
-    arg_min_dist = distances.index(min(distances))
-    width_left, width_right = get_width_road_sides(obj)
-    if arg_min_dist == 0:
-        return 'cp_start_l', Vector(obj['cp_start_l']), obj['geometry']['heading_start'] - pi, \
-            obj['geometry']['curvature_start'], obj['geometry']['slope_start'], \
-            width_left, width_right
-    if arg_min_dist == 1:
-        return 'cp_start_r', Vector(obj['cp_start_r']), obj['geometry']['heading_start'] - pi, \
-            obj['geometry']['curvature_start'], obj['geometry']['slope_start'], \
-            width_left, width_right
-    elif arg_min_dist == 2:
-        return 'cp_end_l', Vector(obj['cp_end_l']), obj['geometry']['heading_end'], \
-            obj['geometry']['curvature_end'], obj['geometry']['slope_end'], \
-            width_left, width_right
-    else:
-        return 'cp_end_r', Vector(obj['cp_end_r']), obj['geometry']['heading_end'], \
-            obj['geometry']['curvature_end'], obj['geometry']['slope_end'], \
-            width_left, width_right
-
-def point_to_junction_joint(obj, point):
-    '''
-        Get joint parameters from closest joint including incoming road ID,
-        contact point type, vector and heading from an existing junction.
-    '''
-    # Calculate which connecting point is closest to input point
-    joints = obj['joints']
-    distances = []
-    cp_vectors = []
-    for idx, joint in enumerate(joints):
-        cp_vectors.append(Vector(joint['contact_point_vec']))
-        distances.append((Vector(joint['contact_point_vec']) - point).length)
-    arg_min_dist = distances.index(min(distances))
-    return joints[arg_min_dist]['id_incoming'], joints[arg_min_dist]['contact_point'], \
-        cp_vectors[arg_min_dist], joints[arg_min_dist]['heading']
-
-def point_to_junction_connector(obj, point):
-    '''
-        Get a snapping point and heading from an existing junction.
-        # TODO later remove this path and unify junctions
-    '''
-    # Calculate which connecting point is closest to input point
-    cps = ['cp_left', 'cp_down', 'cp_right', 'cp_up']
-    distances = []
-    cp_vectors = []
-    for cp in cps:
-        distances.append((Vector(obj[cp]) - point).length)
-        cp_vectors.append(Vector(obj[cp]))
-    headings = [obj['hdg_left'], obj['hdg_down'], obj['hdg_right'], obj['hdg_up']]
-    arg_min_dist = distances.index(min(distances))
-    return cps[arg_min_dist], cp_vectors[arg_min_dist], headings[arg_min_dist]
-
 def point_to_object_connector(obj, point):
     '''
         Get a snapping point and heading from a dynamic object.
@@ -359,6 +593,161 @@ def project_point_vector(point_start, heading_start, point_selected):
     else:
         return point_selected
 
+def get_object_connectors(obj):
+    '''
+        Return list of (point, parameters) of the connecting points of an
+        OpenDRIVE object. The parameters are those returned by
+        mouse_to_object_params plus the snapping filter they belong to.
+    '''
+    connectors = []
+    if obj.get('dsc_category') != 'OpenDRIVE' or not 'id_xodr' in obj:
+        return connectors
+    if obj.get('dsc_type') == 'road':
+        record = get_road_record(obj)
+        geometry = record.geometry
+        width_left, width_right = record.get_width_road_sides()
+        for cp_type in ['cp_start_l', 'cp_start_r', 'cp_end_l', 'cp_end_r']:
+            if cp_type.startswith('cp_start'):
+                contact = 'start'
+                heading = geometry['heading_start'] - pi
+            else:
+                contact = 'end'
+                heading = geometry['heading_end']
+            id_junction = None
+            if record.road_split_type == contact and 'id_direct_junction_' + contact in obj:
+                id_junction = obj['id_direct_junction_' + contact]
+            connectors.append((obj[cp_type], {
+                'filter': 'OpenDRIVE',
+                'id_obj': obj['id_xodr'],
+                'id_junction': id_junction,
+                'type': cp_type,
+                'heading': heading,
+                'curvature': geometry['curvature_' + contact],
+                'slope': geometry['slope_' + contact],
+                'width_left': width_left,
+                'width_right': width_right,}))
+    elif obj.name.startswith('junction_4way'):
+        # TODO later remove this path and unify junctions
+        for cp_type, key_heading in [('cp_left', 'hdg_left'), ('cp_down', 'hdg_down'),
+                                     ('cp_right', 'hdg_right'), ('cp_up', 'hdg_up')]:
+            connectors.append((obj[cp_type], {
+                'filter': 'OpenDRIVE',
+                'id_obj': obj['id_xodr'],
+                'id_junction': obj['id_xodr'],
+                'type': cp_type,
+                'heading': obj[key_heading],
+                'curvature': 0,
+                'slope': 0,
+                'width_left': 0,
+                'width_right': 0,}))
+    elif obj.name.startswith('junction_area') and 'joints' in obj:
+        for joint in obj['joints']:
+            connectors.append((joint['contact_point_vec'], {
+                'filter': 'OpenDRIVE_junction',
+                'id_obj': joint['id_incoming'],
+                'id_junction': obj['id_xodr'],
+                'type': joint['contact_point'],
+                'heading': joint['heading'],
+                'curvature': 0,
+                'slope': 0,
+                'width_left': 0,
+                'width_right': 0,}))
+    return connectors
+
+class DSC_connector_index():
+    '''
+        Index of the connecting points of all OpenDRIVE objects for snapping.
+        Objects reported by the depsgraph handler are re-read on the next
+        query, the index is rebuilt after loading a file and after undo/redo.
+    '''
+
+    def __init__(self):
+        self.index = Connector_index()
+        self.names_dirty = set()
+        self.check_removed = False
+        self.valid = False
+
+    def invalidate(self):
+        self.valid = False
+
+    def mark_dirty(self, name):
+        self.names_dirty.add(name)
+
+    def rebuild(self):
+        self.index.clear()
+        collection = bpy.data.collections.get('OpenDRIVE')
+        if collection is not None:
+            for obj in collection.objects:
+                self.update_object(obj)
+        self.names_dirty = set()
+        self.check_removed = False
+        self.valid = True
+
+    def update_object(self, obj):
+        connectors = get_object_connectors(obj)
+        if connectors:
+            self.index.set_connectors(obj.name, connectors)
+        else:
+            self.index.remove(obj.name)
+
+    def refresh(self):
+        '''
+            Re-read dirty objects and drop deleted ones.
+        '''
+        if not self.valid:
+            self.rebuild()
+            return
+        for name in self.names_dirty:
+            obj = bpy.data.objects.get(name)
+            if obj is None:
+                self.index.remove(name)
+            else:
+                self.update_object(obj)
+        self.names_dirty = set()
+        if self.check_removed:
+            for name in list(self.index.connectors.keys()):
+                if bpy.data.objects.get(name) is None:
+                    self.index.remove(name)
+            self.check_removed = False
+
+    def get_nearest(self, context, event, filter, radius_pixels=RADIUS_SNAP_PIXELS):
+        '''
+            Return (point, parameters) of the connecting point closest to the
+            mouse pointer in screen space within the radius, None if there is
+            none.
+        '''
+        self.refresh()
+        region = context.region
+        rv3d = context.region_data
+        co2d = Vector((event.mouse_region_x, event.mouse_region_y))
+        # Search along the plan view of the mouse ray between the lowest and
+        # highest connector with the world radius of the screen radius
+        z_min, z_max = self.index.get_z_range()
+        point_0 = mouse_to_xy_parallel_plane(context, event, z_min)
+        point_1 = mouse_to_xy_parallel_plane(context, event, z_max)
+        radius = 0
+        for point in [point_0, point_1]:
+            point_offset = region_2d_to_location_3d(region, rv3d,
+                co2d + Vector((radius_pixels, 0)), point)
+            radius = max(radius, (point_offset - point).length)
+        def get_distance(point, params):
+            if params['filter'] != filter:
+                return None
+            point_2d = location_3d_to_region_2d(region, rv3d, point)
+            if point_2d is None:
+                return None
+            distance = (point_2d - co2d).length
+            if distance > radius_pixels:
+                return None
+            return distance
+        nearest = self.index.get_nearest(point_0, point_1, radius, get_distance)
+        if nearest is None:
+            return None
+        return Vector(nearest[1]), nearest[2]
+
+# Index shared by all operators
+connector_index = DSC_connector_index()
+
 def mouse_to_object_params(context, event, filter):
     '''
         Check if an object is hit and return a connection (snapping) point. In
@@ -377,6 +766,29 @@ def mouse_to_object_params(context, event, filter):
     slope = 0
     width_left = 0
     width_right = 0
+    # OpenDRIVE connecting points are looked up in the connector index
+    if filter in ['OpenDRIVE', 'OpenDRIVE_junction']:
+        nearest = connector_index.get_nearest(context, event, filter)
+        if nearest is None:
+            return hit, {'id_obj': id_obj,
+                         'id_junction': id_junction,
+                         'point': snapped_point,
+                         'type': point_type,
+                         'heading': heading,
+                         'curvature': curvature,
+                         'slope': slope,
+                         'width_left': width_left,
+                         'width_right': width_right,}
+        snapped_point, params = nearest
+        return True, {'id_obj': params['id_obj'],
+                      'id_junction': params['id_junction'],
+                      'point': snapped_point,
+                      'type': params['type'],
+                      'heading': params['heading'],
+                      'curvature': params['curvature'],
+                      'slope': params['slope'],
+                      'width_left': params['width_left'],
+                      'width_right': params['width_right'],}
     # Do the raycasting
     if filter is None:
         dsc_hit, point_raycast, obj = raycast_mouse_to_object(context, event, filter=None)
@@ -384,37 +796,7 @@ def mouse_to_object_params(context, event, filter):
         dsc_hit, point_raycast, obj = raycast_mouse_to_object(context, event, filter='dsc_category')
     if dsc_hit:
         # DSC mesh hit
-        if filter == 'OpenDRIVE':
-            if obj['dsc_category'] == 'OpenDRIVE':
-                if obj['dsc_type'] == 'road':
-                    hit = True
-                    point_type, snapped_point, heading, curvature, \
-                    slope, width_left, width_right = point_to_road_connector(obj, point_raycast)
-                    id_obj = obj['id_xodr']
-                    if obj['road_split_type'] == 'end':
-                        if point_type == 'cp_end_l' or point_type == 'cp_end_r':
-                            if 'id_direct_junction_end' in obj:
-                                id_junction = obj['id_direct_junction_end']
-                    if obj['road_split_type'] == 'start':
-                        if point_type == 'cp_start_l' or point_type == 'cp_start_r':
-                            if 'id_direct_junction_start' in obj:
-                                id_junction = obj['id_direct_junction_start']
-        if filter == 'OpenDRIVE':
-            if obj.name.startswith('junction_4way'):
-                # TODO later remove this path and unify junctions
-                hit = True
-                point_type, snapped_point, heading = point_to_junction_connector(obj, point_raycast)
-                # For the legacy junction we do not explicitly model the
-                # connecting roads hence we set both IDs to the junction ID
-                id_obj = obj['id_xodr']
-                id_junction = obj['id_xodr']
-        if filter == 'OpenDRIVE_junction':
-            if obj.name.startswith('junction_area'):
-                hit = True
-                id_incoming, point_type, snapped_point, heading = point_to_junction_joint(obj, point_raycast)
-                id_obj = id_incoming
-                id_junction = obj['id_xodr']
-        elif filter == 'OpenSCENARIO':
+        if filter == 'OpenSCENARIO':
             if obj['dsc_category'] == 'OpenSCENARIO':
                 hit = True
                 point_type, snapped_point, heading = point_to_object_connector(obj, point_raycast)
@@ -434,9 +816,10 @@ def mouse_to_object_params(context, event, filter):
                  'width_left': width_left,
                  'width_right': width_right,}
 
-def assign_road_materials(obj):
+def get_road_material(name):
     '''
-        Assign materials for asphalt and markings to object.
+        Return road material by name, create it with its default color if
+        it does not exist yet.
     '''
     default_materials = {
         'road_asphalt': [.3, .3, .3, 1],
@@ -444,15 +827,169 @@ def assign_road_materials(obj):
         'road_mark_yellow': [.85, .63, .0, 1],
         'grass': [.05, .6, .01, 1],
     }
-    for key in default_materials.keys():
-        material = bpy.data.materials.get(key)
-        if material is None:
-            material = bpy.data.materials.new(name=key)
-            material.diffuse_color = (default_materials[key][0],
-                                      default_materials[key][1],
-                                      default_materials[key][2],
-                                      default_materials[key][3])
-        obj.data.materials.append(material)
+    material = bpy.data.materials.get(name)
+    if material is None:
+        material = bpy.data.materials.new(name=name)
+        material.diffuse_color = (default_materials[name][0],
+                                  default_materials[name][1],
+                                  default_materials[name][2],
+                                  default_materials[name][3])
+    return material
+
+def assign_road_materials(obj):
+    '''
+        Assign materials for asphalt and markings to object.
+    '''
+    for key in ['road_asphalt', 'road_mark_white', 'road_mark_yellow', 'grass']:
+        obj.data.materials.append(get_road_material(key))
+
+# Road mark colors which can be instanced as dashes
+ROAD_MARK_DASH_COLORS = ['white', 'yellow']
+
+def link_object_road_marks(context, obj):
+    '''
+        Link object to the road marks scene collection, which is kept apart
+        from the OpenDRIVE collection.
+    '''
+    if not 'road_marks' in bpy.data.collections:
+        collection = bpy.data.collections.new('road_marks')
+        context.scene.collection.children.link(collection)
+    bpy.data.collections['road_marks'].objects.link(obj)
+
+def get_road_mark_dashes_node_group():
+    '''
+        Return the geometry node group instancing one unit square per point
+        of a dash carrier mesh. The points carry the attributes
+        dash_rotation (Euler angles), dash_scale and one boolean attribute
+        dash_<color> per color selecting the material of the dash.
+    '''
+    node_group = bpy.data.node_groups.get('road_mark_dashes')
+    if node_group is not None:
+        return node_group
+    node_group = bpy.data.node_groups.new('road_mark_dashes', 'GeometryNodeTree')
+    if bpy.app.version < (4, 0, 0):
+        node_group.inputs.new('NodeSocketGeometry', 'Geometry')
+        node_group.outputs.new('NodeSocketGeometry', 'Geometry')
+    else:
+        node_group.interface.new_socket('Geometry', in_out='INPUT', socket_type='NodeSocketGeometry')
+        node_group.interface.new_socket('Geometry', in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    nodes = node_group.nodes
+    links = node_group.links
+    node_input = nodes.new('NodeGroupInput')
+    node_output = nodes.new('NodeGroupOutput')
+    node_join = nodes.new('GeometryNodeJoinGeometry')
+    links.new(node_join.outputs['Geometry'], node_output.inputs['Geometry'])
+    def get_named_attribute(name, data_type):
+        node = nodes.new('GeometryNodeInputNamedAttribute')
+        node.data_type = data_type
+        node.inputs['Name'].default_value = name
+        return node.outputs['Attribute']
+    rotation = get_named_attribute('dash_rotation', 'FLOAT_VECTOR')
+    scale = get_named_attribute('dash_scale', 'FLOAT_VECTOR')
+    # Unit square in the xy-plane scaled to the dash size by each instance
+    node_square = nodes.new('GeometryNodeMeshGrid')
+    node_square.inputs['Size X'].default_value = 1.0
+    node_square.inputs['Size Y'].default_value = 1.0
+    node_square.inputs['Vertices X'].default_value = 2
+    node_square.inputs['Vertices Y'].default_value = 2
+    for color in ROAD_MARK_DASH_COLORS:
+        node_material = nodes.new('GeometryNodeSetMaterial')
+        node_material.inputs['Material'].default_value = get_road_material('road_mark_' + color)
+        links.new(node_square.outputs['Mesh'], node_material.inputs['Geometry'])
+        node_instance = nodes.new('GeometryNodeInstanceOnPoints')
+        links.new(node_input.outputs['Geometry'], node_instance.inputs['Points'])
+        links.new(get_named_attribute('dash_' + color, 'BOOLEAN'), node_instance.inputs['Selection'])
+        links.new(node_material.outputs['Geometry'], node_instance.inputs['Instance'])
+        links.new(rotation, node_instance.inputs['Rotation'])
+        links.new(scale, node_instance.inputs['Scale'])
+        links.new(node_instance.outputs['Instances'], node_join.inputs['Geometry'])
+    return node_group
+
+def point_mesh_from_arrays(name, locations, attributes):
+    '''
+        Create a mesh with one loose vertex per location (N, 3) and point
+        attributes given as dictionary name: (data type, values) for
+        instancing with geometry nodes.
+    '''
+    mesh = bpy.data.meshes.new(name)
+    if len(locations) == 0:
+        return mesh
+    mesh.vertices.add(len(locations))
+    mesh.vertices.foreach_set('co', np.asarray(locations, dtype=np.float32).ravel())
+    for attribute_name, (data_type, values) in attributes.items():
+        attribute = mesh.attributes.new(attribute_name, data_type, 'POINT')
+        if data_type == 'FLOAT_VECTOR':
+            attribute.data.foreach_set('vector', np.asarray(values, dtype=np.float32).ravel())
+        else:
+            attribute.data.foreach_set('value', np.asarray(values).ravel())
+    mesh.update()
+    return mesh
+
+def dash_carrier_mesh_from_placements(name, placements):
+    '''
+        Create a mesh with one loose vertex per dash from the placements of
+        road_core.get_dash_placements for instancing with the road mark
+        dashes node group.
+    '''
+    locations = [np.empty((0, 3))]
+    rotations = [np.empty((0, 3))]
+    scales = [np.empty((0, 3))]
+    colors = []
+    for color, (locations_color, headings, pitches, lengths, widths) in placements.items():
+        locations.append(locations_color)
+        rotations.append(np.column_stack((np.zeros_like(headings), -pitches, headings)))
+        scales.append(np.column_stack((lengths, widths, np.ones_like(lengths))))
+        colors.extend([color] * len(lengths))
+    colors = np.array(colors)
+    attributes = {'dash_rotation': ('FLOAT_VECTOR', np.concatenate(rotations)),
+                  'dash_scale': ('FLOAT_VECTOR', np.concatenate(scales))}
+    for color in ROAD_MARK_DASH_COLORS:
+        attributes['dash_' + color] = ('BOOLEAN', colors == color)
+    return point_mesh_from_arrays(name, np.concatenate(locations), attributes)
+
+def get_collection_instances_node_group():
+    '''
+        Return the geometry node group instancing the collection given as
+        modifier input Collection on every point of a carrier mesh, rotated
+        by the point attribute instance_rotation (Euler angles).
+    '''
+    node_group = bpy.data.node_groups.get('collection_instances')
+    if node_group is not None:
+        return node_group
+    node_group = bpy.data.node_groups.new('collection_instances', 'GeometryNodeTree')
+    if bpy.app.version < (4, 0, 0):
+        node_group.inputs.new('NodeSocketGeometry', 'Geometry')
+        node_group.inputs.new('NodeSocketCollection', 'Collection')
+        node_group.outputs.new('NodeSocketGeometry', 'Geometry')
+    else:
+        node_group.interface.new_socket('Geometry', in_out='INPUT', socket_type='NodeSocketGeometry')
+        node_group.interface.new_socket('Collection', in_out='INPUT', socket_type='NodeSocketCollection')
+        node_group.interface.new_socket('Geometry', in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    nodes = node_group.nodes
+    links = node_group.links
+    node_input = nodes.new('NodeGroupInput')
+    node_output = nodes.new('NodeGroupOutput')
+    node_collection = nodes.new('GeometryNodeCollectionInfo')
+    node_rotation = nodes.new('GeometryNodeInputNamedAttribute')
+    node_rotation.data_type = 'FLOAT_VECTOR'
+    node_rotation.inputs['Name'].default_value = 'instance_rotation'
+    node_instance = nodes.new('GeometryNodeInstanceOnPoints')
+    links.new(node_input.outputs['Collection'], node_collection.inputs['Collection'])
+    links.new(node_input.outputs['Geometry'], node_instance.inputs['Points'])
+    links.new(node_collection.outputs[0], node_instance.inputs['Instance'])
+    links.new(node_rotation.outputs['Attribute'], node_instance.inputs['Rotation'])
+    links.new(node_instance.outputs['Instances'], node_output.inputs['Geometry'])
+    return node_group
+
+def set_modifier_input(modifier, name, value):
+    '''
+        Set the value of a named input socket of a geometry nodes modifier.
+    '''
+    if bpy.app.version < (4, 0, 0):
+        identifier = modifier.node_group.inputs[name].identifier
+    else:
+        identifier = modifier.node_group.interface.items_tree[name].identifier
+    modifier[identifier] = value
 
 def assign_object_materials(obj, color):
     # Get road material
@@ -469,43 +1006,129 @@ def get_paint_material_name(color):
     '''
     return 'vehicle_paint' + '_{:.2f}_{:.2f}_{:.2f}'.format(*color[0:4])
 
-def get_material_index(obj, material_name):
+def mesh_from_arrays(name, vertices, loops, loop_starts, loop_totals, material_indices=None):
     '''
-        Return index of material slot based on material name.
+        Create a new mesh from flat vertex, loop and polygon arrays in one
+        shot with foreach_set, edges are calculated from the polygons.
     '''
-    for idx, material in enumerate(obj.data.materials):
-        if material.name == material_name:
-            return idx
-    return None
+    mesh = bpy.data.meshes.new(name)
+    set_mesh_arrays(mesh, vertices, loops, loop_starts, loop_totals, material_indices)
+    return mesh
 
-def replace_mesh(obj, mesh):
+def set_mesh_arrays(mesh, vertices, loops, loop_starts, loop_totals, material_indices=None):
     '''
-        Replace existing mesh
+        Fill an empty mesh from flat vertex, loop and polygon arrays.
     '''
-    # Delete old mesh data
-    bm = bmesh.new()
-    bm.from_mesh(obj.data)
-    verts = [v for v in bm.verts]
-    bmesh.ops.delete(bm, geom=verts, context='VERTS')
-    bm.to_mesh(obj.data)
-    bm.free()
-    # Set new mesh data
-    obj.data = mesh
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set('co', np.asarray(vertices, dtype=np.float32).ravel())
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set('vertex_index', np.asarray(loops, dtype=np.int32))
+    mesh.polygons.add(len(loop_starts))
+    mesh.polygons.foreach_set('loop_start', np.asarray(loop_starts, dtype=np.int32))
+    if bpy.app.version < (4, 0, 0):
+        # Newer versions derive the polygon sizes from the loop starts
+        mesh.polygons.foreach_set('loop_total', np.asarray(loop_totals, dtype=np.int32))
+    if material_indices is not None:
+        mesh.polygons.foreach_set('material_index', np.asarray(material_indices, dtype=np.int32))
+    mesh.update(calc_edges=True)
 
-def triangulate_quad_mesh(obj):
+def update_mesh_from_arrays(mesh, dirty, vertices, loops, loop_starts, loop_totals, material_indices):
     '''
-        Triangulate then quadify the ngon mesh of an object.
+        Patch a mesh in place, only the part reported as dirty by
+        road_core.road_mesh.Road_mesh_builder is rewritten.
     '''
-    # Triangulate
-    bm = bmesh.new()
-    bm.from_mesh(obj.data)
-    bmesh.ops.triangulate(bm, faces=bm.faces[:])
-    bm.to_mesh(obj.data)
-    bm.free()
-    # Tris to quads is missing in bmesh so use bpy.ops.mesh instead
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.tris_convert_to_quads(materials=True)
-    bpy.ops.object.mode_set(mode='OBJECT')
+    if dirty is None:
+        return
+    if dirty == 'geometry' or dirty == 'topology':
+        mesh.clear_geometry()
+        set_mesh_arrays(mesh, vertices, loops, loop_starts, loop_totals, material_indices)
+        return
+    if dirty == 'vertices':
+        mesh.vertices.foreach_set('co', np.asarray(vertices, dtype=np.float32).ravel())
+    mesh.polygons.foreach_set('material_index', np.asarray(material_indices, dtype=np.int32))
+    mesh.update()
+
+class DSC_stencil_mesh_pool():
+    '''
+        Persistent meshes for the stencils shown while drawing. Each update
+        rewrites the buffers of the same mesh in place, the element arrays
+        are only reallocated when their size changes. This avoids leaving an
+        orphaned temporary mesh behind on every mouse move.
+    '''
+
+    def __init__(self):
+        self.writes = 0
+        self.resizes = 0
+        self.meshes_purged = 0
+
+    def get_mesh(self, name):
+        '''
+            Return persistent mesh of the stencil, create it if necessary.
+        '''
+        mesh = bpy.data.meshes.get(name)
+        if mesh is None:
+            mesh = bpy.data.meshes.new(name)
+            mesh.use_fake_user = True
+        return mesh
+
+    def write(self, name, vertices, edges, faces=None):
+        '''
+            Rewrite the stencil mesh with vertices, edges and faces (list of
+            vertex index lists) and return it.
+        '''
+        if faces is None:
+            faces = []
+        mesh = self.get_mesh(name)
+        vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+        edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+        loops = np.array([idx for face in faces for idx in face], dtype=np.int32)
+        loop_totals = np.array([len(face) for face in faces], dtype=np.int32)
+        loop_starts = np.cumsum(loop_totals) - loop_totals
+        self.writes += 1
+        if len(mesh.vertices) != len(vertices) or len(mesh.edges) != len(edges) \
+                or len(mesh.loops) != len(loops) or len(mesh.polygons) != len(faces):
+            self.resizes += 1
+            mesh.clear_geometry()
+            mesh.vertices.add(len(vertices))
+            mesh.edges.add(len(edges))
+            if len(faces) > 0:
+                mesh.loops.add(len(loops))
+                mesh.polygons.add(len(faces))
+        mesh.vertices.foreach_set('co', vertices.ravel())
+        mesh.edges.foreach_set('vertices', edges.ravel())
+        if len(faces) > 0:
+            mesh.loops.foreach_set('vertex_index', loops)
+            mesh.polygons.foreach_set('loop_start', loop_starts)
+            if bpy.app.version < (4, 0, 0):
+                mesh.polygons.foreach_set('loop_total', loop_totals)
+        mesh.update(calc_edges=len(faces) > 0)
+        return mesh
+
+    def purge_orphan_meshes(self, prefixes=('temp',)):
+        '''
+            Remove meshes without users whose names start with one of the
+            prefixes, return the number of removed meshes.
+        '''
+        orphans = [mesh for mesh in bpy.data.meshes
+            if mesh.users == 0 and mesh.name.startswith(prefixes)]
+        for mesh in orphans:
+            bpy.data.meshes.remove(mesh)
+        self.meshes_purged += len(orphans)
+        return len(orphans)
+
+    def get_statistics(self, prefixes=('temp',)):
+        '''
+            Return the write counters and the number of temporary meshes
+            currently alive.
+        '''
+        meshes_temporary = [mesh for mesh in bpy.data.meshes if mesh.name.startswith(prefixes)]
+        return {'writes': self.writes, 'resizes': self.resizes,
+                'purged': self.meshes_purged,
+                'temporary_live': len(meshes_temporary),
+                'temporary_orphans': sum(mesh.users == 0 for mesh in meshes_temporary)}
+
+# Pool shared by all operators
+stencil_mesh_pool = DSC_stencil_mesh_pool()
 
 def kmh_to_ms(speed):
     return speed / 3.6
@@ -125,7 +125,7 @@ class junction:
             obj['joints'] = joints
 
             # Set OpenDRIVE custom properties
-            obj['id_xodr'] = id_obj
+            helper.set_id_xodr(obj, id_obj)
 
             obj['incoming_roads'] = {}
 
@@ -140,18 +140,16 @@ class junction:
         if stencil is not None:
             if self.context.scene.objects.get('dsc_stencil') is None:
                 self.context.scene.collection.objects.link(stencil)
+            self.stencil = stencil
         else:
             # Create object from mesh
-            mesh = bpy.data.meshes.new('dsc_stencil')
-            vertices, edges, faces = [(0.0, 0.0, 0.0)], [], []
-            mesh.from_pydata(vertices, edges, faces)
+            mesh = helper.stencil_mesh_pool.write('dsc_stencil', [(0.0, 0.0, 0.0)], [])
             # Rotate in start heading direction
             self.stencil = bpy.data.objects.new('dsc_stencil', mesh)
             self.stencil.location = self.joints[0].contact_point_vec
             # Link
             self.context.scene.collection.objects.link(self.stencil)
             self.stencil.use_fake_user = True
-            self.stencil.data.use_fake_user = True
         # Make stencil active object
         helper.select_activate_object(self.context, self.stencil)
 
@@ -163,6 +161,7 @@ class junction:
         if stencil is not None:
             bpy.data.objects.remove(stencil, do_unlink=True)
             self.stencil = None
+        helper.stencil_mesh_pool.purge_orphan_meshes()
 
     def update_stencil(self):
         '''
@@ -175,7 +174,8 @@ class junction:
         valid, mesh, matrix_world = self.get_mesh(wireframe=True)
         # If we get a valid solution we can update the mesh, otherwise just return
         if valid:
-            helper.replace_mesh(self.stencil, mesh)
+            if self.stencil.data != mesh:
+                self.stencil.data = mesh
             # Set stencil global transform
             self.stencil.matrix_world = matrix_world
         else:
@@ -214,9 +214,13 @@ class junction:
                     faces = [[idx for idx in range(len(vertices))] + [0]]
                 else:
                     faces = []
-            # Create blender mesh
-            mesh = bpy.data.meshes.new('temp')
-            mesh.from_pydata(vertices, edges, faces)
+            # Create blender mesh, the stencil mesh is rewritten in place
+            if wireframe:
+                mesh = helper.stencil_mesh_pool.write('dsc_stencil',
+                    [tuple(vertex) for vertex in vertices], edges)
+            else:
+                mesh = bpy.data.meshes.new('temp')
+                mesh.from_pydata(vertices, edges, faces)
             valid = True
             return valid, mesh, matrix_world
 
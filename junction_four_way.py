@@ -67,7 +67,7 @@ class DSC_OT_junction_four_way(bpy.types.Operator):
             obj['cp_up'] = obj.matrix_world @ obj.data.vertices[7].co
 
             # Set OpenDRIVE custom properties
-            obj['id_xodr'] = id_obj
+            helper.set_id_xodr(obj, id_obj)
             obj['junction_type'] = 'default'
             obj['planView_geometry_x'] = self.params['point_start'].x
             obj['planView_geometry_y'] = self.params['point_start'].y
@@ -141,9 +141,12 @@ class DSC_OT_junction_four_way(bpy.types.Operator):
         mat_translation = Matrix.Translation(self.params_input['point_start'])
         mat_rotation = Matrix.Rotation(heading, 4, 'Z')
         matrix_world = mat_translation @ mat_rotation
-        # Create blender mesh
-        mesh = bpy.data.meshes.new('temp')
-        mesh.from_pydata(vertices, edges, faces)
+        # Create blender mesh, the stencil mesh is rewritten in place
+        if wireframe:
+            mesh = helper.stencil_mesh_pool.write('dsc_stencil', vertices, edges)
+        else:
+            mesh = bpy.data.meshes.new('temp')
+            mesh.from_pydata(vertices, edges, faces)
         valid = True
         # TODO implement material dictionary for the faces
         materials = {}
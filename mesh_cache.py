@@ -0,0 +1,136 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import bpy
+import hashlib
+
+import road_core
+
+# Resolution of lengths and angles in the cache key, roads closer than this
+# share the same mesh (the object transforms are stored as single precision)
+RESOLUTION_LENGTH = 1e-4
+RESOLUTION_ANGLE = 1e-6
+# Significant digits of the polynomial coefficients of the elevation profile
+DIGITS_COEFFICIENT = 6
+
+
+def quantize(value, resolution):
+    '''
+        Return value rounded to an integer multiple of resolution.
+    '''
+    return int(round(float(value) / resolution))
+
+
+def quantize_coefficient(value):
+    '''
+        Return value rounded to DIGITS_COEFFICIENT significant digits.
+    '''
+    return float('{:.{}g}'.format(float(value), DIGITS_COEFFICIENT))
+
+
+def get_mesh_key(geometry, lanes, settings):
+    '''
+        Return a hash of everything that determines the road mesh in the
+        local frame of a core geometry: curve type, length, curvature, end
+        point and heading relative to the start, elevation profile, lane
+        layout and the mesh settings (tuple of plain values).
+    '''
+    params = geometry.params
+    key_geometry = (
+        params['curve'],
+        quantize(params['length'], RESOLUTION_LENGTH),
+        quantize(params['curvature_start'], RESOLUTION_ANGLE),
+        quantize(params['curvature_end'], RESOLUTION_ANGLE),
+        tuple(quantize(value, RESOLUTION_LENGTH) for value in geometry.point_end_local),
+        quantize(geometry.heading_end_local, RESOLUTION_ANGLE),
+        tuple((quantize(record['s'], RESOLUTION_LENGTH),) + tuple(
+            quantize_coefficient(record[name]) for name in ['a', 'b', 'c', 'd'])
+            for record in params['elevation']),
+    )
+    # The split flag does not change the mesh
+    names = [name for name in road_core.Lane.__slots__ if name != 'split_right']
+    key_lanes = tuple(tuple(getattr(lane, name) for name in names) for lane in lanes)
+    return hashlib.sha1(repr((key_geometry, key_lanes, settings)).encode()).hexdigest()
+
+
+def get_mesh_size(mesh):
+    '''
+        Return approximate memory size of the mesh data in bytes.
+    '''
+    return 12 * len(mesh.vertices) + 8 * len(mesh.edges) + 8 * len(mesh.loops) \
+        + 16 * len(mesh.polygons)
+
+
+class DSC_mesh_cache():
+    '''
+        Content addressed cache of road meshes. Roads with identical local
+        geometry and lanes share their mesh datablocks (linked duplicates)
+        and only differ by their object transform. Each entry is a list of
+        meshes, one for each level of detail.
+    '''
+
+    def __init__(self):
+        self.meshes = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def clear(self):
+        self.meshes = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def get(self, key):
+        '''
+            Return list of meshes for key or None if not cached or if any of
+            the meshes has been removed or lost its dsc_mesh_key tag in the
+            meantime. The tag is removed by make_mesh_single_user before a
+            road edits its mesh, manual edits of a cached mesh are not
+            detected.
+        '''
+        names = self.meshes.get(key)
+        if names is not None:
+            meshes = [bpy.data.meshes.get(name) for name in names]
+            if all(mesh is not None and mesh.get('dsc_mesh_key') == key for mesh in meshes):
+                self.hits += 1
+                self.bytes_saved += sum(get_mesh_size(mesh) for mesh in meshes)
+                return meshes
+            del self.meshes[key]
+        self.misses += 1
+        return None
+
+    def add(self, key, meshes):
+        '''
+            Add list of meshes for key.
+        '''
+        for mesh in meshes:
+            mesh['dsc_mesh_key'] = key
+        self.meshes[key] = [mesh.name for mesh in meshes]
+
+    def get_statistics(self):
+        return {'meshes': len(self.meshes), 'hits': self.hits, 'misses': self.misses,
+                'bytes_saved': self.bytes_saved}
+
+
+# Cache shared by all road operators
+road_mesh_cache = DSC_mesh_cache()
+
+
+def make_mesh_single_user(obj):
+    '''
+        Give the object its own copy of a cached mesh before editing it.
+    '''
+    if 'dsc_mesh_key' in obj.data:
+        obj.data = obj.data.copy()
+        del obj.data['dsc_mesh_key']
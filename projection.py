@@ -0,0 +1,110 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import bpy
+import numpy as np
+import helper
+import road_core
+from road_core.spatial import Road_projection_index
+
+
+class DSC_road_projection():
+    '''
+        Projection of world points to (road ID, s, t) for all roads in the
+        OpenDRIVE collection. Only roads reported as changed by the depsgraph
+        handler are re-read, and they are only resampled when their geometry
+        or width changed.
+    '''
+
+    def __init__(self):
+        self.index = Road_projection_index()
+        # OpenDRIVE ID of each road object by object name
+        self.ids_xodr = {}
+
+    def update_object(self, obj):
+        '''
+            Add or update the road of an object, remove it if the object is
+            no road (anymore).
+        '''
+        if not ('id_xodr' in obj and helper.has_road_record(obj)):
+            self.remove_object(obj.name)
+            return
+        id_xodr = obj['id_xodr']
+        if self.ids_xodr.get(obj.name, id_xodr) != id_xodr:
+            self.remove_object(obj.name)
+        # The object might have been renamed
+        for name in [name for name, id_other in self.ids_xodr.items() if id_other == id_xodr]:
+            del self.ids_xodr[name]
+        self.ids_xodr[obj.name] = id_xodr
+        record = helper.get_road_record(obj)
+        params = record.geometry
+        width_left, width_right = record.get_width_road_sides()
+        version = (repr(sorted(params.items())), width_left, width_right)
+        road = self.index.roads.get(id_xodr)
+        if road is not None and road['version'] == version:
+            return
+        geometry = road_core.geometry_from_params(params)
+        self.index.add_road(id_xodr, geometry, -width_right, width_left, version)
+
+    def remove_object(self, name):
+        id_xodr = self.ids_xodr.pop(name, None)
+        if id_xodr is not None:
+            self.index.remove_road(id_xodr)
+
+    def refresh(self):
+        '''
+            Synchronize the index with the road objects of the OpenDRIVE
+            collection, only changed objects are re-read.
+        '''
+        valid, names_dirty, check_removed = helper.get_object_tracker('road_projection').pop_changes()
+        if not valid:
+            self.index.clear()
+            self.ids_xodr = {}
+            collection = bpy.data.collections.get('OpenDRIVE')
+            if collection is not None:
+                for obj in collection.objects:
+                    self.update_object(obj)
+            return
+        for name in names_dirty:
+            obj = bpy.data.objects.get(name)
+            if obj is None:
+                self.remove_object(name)
+            else:
+                self.update_object(obj)
+        if check_removed:
+            for name in list(self.ids_xodr.keys()):
+                if bpy.data.objects.get(name) is None:
+                    self.remove_object(name)
+
+    def project(self, points):
+        '''
+            Project a list or array of world points (only x and y are used)
+            onto the roads. Return arrays with the OpenDRIVE ID of the road
+            (-1 if there is no road), s, t and the plan view distance to the
+            road surface.
+        '''
+        self.refresh()
+        idx_road, s, t, distance = self.index.project(points)
+        ids_xodr = np.array(self.index.keys + [-1])[idx_road]
+        return ids_xodr, s, t, distance
+
+# Shared by all operators, refreshed lazily on each query
+road_projection = DSC_road_projection()
+
+
+def project_points_to_roads(points):
+    '''
+        Return OpenDRIVE road IDs, s and t coordinates and the distance to the
+        road surface for a batch of world points.
+    '''
+    return road_projection.project(points)
@@ -319,6 +319,13 @@ class PR_road_properties(bpy.types.PropertyGroup):
     width_line_bold: bpy.props.FloatProperty(default=0.25, min=0.01, max=10.0, step=1)
     length_broken_line: bpy.props.FloatProperty(default=3.0, min=0.01, max=10.0, step=1)
     ratio_broken_line_gap: bpy.props.IntProperty(default=1, min=1, max=3)
+    # Maximum deviation of the road mesh from the road surface and maximum edge length in s direction
+    sampling_tolerance_chord: bpy.props.FloatProperty(default=0.05, min=0.001, max=1.0, step=1)
+    sampling_length_edge_max: bpy.props.FloatProperty(default=5.0, min=0.1, max=100.0, step=1)
+    # Number of additional coarse meshes created as <name>_LOD1, <name>_LOD2, ... for FBX export
+    num_lods: bpy.props.IntProperty(default=0, min=0, max=3)
+    # Place dashes of broken lines as points of one carrier mesh instanced by geometry nodes instead of road mesh faces
+    road_mark_dash_instances: bpy.props.BoolProperty(default=False)
     width_driving: bpy.props.FloatProperty(default=3.75, min=0.01, max=10.0, step=1)
     width_border: bpy.props.FloatProperty(default=0.5, min=0.01, max=1.0, step=1)
     # width_curb: bpy.props.FloatProperty(default=0.16, min=0.10, max=0.30, step=1)
@@ -12,9 +12,7 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import bpy
-from pyclothoids import Clothoid
-from mathutils import Vector, Matrix
-from math import pi, ceil
+from mathutils import Vector
 import os
 import sys
 import imp
@@ -32,10 +30,66 @@ import properties
 imp.reload(properties)
 from properties import *
 
+# Reload the core package modules, dependencies first
+import road_core
+import road_core.clothoid
+import road_core.elevation
+import road_core.sampling
+import road_core.geometry
+import road_core.lanes
+import road_core.road_mesh
+import road_core.spatial
+import road_core.markings
+import road_core.network
+import road_core.record
+imp.reload(road_core.clothoid)
+imp.reload(road_core.elevation)
+imp.reload(road_core.sampling)
+imp.reload(road_core.geometry)
+imp.reload(road_core.lanes)
+imp.reload(road_core.road_mesh)
+imp.reload(road_core.spatial)
+imp.reload(road_core.markings)
+imp.reload(road_core.network)
+imp.reload(road_core.record)
+imp.reload(road_core)
+
 import geometry
 imp.reload(geometry)
 from geometry import *
 
+import mesh_cache
+imp.reload(mesh_cache)
+
+# Mesh builders of the roads by object name, kept across operator runs since
+# Blender creates a new operator instance for each execution
+road_mesh_builders = {}
+
+def get_road_mesh_builder(obj):
+    '''
+        Return the mesh builder of a road object, create it if there is none
+        or if it does not match the mesh anymore. All builders are dropped
+        after loading a file and after undo/redo since the meshes are
+        restored to an older state.
+    '''
+    valid, names_dirty, check_removed = helper.get_object_tracker('road_mesh_builders').pop_changes()
+    if not valid:
+        road_mesh_builders.clear()
+    elif check_removed:
+        for name in list(road_mesh_builders.keys()):
+            if bpy.data.objects.get(name) is None:
+                del road_mesh_builders[name]
+    mesh_builder = road_mesh_builders.get(obj.name)
+    if mesh_builder is not None:
+        vertices, _, loop_starts, _, _ = mesh_builder.get_mesh_arrays()
+        # The mesh might have been edited or replaced by other means
+        if len(vertices) != len(obj.data.vertices) or len(loop_starts) != len(obj.data.polygons):
+            mesh_builder = None
+    if mesh_builder is None:
+        mesh_builder = road_core.road_mesh.Road_mesh_builder()
+        road_mesh_builders[obj.name] = mesh_builder
+    return mesh_builder
+
 ## =========================== Road definition classes =================================
 class PR_OT_road(bpy.types.Operator):
     bl_idname = 'pr.road'
@@ -84,47 +138,37 @@ class PR_OT_road(bpy.types.Operator):
         '''
         if len(context.scene.road_properties.lanes) == 0:
             context.scene.road_properties.init()
-        valid, mesh_road, matrix_world, materials = self.update_params_get_mesh(context)
+        valid, mesh_road, matrix_world, material_indices = self.update_params_get_mesh(context)
         if not valid:
             return None
         else:
-            # Create road object
-            id_obj = helper.get_new_id_opendrive(context)
-            mesh_road.name = str(id_obj)
-            obj = bpy.data.objects.new(mesh_road.name, mesh_road)
+            # Create road object, a road split also needs an ID for its
+            # direct junction
+            if self.params['road_split_type'] != 'none':
+                id_obj, direct_junction_id = helper.reserve_ids_opendrive(context, 2)
+            else:
+                id_obj = helper.get_new_id_opendrive(context)
+            if self.mesh_new:
+                mesh_road.name = str(id_obj)
+            obj = bpy.data.objects.new(str(id_obj), mesh_road)
             obj.matrix_world = matrix_world
             helper.link_object_opendrive(context, obj)
 
-            # Assign materials
-            helper.assign_road_materials(obj)
-            for idx in range(len(obj.data.polygons)):
-                if idx in materials['road_mark_white']:
-                    obj.data.polygons[idx].material_index = \
-                        helper.get_material_index(obj, 'road_mark_white')
-                elif idx in materials['grass']:
-                    obj.data.polygons[idx].material_index = \
-                        helper.get_material_index(obj, 'grass')
-                elif idx in materials['road_mark_yellow']:
-                    obj.data.polygons[idx].material_index = \
-                        helper.get_material_index(obj, 'road_mark_yellow')
-                else:
-                    obj.data.polygons[idx].material_index = \
-                        helper.get_material_index(obj, 'road_asphalt')
-            # Remove double vertices from road lanes and lane lines to simplify mesh
-            helper.remove_duplicate_vertices(context, obj)
+            # Assign materials, the material index of each face is already
+            # set for the slot order of road_core.road_mesh.MATERIAL_SLOTS
+            if len(mesh_road.materials) == 0:
+                helper.assign_road_materials(obj)
+            self.create_lod_objects(context, obj)
+            if self.mesh_new:
+                mesh_cache.road_mesh_cache.add(self.mesh_key, [mesh_road] + self.meshes_lod)
+            self.update_dash_objects(context, obj, self.geometry.core)
             # Make it active for the user to see what he created last
             helper.select_activate_object(context, obj)
 
-            # Convert the ngons to tris and quads to get a defined surface for elevated roads
-            helper.triangulate_quad_mesh(obj)
-
             # Metadata
             obj['dsc_category'] = 'OpenDRIVE'
             obj['dsc_type'] = 'road'
 
-            # Number lanes which split to the left side at road end
-            obj['road_split_lane_idx'] = self.params['road_split_lane_idx']
-
             # Remember connecting points for road snapping
             if self.params['road_split_type'] == 'start':
                 obj['cp_start_l'], obj['cp_start_r'] = self.get_split_cps('start')
@@ -137,9 +181,7 @@ class PR_OT_road(bpy.types.Operator):
                 obj['cp_end_l'], obj['cp_end_r']= self.geometry.params['point_end'], self.geometry.params['point_end']
 
             # A road split needs to create an OpenDRIVE direct junction
-            obj['road_split_type'] = self.params['road_split_type']
             if self.params['road_split_type'] != 'none':
-                direct_junction_id = helper.get_new_id_opendrive(context)
                 direct_junction_name = 'direct_junction' + '_' + str(direct_junction_id)
                 obj_direct_junction = bpy.data.objects.new(direct_junction_name, None)
                 obj_direct_junction.empty_display_type = 'PLAIN_AXES'
@@ -155,7 +197,7 @@ class PR_OT_road(bpy.types.Operator):
                         obj_direct_junction.location = obj['cp_end_l']
                 # FIXME also add rotation based on road heading and slope
                 helper.link_object_opendrive(context, obj_direct_junction)
-                obj_direct_junction['id_xodr'] = direct_junction_id
+                helper.set_id_xodr(obj_direct_junction, direct_junction_id)
                 obj_direct_junction['dsc_category'] = 'OpenDRIVE'
                 obj_direct_junction['dsc_type'] = 'junction_direct'
                 if self.params['road_split_type'] == 'start':
@@ -164,27 +206,9 @@ class PR_OT_road(bpy.types.Operator):
                     obj['id_direct_junction_end'] = direct_junction_id
 
             # Set OpenDRIVE custom properties
-            obj['id_xodr'] = id_obj
-
-            obj['geometry'] = self.geometry.params
-
-            obj['lanes_left_num'] = self.params['lanes_left_num']
-            obj['lanes_right_num'] = self.params['lanes_right_num']
-            obj['lanes_left_types'] = self.params['lanes_left_types']
-            obj['lanes_right_types'] = self.params['lanes_right_types']
-            obj['lanes_left_widths'] = self.params['lanes_left_widths']
-            obj['lanes_left_widths_change'] = self.params['lanes_left_widths_change']
-            obj['lanes_right_widths'] = self.params['lanes_right_widths']
-            obj['lanes_right_widths_change'] = self.params['lanes_right_widths_change']
-            obj['lanes_left_road_mark_types'] = self.params['lanes_left_road_mark_types']
-            obj['lanes_left_road_mark_weights'] = self.params['lanes_left_road_mark_weights']
-            obj['lanes_left_road_mark_colors'] = self.params['lanes_left_road_mark_colors']
-            obj['lanes_right_road_mark_types'] = self.params['lanes_right_road_mark_types']
-            obj['lanes_right_road_mark_weights'] = self.params['lanes_right_road_mark_weights']
-            obj['lanes_right_road_mark_colors'] = self.params['lanes_right_road_mark_colors']
-            obj['lane_center_road_mark_type'] = self.params['lane_center_road_mark_type']
-            obj['lane_center_road_mark_weight'] = self.params['lane_center_road_mark_weight']
-            obj['lane_center_road_mark_color'] = self.params['lane_center_road_mark_color']
+            helper.set_id_xodr(obj, id_obj)
+
+            self.set_object_lane_params(obj, self.geometry.params)
 
             return obj
 
@@ -199,18 +223,119 @@ class PR_OT_road(bpy.types.Operator):
         length_broken_line = context.scene.road_properties.length_broken_line
         self.set_lane_params(context.scene.road_properties)
         lanes = context.scene.road_properties.lanes
-        # Get values in t and s direction where the faces of the road start and end
-        strips_s_boundaries = self.get_strips_s_boundaries(lanes, length_broken_line)
         # Calculate meshes for Blender
-        road_sample_points = self.get_road_sample_points(lanes, strips_s_boundaries)
-        vertices, edges, faces = self.get_road_vertices_edges_faces(road_sample_points)
-        materials = self.get_face_materials(lanes, strips_s_boundaries)
-
-        # Create blender mesh
-        mesh = bpy.data.meshes.new('temp_road')
-        mesh.from_pydata(vertices, edges, faces)
+        tolerance_chord = context.scene.road_properties.sampling_tolerance_chord
+        length_edge_max = context.scene.road_properties.sampling_length_edge_max
+        road_mark_dash_instances = context.scene.road_properties.road_mark_dash_instances
+        num_lods = context.scene.road_properties.num_lods
+        # Roads with identical local geometry and lanes share their meshes
+        self.mesh_key = mesh_cache.get_mesh_key(self.geometry.core, lanes, (length_broken_line,
+            tolerance_chord, length_edge_max, road_mark_dash_instances, num_lods))
+        meshes = mesh_cache.road_mesh_cache.get(self.mesh_key)
+        self.mesh_new = meshes is None
+        if meshes is not None:
+            mesh = meshes[0]
+            self.meshes_lod = meshes[1:]
+            material_indices = None
+        else:
+            mesh_builder = road_core.road_mesh.Road_mesh_builder()
+            mesh_builder.update(self.geometry.core, lanes,
+                length_broken_line, tolerance_chord, length_edge_max, road_mark_dash_instances)
+            vertices, loops, loop_starts, loop_totals, material_indices = \
+                mesh_builder.get_mesh_arrays()
+            # Create blender mesh
+            mesh = helper.mesh_from_arrays('temp_road', vertices, loops, loop_starts,
+                loop_totals, material_indices)
+            # Coarser levels of detail reuse the plan view samples
+            self.meshes_lod = [helper.mesh_from_arrays('temp_road_lod', *mesh_arrays)
+                for mesh_arrays in mesh_builder.get_mesh_arrays_lods(lanes,
+                    road_core.road_mesh.LOD_LEVELS[1:num_lods + 1])]
         valid = True
-        return valid, mesh, self.geometry.matrix_world, materials
+        return valid, mesh, self.geometry.matrix_world, material_indices
+
+    def create_lod_objects(self, context, obj):
+        '''
+            Create the coarser levels of detail as hidden child objects of
+            the road named <name>_LOD1, <name>_LOD2, ... for FBX export.
+        '''
+        for idx_lod, mesh_lod in enumerate(self.meshes_lod, start=1):
+            name = obj.name + '_LOD' + str(idx_lod)
+            if self.mesh_new:
+                mesh_lod.name = name
+            obj_lod = bpy.data.objects.new(name, mesh_lod)
+            # Same transformation as the road itself
+            obj_lod.parent = obj
+            helper.link_object_opendrive(context, obj_lod)
+            if len(mesh_lod.materials) == 0:
+                helper.assign_road_materials(obj_lod)
+            obj_lod['dsc_category'] = 'OpenDRIVE'
+            obj_lod['dsc_type'] = 'road_lod'
+            obj_lod.hide_set(True)
+
+    def update_dash_objects(self, context, obj, geometry):
+        '''
+            (Re)create the dashes of broken road marks as instances of a unit
+            square on the points of one carrier object named
+            <name>_road_marks if enabled in the road properties.
+        '''
+        for child in obj.children:
+            if child.get('dsc_type') == 'road_mark_dashes':
+                mesh = child.data
+                bpy.data.objects.remove(child, do_unlink=True)
+                bpy.data.meshes.remove(mesh)
+        road_properties = context.scene.road_properties
+        if not road_properties.road_mark_dash_instances:
+            return
+        placements = road_core.markings.get_dash_placements(geometry,
+            road_properties.lanes, road_properties.length_broken_line)
+        mesh = helper.dash_carrier_mesh_from_placements(obj.name + '_road_marks', placements)
+        obj_marks = bpy.data.objects.new(obj.name + '_road_marks', mesh)
+        obj_marks.parent = obj
+        modifier = obj_marks.modifiers.new('road_mark_dashes', 'NODES')
+        modifier.node_group = helper.get_road_mark_dashes_node_group()
+        helper.link_object_road_marks(context, obj_marks)
+        obj_marks['dsc_category'] = 'OpenDRIVE'
+        obj_marks['dsc_type'] = 'road_mark_dashes'
+
+    def update_3d_object(self, context, obj):
+        '''
+            Update the mesh of an existing road object in place after its
+            lanes changed. The mesh builder of the road is kept between
+            updates (see get_road_mesh_builder), repeated updates only
+            rewrite the affected parts.
+        '''
+        road_properties = context.scene.road_properties
+        record = helper.get_road_record(obj)
+        geometry = road_core.geometry_from_params(record.geometry)
+        objs_lod = sorted([child for child in obj.children if child.get('dsc_type') == 'road_lod'],
+            key=lambda obj_lod: obj_lod.name)
+        # Meshes shared with other roads are not edited
+        for obj_mesh in [obj] + objs_lod:
+            mesh_cache.make_mesh_single_user(obj_mesh)
+        mesh_builder = get_road_mesh_builder(obj)
+        dirty = mesh_builder.update(geometry, road_properties.lanes,
+            road_properties.length_broken_line, road_properties.sampling_tolerance_chord,
+            road_properties.sampling_length_edge_max, road_properties.road_mark_dash_instances)
+        helper.update_mesh_from_arrays(obj.data, dirty, *mesh_builder.get_mesh_arrays())
+        if dirty is not None:
+            meshes_lod = mesh_builder.get_mesh_arrays_lods(road_properties.lanes,
+                road_core.road_mesh.LOD_LEVELS[1:len(objs_lod) + 1])
+            for obj_lod, mesh_arrays in zip(objs_lod, meshes_lod):
+                helper.update_mesh_from_arrays(obj_lod.data, 'topology', *mesh_arrays)
+            self.update_dash_objects(context, obj, geometry)
+        self.set_lane_params(road_properties)
+        # The road split is not changed when updating the lanes
+        self.params['road_split_type'] = record.road_split_type
+        self.params['road_split_lane_idx'] = record.road_split_lane_idx
+        self.set_object_lane_params(obj, geometry.params)
+        return dirty
+
+    def set_object_lane_params(self, obj, geometry_params):
+        '''
+            Store the geometry and lane parameters as packed road record of
+            the road object.
+        '''
+        helper.set_road_record(obj, road_core.Road_record(geometry_params, self.params))
 
     def set_lane_params(self, road_properties):
         '''
@@ -227,12 +352,15 @@ class PR_OT_road(bpy.types.Operator):
                        'lanes_left_road_mark_types': [],
                        'lanes_left_road_mark_weights': [],
                        'lanes_left_road_mark_colors': [],
+                       'lanes_left_road_mark_widths': [],
                        'lanes_right_road_mark_types': [],
                        'lanes_right_road_mark_weights': [],
                        'lanes_right_road_mark_colors': [],
+                       'lanes_right_road_mark_widths': [],
                        'lane_center_road_mark_type': [],
                        'lane_center_road_mark_weight': [],
                        'lane_center_road_mark_color': [],
+                       'lane_center_road_mark_width': 0.0,
                        'road_split_type': road_properties.road_split_type,
                        'road_split_lane_idx': road_properties.road_split_lane_idx}
         for idx, lane in enumerate(road_properties.lanes):
@@ -243,6 +371,7 @@ class PR_OT_road(bpy.types.Operator):
                 self.params['lanes_left_road_mark_types'].insert(0, lane.road_mark_type)
                 self.params['lanes_left_road_mark_weights'].insert(0, lane.road_mark_weight)
                 self.params['lanes_left_road_mark_colors'].insert(0, lane.road_mark_color)
+                self.params['lanes_left_road_mark_widths'].insert(0, lane.road_mark_width)
             elif lane.side == 'right':
                 self.params['lanes_right_widths'].append(lane.width)
                 self.params['lanes_right_widths_change'].append(lane.width_change)
@@ -250,11 +379,13 @@ class PR_OT_road(bpy.types.Operator):
                 self.params['lanes_right_road_mark_types'].append(lane.road_mark_type)
                 self.params['lanes_right_road_mark_weights'].append(lane.road_mark_weight)
                 self.params['lanes_right_road_mark_colors'].append(lane.road_mark_color)
+                self.params['lanes_right_road_mark_widths'].append(lane.road_mark_width)
             else:
                 # lane.side == 'center'
                 self.params['lane_center_road_mark_type'] = lane.road_mark_type
                 self.params['lane_center_road_mark_weight'] = lane.road_mark_weight
                 self.params['lane_center_road_mark_color'] = lane.road_mark_color
+                self.params['lane_center_road_mark_width'] = lane.road_mark_width
 
     def get_split_cps(self, road_split_type):
         '''
@@ -309,405 +440,6 @@ class PR_OT_road(bpy.types.Operator):
                             t_cp_split -= self.params['lanes_right_widths'][idx]
         return t_cp_split
 
-    def get_width_road_left(self, lanes):
-        '''
-            Return the width of the left road side calculated by suming up all
-            lane widths.
-        '''
-        width_road_left = 0
-        for idx, lane in enumerate(lanes):
-            if idx == 0:
-                if lane.road_mark_type != 'none':
-                    # If first lane has a line we need to add half its width
-                    width_line = lane.road_mark_width
-                    if lane.road_mark_type == 'solid_solid' or \
-                        lane.road_mark_type == 'solid_broken' or \
-                        lane.road_mark_type == 'broken_solid':
-                            width_road_left += width_line * 3.0 / 2.0
-                    else:
-                        width_road_left += width_line / 2.0
-            # Stop when reaching the right side
-            if lane.side == 'right':
-                break
-            if lane.side == 'left':
-                width_road_left += lane.width
-        return width_road_left
-
-    def get_strips_t_values(self, lanes, s):
-        '''
-            Return list of t values of strip borders.
-        '''
-        t = self.get_width_road_left(lanes)
-        t_values = []
-        for idx_lane, lane in enumerate(lanes):
-            s_norm = s / self.geometry.params['length']
-            if lane.width_change == 'open':
-                lane_width_s = (3.0 * s_norm**2 - 2.0 * s_norm**3) * lane.width
-            elif lane.width_change == 'close':
-                lane_width_s = (1.0 - 3.0 * s_norm**2 + 2.0 * s_norm**3) * lane.width
-            else:
-                lane_width_s = lane.width
-            # Add lane width for right side of road BEFORE (in t-direction) road mark lines
-            if lane.side == 'right':
-                width_left_lines_on_lane = 0.0
-                if lanes[idx_lane - 1].road_mark_type != 'none':
-                    width_line = lanes[idx_lane - 1].road_mark_width
-                    if lanes[idx_lane - 1].road_mark_type == 'solid_solid' or \
-                            lanes[idx_lane - 1].road_mark_type == 'solid_broken' or \
-                            lanes[idx_lane - 1].road_mark_type == 'broken_solid':
-                        width_left_lines_on_lane = width_line * 3.0 / 2.0
-                    else:
-                        width_left_lines_on_lane = width_line / 2.0
-                width_right_lines_on_lane = 0.0
-                if lane.road_mark_type != 'none':
-                    width_line = lane.road_mark_width
-                    if lane.road_mark_type == 'solid_solid' or \
-                            lane.road_mark_type == 'solid_broken' or \
-                            lane.road_mark_type == 'broken_solid':
-                        width_right_lines_on_lane = width_line * 3.0 / 2.0
-                    else:
-                        width_right_lines_on_lane = width_line / 2.0
-                t -= lane_width_s - width_left_lines_on_lane - width_right_lines_on_lane
-            # Add road mark lines
-            if lane.road_mark_type != 'none':
-                width_line = lane.road_mark_width
-                if lane.road_mark_type == 'solid_solid' or \
-                        lane.road_mark_type == 'solid_broken' or \
-                        lane.road_mark_type == 'broken_solid':
-                    t_values.append(t)
-                    t_values.append(t -       width_line)
-                    t_values.append(t - 2.0 * width_line)
-                    t_values.append(t - 3.0 * width_line)
-                    t = t - 3.0 * width_line
-                else:
-                    t_values.append(t)
-                    t_values.append(t - width_line)
-                    t -= width_line
-            else:
-                t_values.append(t)
-            # Add lane width for left side of road AFTER (in t-direction) road mark lines
-            if lane.side == 'left':
-                width_left_lines_on_lane = 0
-                if lane.road_mark_type != 'none':
-                    width_line = lane.road_mark_width
-                    if lane.road_mark_type == 'solid_solid' or \
-                            lane.road_mark_type == 'solid_broken' or \
-                            lane.road_mark_type == 'broken_solid':
-                        width_left_lines_on_lane = width_line * 3.0 / 2.0
-                    else:
-                        width_left_lines_on_lane = width_line / 2.0
-                width_right_lines_on_lane = 0
-                if lanes[idx_lane + 1].road_mark_type != 'none':
-                    width_line = lanes[idx_lane + 1].road_mark_width
-                    if lanes[idx_lane + 1].road_mark_type == 'solid_solid' or \
-                            lanes[idx_lane + 1].road_mark_type == 'solid_broken' or \
-                            lanes[idx_lane + 1].road_mark_type == 'broken_solid':
-                        width_right_lines_on_lane = width_line * 3.0 / 2.0
-                    else:
-                        width_right_lines_on_lane = width_line / 2.0
-                t -= lane_width_s - width_left_lines_on_lane - width_right_lines_on_lane
-        return t_values
-
-    def get_strips_s_boundaries(self, lanes, length_broken_line):
-        '''
-            Return list of tuples with a line marking toggle flag and a list
-            with the start and stop values of the faces in each strip.
-        '''
-        # Calculate line parameters
-        # TODO offset must be provided by predecessor road for each marking
-        length = self.geometry.params['length']
-        offset = 0.5
-        if offset < length_broken_line:
-            offset_first = offset
-            line_toggle_start = True
-        else:
-            offset_first = offset % length_broken_line
-            line_toggle_start = False
-        s_values = []
-        
-        for lane in lanes:
-            # Calculate broken line parameters
-            if lane.road_mark_type == 'broken':
-                num_faces_strip_line = ceil((length \
-                                        - (length_broken_line - offset_first)) \
-                                       / length_broken_line)
-                # Add one extra step for the shorter first piece
-                if offset_first > 0:
-                    num_faces_strip_line += 1
-                length_first = min(length, length_broken_line - offset_first)
-                if num_faces_strip_line > 1:
-                    length_last = length - length_first - (num_faces_strip_line - 2) * length_broken_line
-                else:
-                    length_last = length_first
-            else:
-                num_faces_strip_line = 1
-
-            # Go in s direction along lane and calculate the start and stop values
-            # ASPHALT
-            if lane.side == 'right':
-                s_values.append((line_toggle_start, [0, length]))
-            # ROAD MARK
-            if lane.road_mark_type != 'none':
-                s_values_strip = [0]
-                for idx_face_strip in range(num_faces_strip_line):
-                    # Calculate end points of the faces
-                    s_stop = length
-                    if lane.road_mark_type == 'broken':
-                        if idx_face_strip == 0:
-                            # First piece
-                            s_stop = length_first
-                        elif idx_face_strip > 0 and idx_face_strip + 1 == num_faces_strip_line:
-                            # Last piece and more than one piece
-                            s_stop = length_first + (idx_face_strip - 1) * length_broken_line \
-                                    + length_last
-                        else:
-                            # Middle piece
-                            s_stop = length_first + idx_face_strip * length_broken_line
-                    s_values_strip.append(s_stop)
-                if lane.road_mark_type == 'solid_solid':
-                    s_values.append((line_toggle_start, s_values_strip))
-                    s_values.append((line_toggle_start, s_values_strip))
-                s_values.append((line_toggle_start, s_values_strip))
-            # ASPHALT
-            if lane.side == 'left':
-                s_values.append((line_toggle_start, [0, length]))
-        return s_values
-
-    def get_road_sample_points(self, lanes, strips_s_boundaries):
-        '''
-            Adaptively sample road in s direction based on local curvature.
-        '''
-        length = self.geometry.params['length']
-        s = 0
-        strips_t_values = self.get_strips_t_values(lanes, s)
-        # Obtain first curvature value
-        xyz_samples, curvature_abs = self.geometry.sample_cross_section(0, strips_t_values)
-        # We need 2 vectors for each strip to later construct the faces with one
-        # list per face on each side of each strip
-        sample_points = [[[]] for _ in range(2 * (len(strips_t_values) - 1))]
-        t_offset = 0
-        for idx_t in range(len(strips_t_values) - 1):
-            sample_points[2 * idx_t][0].append((0, strips_t_values[idx_t], 0))
-            sample_points[2 * idx_t + 1][0].append((0, strips_t_values[idx_t + 1], 0))
-        # Concatenate vertices until end of road
-        idx_boundaries_strips = [0] * len(strips_s_boundaries)
-        while s < length:
-            # TODO: Make hardcoded sampling parameters configurable
-            if curvature_abs == 0:
-                step = 5
-            else:
-                step = max(1, min(5, 0.1 / abs(curvature_abs)))
-            s += step
-            if s >= length:
-                s = length
-
-            # Sample next points along road geometry (all t values for current s value)
-            strips_t_values = self.get_strips_t_values(lanes, s)
-            xyz_samples, curvature_abs = self.geometry.sample_cross_section(s, strips_t_values)
-            point_index = -2
-            while point_index < len(sample_points) - 2:
-                point_index = point_index + 2
-                if not sample_points[point_index][0]:
-                    continue
-                idx_strip = point_index//2
-                # Get the boundaries of road marking faces for current strip plus left and right
-                idx_boundaries = [0, 0, 0]
-                s_boundaries_next = [length, length, length]
-                # Check if there is a strip left and/or right to take into account
-                if idx_strip > 0:
-                    idx_boundaries[0] = idx_boundaries_strips[idx_strip - 1]
-                    s_boundaries_next[0] = strips_s_boundaries[idx_strip - 1][1][idx_boundaries[0] + 1]
-                idx_boundaries[1] = idx_boundaries_strips[idx_strip]
-                s_boundaries_next[1] = strips_s_boundaries[idx_strip][1][idx_boundaries[1] + 1]
-                if idx_strip < len(strips_s_boundaries) - 1:
-                    idx_boundaries[2] = idx_boundaries_strips[idx_strip + 1]
-                    s_boundaries_next[2] = strips_s_boundaries[idx_strip + 1][1][idx_boundaries[2] + 1]
-
-                # Check if any face boundary is smaller than sample point
-                smaller, idx_smaller = self.compare_boundaries_with_s(s, s_boundaries_next)
-                if smaller:
-                    # Find all boundaries in between
-                    while smaller:
-                        # Sample the geometry
-                        t_values = [strips_t_values[idx_strip], strips_t_values[idx_strip + 1]]
-                        xyz_boundary, curvature_abs = self.geometry.sample_cross_section(
-                            s_boundaries_next[idx_smaller], t_values)
-                        if idx_smaller == 0:
-                            # Append left extra point
-                            sample_points[2 * idx_strip][idx_boundaries[1]].append(xyz_boundary[0])
-                        if idx_smaller == 1:
-                            # Append left and right points
-                            sample_points[2 * idx_strip][idx_boundaries[1]].append(xyz_boundary[0])
-                            sample_points[2 * idx_strip + 1][idx_boundaries[1]].append(xyz_boundary[1])
-                            # Start a new list for next face
-                            sample_points[2 * idx_strip].append([xyz_boundary[0]])
-                            sample_points[2 * idx_strip + 1].append([xyz_boundary[1]])
-                        if idx_smaller == 2:
-                            # Append right extra point
-                            sample_points[2 * idx_strip + 1][idx_boundaries[1]].append(xyz_boundary[1])
-                        # Get the next boundary (relative to this strip)
-                        idx_boundaries[idx_smaller] += 1
-                        idx_strip_relative = idx_strip + idx_smaller - 1
-                        s_boundaries_next[idx_smaller] = \
-                            strips_s_boundaries[idx_strip_relative][1][idx_boundaries[idx_smaller] + 1]
-                        # Check again
-                        smaller, idx_smaller = self.compare_boundaries_with_s(s, s_boundaries_next)
-                    # Write back indices to global array (only left strip to avoid cross interference!)
-                    if idx_strip > 0:
-                        idx_boundaries_strips[idx_strip - 1] = idx_boundaries[0]
-
-                # Now there is no boundary in between anymore so append the samples
-                sample_points[2 * idx_strip][idx_boundaries[1]].append(xyz_samples[idx_strip])
-                sample_points[2 * idx_strip + 1][idx_boundaries[1]].append(xyz_samples[idx_strip + 1])
-        return sample_points
-
-    def compare_boundaries_with_s(self, s, s_boundaries_next):
-        '''
-            Return True if any boundary is smaller than s, also return the index
-            to the boundary.
-        '''
-        smaller = False
-        idx_sorted = sorted(range(len(s_boundaries_next)), key=s_boundaries_next.__getitem__)
-        if s_boundaries_next[idx_sorted[0]] < s:
-            smaller = True
-
-        return smaller, idx_sorted[0]
-
-    def get_road_vertices_edges_faces(self, road_sample_points):
-        '''
-           generate mesh from samplepoints
-        '''
-        vertices = []
-        edges = []
-        faces = []
-        idx_vertex = 0
-        point_index = 0
-        while point_index < len(road_sample_points):
-            for idx_face_strip in range(len(road_sample_points[point_index])):
-                # ignore empty samplepoints, it may be none type line or any thing that doesn't need to build a mesh
-                if not road_sample_points[point_index][0]:
-                    continue
-                samples_right = road_sample_points[point_index + 1][idx_face_strip]
-                samples_left = road_sample_points[point_index][idx_face_strip]
-                num_vertices = len(samples_left) + len(samples_right)
-                vertices += samples_right + samples_left[::-1]
-                edges += [[idx_vertex + n, idx_vertex + n + 1] for n in range(num_vertices - 1)] \
-                         + [[idx_vertex + num_vertices - 1, idx_vertex]]
-                faces += [[idx_vertex + n for n in range(num_vertices)]]
-                idx_vertex += num_vertices
-            point_index = point_index + 2
-        return vertices, edges, faces
-
-    def get_strip_to_lane_mapping(self, lanes):
-        '''
-            Return list of lane indices for strip indices.
-        '''
-        strip_to_lane = []
-        strip_is_road_mark = []
-        for idx_lane, lane in enumerate(lanes):
-            if lane.side == 'left':
-                if lane.road_mark_type != 'none':
-                    if lane.road_mark_type == 'solid' or \
-                        lane.road_mark_type == 'broken':
-                        strip_to_lane.append(idx_lane)
-                        strip_is_road_mark.append(True)
-                    else:
-                        # Double line
-                        strip_to_lane.append(idx_lane)
-                        strip_to_lane.append(idx_lane)
-                        strip_to_lane.append(idx_lane)
-                        strip_is_road_mark.append(True)
-                        strip_is_road_mark.append(False)
-                        strip_is_road_mark.append(True)
-                strip_to_lane.append(idx_lane)
-                strip_is_road_mark.append(False)
-            elif lane.side == 'center':
-                if lane.road_mark_type != 'none':
-                    strip_to_lane.append(idx_lane)
-                    strip_is_road_mark.append(True)
-            else:
-                # lane.side == 'right'
-                strip_to_lane.append(idx_lane)
-                strip_is_road_mark.append(False)
-                if lane.road_mark_type != 'none':
-                    if lane.road_mark_type == 'solid' or \
-                        lane.road_mark_type == 'broken':
-                        strip_to_lane.append(idx_lane)
-                        strip_is_road_mark.append(True)
-                    else:
-                        # Double line
-                        strip_to_lane.append(idx_lane)
-                        strip_to_lane.append(idx_lane)
-                        strip_to_lane.append(idx_lane)
-                        strip_is_road_mark.append(True)
-                        strip_is_road_mark.append(False)
-                        strip_is_road_mark.append(True)
-        return strip_to_lane, strip_is_road_mark
-
-    def get_road_mark_material(self, color):
-        '''
-            Return material name for road mark color.
-        '''
-        mapping_color_material = {
-            'white': 'road_mark_white',
-            'yellow': 'road_mark_yellow',
-        }
-        return mapping_color_material[color]
-
-    def get_face_materials(self, lanes, strips_s_boundaries):
-        '''
-            Return dictionary with index of faces for each material.
-        '''
-        materials = {'asphalt': [], 'road_mark_white': [], 'road_mark_yellow': [], 'grass': []}
-        idx_face = 0
-        strip_to_lane, strip_is_road_mark = self.get_strip_to_lane_mapping(lanes)
-        for idx_strip in range(len(strips_s_boundaries)):
-            idx_lane = strip_to_lane[idx_strip]
-            if strip_is_road_mark[idx_strip]:
-                line_toggle = strips_s_boundaries[idx_strip][0]
-                num_faces = int(len(strips_s_boundaries[idx_strip][1]) - 1)
-                material = self.get_road_mark_material(lanes[idx_lane].road_mark_color)
-                # Step through faces of a road mark strip
-                for idx in range(num_faces):
-                    # Determine material
-                    if lanes[idx_lane].road_mark_type == 'solid':
-                        materials[material].append(idx_face)
-                        idx_face += 1
-                    elif lanes[idx_lane].road_mark_type == 'broken':
-                        if line_toggle:
-                            materials[material].append(idx_face)
-                            line_toggle = False
-                        else:
-                            materials['asphalt'].append(idx_face)
-                            line_toggle = True
-                        idx_face += 1
-                    elif lanes[idx_lane].road_mark_type == 'solid_solid':
-                        materials[material].append(idx_face)
-                        materials['asphalt'].append(idx_face + 1)
-                        materials[material].append(idx_face + 2)
-                        idx_face += 3
-            else:
-                if lanes[idx_lane].type == 'median':
-                    materials['grass'].append(idx_face)
-                elif lanes[idx_lane].type == 'shoulder':
-                    materials['grass'].append(idx_face)
-                else:
-                    materials['asphalt'].append(idx_face)
-                idx_face += 1
-
-        return materials
-            
-    def get_xyz_any_s(self, any_s, any_t):
-        if ((self.geometry.__class__.__name__ == "DSC_geometry_arc") or (self.geometry.__class__.__name__ == "DSC_geometry_clothoid")):
-            x_s, y_s, curvature_plan_view, hdg_t = self.geometry.sample_plan_view(any_s)
-            vector_hdg_t = Vector((1.0, 0.0))
-            vector_hdg_t.rotate(Matrix.Rotation(hdg_t, 2))
-            xy = Vector((x_s, y_s)) + (any_t * vector_hdg_t)
-            xyz = Vector((xy.x, xy.y, 0.0))
-        elif(self.geometry.__class__.__name__ == "DSC_geometry_line"):
-            xyz = self.geometry.get_xyz_point_given_st(any_s, any_t)
-        return xyz
-    
     def get_roadside_object_location_and_rotation(self, xyz_samples, edge='left'):
         if edge=='left': edge_loc = xyz_samples[int(len(xyz_samples)-len(xyz_samples))]
         elif edge=='right': edge_loc = xyz_samples[int(len(xyz_samples)-1)]
@@ -725,35 +457,41 @@ class PR_OT_road(bpy.types.Operator):
         '''
         self.init_state()
         self.create_3d_object(context)
-        #length_broken_line = context.scene.road_properties.length_broken_line
-        #self.set_lane_params(context.scene.road_properties)
-        #lanes = context.scene.road_properties.lanes
-        # Get values in t and s direction where the faces of the road start and end
-        #strips_s_boundaries = self.get_strips_s_boundaries(lanes, length_broken_line)
-        #for s in strips_s_boundaries[3][1]:
-        #    strips_t_values = self.get_strips_t_values(lanes, s)
-        #    xyz_samples, curvature_abs = self.geometry.sample_cross_section(s, strips_t_values)
-        #    bpy.ops.mesh.primitive_circle_add(location=xyz_samples[0])
-        #    break
-        # # Calculate meshes for Blender
-        # road_sample_points = self.get_road_sample_points(lanes, strips_s_boundaries)
-        # vertex_loc_middle = int(len(road_sample_points[5][0])/2)
-        # bpy.ops.mesh.primitive_cube_add(location = [road_sample_points[5][0][vertex_loc_middle][1]+5, road_sample_points[5][0][vertex_loc_middle][0], 0])
+        return {'FINISHED'}
+
+class PR_OT_road_update(PR_OT_road):
+    bl_idname = 'pr.road_update'
+    bl_label = 'Update road'
+    bl_description = 'Apply the current lane settings to the active road'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        obj = context.active_object
+        if obj is None or obj.get('dsc_type') != 'road':
+            self.report({'WARNING'}, 'Active object is not a road!')
+            return {'CANCELLED'}
+        if len(context.scene.road_properties.lanes) == 0:
+            context.scene.road_properties.init()
+        self.update_3d_object(context, obj)
         return {'FINISHED'}
 
 def register():
     bpy.utils.register_class(PR_OT_road)
+    bpy.utils.register_class(PR_OT_road_update)
     bpy.utils.register_class(PR_enum_lane)
     bpy.utils.register_class(PR_road_properties)   
     # Register property groups
     bpy.types.Scene.road_properties = bpy.props.PointerProperty(type=PR_road_properties)
+    helper.register_index_handlers()
 
 def unregister():
     bpy.utils.unregister_class(PR_OT_road)
+    bpy.utils.unregister_class(PR_OT_road_update)
     bpy.utils.unregister_class(PR_enum_lane)
     bpy.utils.unregister_class(PR_road_properties)
     # Get rid of property groups
     del bpy.types.Scene.road_properties
+    helper.unregister_index_handlers()
 
 if __name__ == '__main__':
     register()
@@ -0,0 +1,30 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Road geometry and mesh generation without Blender. Only depends on NumPy,
+# pyclothoids is needed to solve new clothoid geometries.
+from .elevation import Elevation_profile
+from .geometry import Geometry, Geometry_line, Geometry_arc, Geometry_clothoid, \
+    Clothoid_solver_cache, clothoid_solver_cache, Plan_view_cache, get_geometry, \
+    geometry_from_params
+from .lanes import Lane, Lane_layout, lanes_from_cross_section, get_width_road_left, \
+    get_strips_t_values, get_strips_s_boundaries, get_strips_s_boundaries_merged, \
+    get_strip_to_lane_mapping, get_face_materials
+from .road_mesh import get_road_sample_points, get_road_mesh_arrays_from_samples, \
+    get_road_mesh, get_road_mesh_arrays, get_road_mesh_lods, \
+    Road_mesh_builder, build_road
+from .spatial import Road_projection_index, Connector_index
+from .roadside import get_roadside_placements
+from .markings import get_dash_placements
+from .network import Road_network_graph
+from .record import Road_record
@@ -0,0 +1,188 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Vectorized clothoid evaluation based on Fresnel integrals. Only depends on
+# NumPy so it can be used where pyclothoids is not available.
+from math import pi
+import numpy as np
+
+# Switch from power series to continued fraction for the Fresnel integrals
+FRESNEL_SERIES_MAX = 2.0
+# Below this value of the quadratic phase coefficient the Fresnel integral
+# difference loses precision and we integrate numerically instead
+A_SMALL = 1e-4
+# Gauss-Legendre nodes and weights on [0, 1] for the small phase case
+GAUSS_NODES, GAUSS_WEIGHTS = np.polynomial.legendre.leggauss(16)
+GAUSS_NODES = 0.5 * (GAUSS_NODES + 1.0)
+GAUSS_WEIGHTS = 0.5 * GAUSS_WEIGHTS
+EPS = 1e-16
+
+
+def fresnel_cs(x):
+    '''
+        Return the Fresnel integrals C(x) and S(x) for an array of x values.
+
+        For small arguments the power series is used, for larger arguments the
+        continued fraction of the complementary error function.
+    '''
+    x = np.asarray(x, dtype=float)
+    x_abs = np.abs(x)
+    C = np.empty_like(x_abs)
+    S = np.empty_like(x_abs)
+
+    # Power series
+    series = x_abs <= FRESNEL_SERIES_MAX
+    if np.any(series):
+        x_s = x_abs[series]
+        t = -(pi / 2 * x_s**2)**2
+        # Cosine integral
+        term = np.ones_like(x_s)
+        sum_c = np.ones_like(x_s)
+        # Sine integral
+        term_s = np.ones_like(x_s)
+        sum_s = np.full_like(x_s, 1.0 / 3.0)
+        n = 0
+        while True:
+            n += 1
+            term = term * t / ((2 * n) * (2 * n - 1))
+            term_s = term_s * t / ((2 * n + 1) * (2 * n))
+            delta_c = term / (4 * n + 1)
+            delta_s = term_s / (4 * n + 3)
+            sum_c += delta_c
+            sum_s += delta_s
+            if np.all(np.abs(delta_c) <= EPS * np.abs(sum_c)) \
+                    and np.all(np.abs(delta_s) <= EPS * np.abs(sum_s)):
+                break
+        C[series] = x_s * sum_c
+        S[series] = pi / 2 * sum_s * x_s**3
+
+    # Continued fraction evaluated with the modified Lentz method
+    fraction = ~series
+    if np.any(fraction):
+        x_f = x_abs[fraction]
+        b = 1.0 - 1j * pi * x_f**2
+        c = np.full_like(b, 1e300)
+        d = 1.0 / b
+        h = d.copy()
+        n = -1
+        for _ in range(200):
+            n += 2
+            a = -n * (n + 1)
+            b = b + 4.0
+            d = 1.0 / (a * d + b)
+            c = b + a / c
+            delta = c * d
+            h = h * delta
+            if np.all(np.abs(delta.real - 1.0) + np.abs(delta.imag) < EPS):
+                break
+        h = (x_f - 1j * x_f) * h
+        cs = (0.5 + 0.5j) * (1.0 - np.exp(1j * pi / 2 * x_f**2) * h)
+        C[fraction] = cs.real
+        S[fraction] = cs.imag
+
+    sign = np.where(x < 0, -1.0, 1.0)
+    return sign * C, sign * S
+
+
+def generalized_fresnel_cs(a, b, c):
+    '''
+        Return the generalized Fresnel integrals
+
+            X = integral_0^1 cos(a/2 * tau^2 + b * tau + c) dtau
+            Y = integral_0^1 sin(a/2 * tau^2 + b * tau + c) dtau
+
+        for arrays of a, b and c.
+    '''
+    a, b, c = np.broadcast_arrays(np.asarray(a, dtype=float),
+        np.asarray(b, dtype=float), np.asarray(c, dtype=float))
+    X = np.empty(a.shape)
+    Y = np.empty(a.shape)
+
+    # Complete the square and use the difference of two Fresnel integrals
+    large = np.abs(a) >= A_SMALL
+    if np.any(large):
+        a_l = a[large]
+        b_l = b[large]
+        sign = np.where(a_l > 0, 1.0, -1.0)
+        a_abs = np.abs(a_l)
+        z = np.sqrt(a_abs / pi)
+        ell = sign * b_l / np.sqrt(pi * a_abs)
+        g = -0.5 * sign * b_l**2 / a_abs
+        cos_g = np.cos(g) / z
+        sin_g = np.sin(g) / z
+        C_ell, S_ell = fresnel_cs(ell)
+        C_z, S_z = fresnel_cs(ell + z)
+        dC = C_z - C_ell
+        dS = S_z - S_ell
+        X_0 = cos_g * dC - sign * sin_g * dS
+        Y_0 = sin_g * dC + sign * cos_g * dS
+        cos_c = np.cos(c[large])
+        sin_c = np.sin(c[large])
+        X[large] = X_0 * cos_c - Y_0 * sin_c
+        Y[large] = X_0 * sin_c + Y_0 * cos_c
+
+    # Almost linear phase, integrate with Gauss-Legendre quadrature on
+    # sufficiently many panels to resolve the oscillation
+    small = ~large
+    if np.any(small):
+        a_s = a[small]
+        b_s = b[small]
+        c_s = c[small]
+        phase_range = np.max(np.abs(b_s) + 0.5 * np.abs(a_s))
+        num_panels = max(1, int(np.ceil(phase_range / 2.0)))
+        tau = (np.arange(num_panels)[:, np.newaxis] + GAUSS_NODES).ravel() / num_panels
+        weights = np.tile(GAUSS_WEIGHTS, num_panels) / num_panels
+        phase = 0.5 * a_s[:, np.newaxis] * tau**2 + b_s[:, np.newaxis] * tau \
+            + c_s[:, np.newaxis]
+        X[small] = np.cos(phase) @ weights
+        Y[small] = np.sin(phase) @ weights
+
+    return X, Y
+
+
+def clothoid_xy_theta(s, curvature_start, dk, x_start=0.0, y_start=0.0, heading_start=0.0):
+    '''
+        Return arrays x(s), y(s) and heading theta(s) of a clothoid with
+        linearly changing curvature curvature_start + dk * s.
+    '''
+    s = np.asarray(s, dtype=float)
+    X, Y = generalized_fresnel_cs(dk * s**2, curvature_start * s, heading_start)
+    x_s = x_start + s * X
+    y_s = y_start + s * Y
+    theta = heading_start + curvature_start * s + 0.5 * dk * s**2
+    return x_s, y_s, theta
+
+
+class Clothoid_curve():
+    '''
+        Clothoid starting in the origin with heading 0 given by start
+        curvature, curvature change and length. Provides the same evaluation
+        interface as a pyclothoids Clothoid and is used when a geometry is
+        restored from stored parameters without solving.
+    '''
+
+    def __init__(self, curvature_start, dk, length):
+        self.KappaStart = curvature_start
+        self.dk = dk
+        self.length = length
+        self.KappaEnd = curvature_start + dk * length
+        self.ThetaEnd = curvature_start * length + 0.5 * dk * length**2
+
+    def X(self, s):
+        return float(clothoid_xy_theta(s, self.KappaStart, self.dk)[0])
+
+    def Y(self, s):
+        return float(clothoid_xy_theta(s, self.KappaStart, self.dk)[1])
+
+    def Theta(self, s):
+        return self.KappaStart * s + 0.5 * self.dk * s**2
@@ -0,0 +1,59 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from bisect import bisect_right
+import numpy as np
+
+
+class Elevation_profile():
+    '''
+        Piecewise cubic elevation profile h(s) = a + b*s + c*s^2 + d*s^3
+        compiled from the list of elevation records into breakpoint and
+        coefficient arrays.
+    '''
+
+    def __init__(self, elevation):
+        self.s_breakpoints = [record['s'] for record in elevation]
+        self.coefficients = np.array([[record['a'], record['b'], record['c'], record['d']]
+            for record in elevation], dtype=float)
+        self.s_breakpoints_array = np.array(self.s_breakpoints, dtype=float)
+
+    def get_index(self, s):
+        '''
+            Return index of the elevation record valid for a single s value.
+        '''
+        return max(bisect_right(self.s_breakpoints, s) - 1, 0)
+
+    def get_indices(self, s):
+        '''
+            Return indices of the elevation records valid for an array of s
+            values.
+        '''
+        return np.maximum(np.searchsorted(self.s_breakpoints_array, s, side='right') - 1, 0)
+
+    def evaluate(self, s):
+        '''
+            Return height, slope and vertical curvature for a single s value
+            or an array of s values.
+        '''
+        if np.ndim(s) == 0:
+            a, b, c, d = self.coefficients[self.get_index(s)].tolist()
+        else:
+            s = np.asarray(s, dtype=float)
+            a, b, c, d = self.coefficients[self.get_indices(s)].T
+        height = a + b * s + c * s**2 + d * s**3
+        slope = b + 2 * c * s + 3 * d * s**2
+        d2h_d2s = 2 * c + 6 * d * s
+        curvature = d2h_d2s / (1 + slope**2)**(3/2)
+        return height, slope, curvature
+
@@ -0,0 +1,757 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from math import pi, cos, inf, sin, atan2, sqrt
+from collections import OrderedDict
+import numpy as np
+
+from . import clothoid
+from .elevation import Elevation_profile
+
+try:
+    from pyclothoids import Clothoid
+except ImportError:
+    # Only needed to solve new clothoid geometries, evaluation works without
+    Clothoid = None
+
+
+def get_matrix_world(point_start, heading_start):
+    '''
+        Return 4x4 matrix for the local to global transform of a geometry.
+    '''
+    matrix_world = np.identity(4)
+    matrix_world[0, 0] = cos(heading_start)
+    matrix_world[0, 1] = -sin(heading_start)
+    matrix_world[1, 0] = sin(heading_start)
+    matrix_world[1, 1] = cos(heading_start)
+    matrix_world[0:3, 3] = point_start
+    return matrix_world
+
+
+def transform_point(matrix, point):
+    '''
+        Return 3D point transformed with a 4x4 matrix.
+    '''
+    return matrix[0:3, 0:3] @ point + matrix[0:3, 3]
+
+
+def project_point_vector(point_start, heading_start, point_selected):
+    '''
+        Project selected 2D point to vector.
+    '''
+    vector_selected = point_selected - point_start
+    if np.linalg.norm(vector_selected) > 0:
+        vector_object = np.array([cos(heading_start), sin(heading_start)])
+        return point_start + (vector_selected @ vector_object) * vector_object
+    else:
+        return point_selected
+
+
+def angle_signed(vector, vector_reference):
+    '''
+        Return signed angle from 2D reference vector to 2D vector.
+    '''
+    return atan2(vector_reference[0] * vector[1] - vector_reference[1] * vector[0],
+                 vector @ vector_reference)
+
+
+def orthogonal(vector):
+    '''
+        Return 2D vector rotated by 90 degrees counterclockwise.
+    '''
+    return np.array([-vector[1], vector[0]])
+
+
+#Classes to define geometries
+def get_cross_section_points(x_s, y_s, hdg_t, z, t):
+    '''
+        Return (N, M, 3) array of cross section points from N reference line
+        samples and t values given either as one array of M values or as a
+        (N, M) matrix.
+    '''
+    t = np.asarray(t, dtype=float)
+    if t.ndim == 1:
+        t = np.broadcast_to(t, (len(x_s), len(t)))
+    xyz = np.empty((len(x_s), t.shape[1], 3))
+    xyz[:, :, 0] = x_s[:, np.newaxis] + t * np.cos(hdg_t)[:, np.newaxis]
+    xyz[:, :, 1] = y_s[:, np.newaxis] + t * np.sin(hdg_t)[:, np.newaxis]
+    xyz[:, :, 2] = z[:, np.newaxis]
+    return xyz
+
+
+def get_curvature_cross_section(curvature_plan_view, curvature_elevation):
+    '''
+        Return absolute curvature of cross sections used for sampling.
+    '''
+    # FIXME convert curvature for t unequal 0
+    return np.maximum(np.abs(curvature_plan_view), np.abs(curvature_elevation))
+
+
+class Geometry():
+
+    def __init__(self):
+        self.params = {
+            'curve': None,
+            'length': 0,
+            'point_start': np.zeros(3),
+            'heading_start': 0,
+            'curvature_start': 0,
+            'slope_start':0,
+            'point_end': np.zeros(3),
+            'heading_end': 0,
+            'curvature_end': 0,
+            'slope_end': 0,
+            'elevation': [{'s': 0, 'a': 0, 'b': 0, 'c': 0, 'd': 0}],
+            'valid': True,
+        }
+        self.matrix_world = np.identity(4)
+        self.elevation_profile = Elevation_profile(self.params['elevation'])
+
+    def update(self, params_input, geometry_solver):
+        '''
+            Update parameters of the geometry and local to global tranformation
+            matrix.
+        '''
+        params_input = dict(params_input)
+        params_input['point_start'] = np.array(params_input['point_start'], dtype=float)
+        params_input['point_end'] = np.array(params_input['point_end'], dtype=float)
+        self.update_plan_view(params_input, geometry_solver)
+        self.update_elevation(params_input)
+
+    def set_params(self, params):
+        '''
+            Restore the geometry from stored parameters without solving.
+        '''
+        self.params = dict(params)
+        self.params['point_start'] = np.array(params['point_start'], dtype=float)
+        self.params['point_end'] = np.array(params['point_end'], dtype=float)
+        self.params['elevation'] = [dict(record) for record in params['elevation']]
+        self.update_local_to_global(self.params['point_start'], self.params['heading_start'],
+            self.params['point_end'], self.params['heading_end'])
+        self.set_plan_view()
+        self.elevation_profile = Elevation_profile(self.params['elevation'])
+
+    def update_local_to_global(self, point_start, heading_start, point_end, heading_end):
+        '''
+            Calculate matrix for local to global transform of the geometry.
+        '''
+        self.matrix_world = get_matrix_world(point_start, heading_start)
+        self.point_end_local = transform_point(np.linalg.inv(self.matrix_world), point_end)
+        self.heading_end_local = heading_end - heading_start
+
+    def update_plan_view(self, params, geometry_solver):
+        '''
+            Update plan view (2D) geometry of road.
+        '''
+        raise NotImplementedError()
+
+    def set_plan_view(self):
+        '''
+            Set up plan view (2D) geometry from the stored parameters.
+        '''
+        raise NotImplementedError()
+
+    def update_elevation(self, params_input):
+        '''
+            Update elevation of road geometry based on predecessor, successor,
+            start and end point.
+
+            TODO: Later allow elevations across multiple geometries for now we
+            use
+                parabola
+                parabola - line
+                parablola - line - parablola
+                line - parabola
+            curve combination inside one geometry.
+
+            Symbols and equations used:
+                Slope of incoming road: m_0
+                Parabola (Curve 0): h_p1 = a_p1 + b_p1 * s + c_p1 * s^2
+                Line (Curve 1): h_l = a_l + b_l * s
+                Parabola (Curve 2): h_p2 = a_p2 + b_p2 * s + c_p2 * s^2
+                Slope of outgoing road: m_3
+        '''
+        if (params_input['point_start'][2] == params_input['point_end'][2]
+            and params_input['slope_start'] == 0
+            and params_input['slope_end'] == 0):
+            # No elevation
+            self.params['elevation'] = [{'s': 0, 'a': 0, 'b': 0, 'c': 0, 'd': 0}]
+        else:
+            # TODO: get slope of predecessor and succesor
+            m_0 = params_input['slope_start']
+            m_3 = params_input['slope_end']
+
+            # Convert to local (s, z) coordinate system [x_1, y_1] = [0, 0]
+            h_start = params_input['point_start'][2]
+            s_end = self.params['length']
+            h_end = float(params_input['point_end'][2] - h_start)
+
+            # End of parabola/beginning of straight line
+            # TODO: Find correct equation for the parabola length from the literature
+            s_1 = max(abs(m_0)/10, abs(h_end)/s_end) * params_input['design_speed']**2 / 120
+            if s_1 > 0:
+                if s_1 < s_end:
+                    # Case: parobla - line
+                    c_p1 = (h_end - m_0 * s_end) / (2 * s_1 * s_end - s_1**2)
+                    h_1 = m_0 * s_1 + c_p1 * s_1**2
+                    b_l = (h_end - h_1) / (s_end - s_1)
+                    a_l = h_end - b_l * s_end
+                    self.params['elevation'] = [{'s': 0, 'a': 0, 'b': m_0, 'c': c_p1, 'd': 0}]
+                    self.params['elevation'].append({'s': s_1, 'a': a_l, 'b': b_l, 'c': 0, 'd': 0})
+                else:
+                    # Case: parablola
+                    c_p1 = (h_end - m_0 * s_end) / s_end**2
+                    self.params['elevation'] = [{'s': 0, 'a': 0, 'b': m_0, 'c': c_p1, 'd': 0}]
+            else:
+                self.params['elevation'] = [{'s': 0, 'a': 0, 'b': 0, 'c': 0, 'd': 0}]
+
+        # Compile once for fast lookup and evaluation while sampling
+        self.elevation_profile = Elevation_profile(self.params['elevation'])
+        self.params['slope_start'] = self.get_slope_start()
+        self.params['slope_end'] = self.get_slope_end()
+
+    def get_slope_start(self):
+        '''
+            Return slope at beginning of geometry.
+        '''
+        return self.params['elevation'][0]['b']
+
+    def get_slope_end(self):
+        '''
+            Return slope at end of geometry.
+        '''
+        _, slope, _ = self.elevation_profile.evaluate(self.params['length'])
+        return slope
+
+    def sample_plan_view(self, s):
+        '''
+            Return x(s), y(s), curvature(s), hdg_t(s)
+        '''
+        raise NotImplementedError()
+
+    def sample_plan_view_batch(self, s):
+        '''
+            Return arrays x(s), y(s), curvature(s), hdg_t(s) for an array of s
+            values.
+        '''
+        raise NotImplementedError()
+
+    def get_curvature_plan_view(self, s):
+        '''
+            Return plan view curvature for a single s value or an array of s
+            values without evaluating the position.
+        '''
+        raise NotImplementedError()
+
+    def get_curvature_abs(self, s):
+        '''
+            Return the absolute curvature used for sampling, the maximum of
+            plan view and elevation curvature.
+        '''
+        _, _, curvature_elevation = self.elevation_profile.evaluate(s)
+        return max(abs(self.get_curvature_plan_view(s)), abs(curvature_elevation))
+
+    def get_elevation(self, s):
+        '''
+            Return the elevation coefficients for the given value of s.
+        '''
+        return self.params['elevation'][self.elevation_profile.get_index(s)]
+
+    def sample_cross_section(self, s, t_vec):
+        '''
+            Sample a cross section (multiple t values) in the local coordinate
+            system.
+        '''
+        x_s, y_s, curvature_plan_view, hdg_t = self.sample_plan_view(s)
+        z, _, curvature_elevation = self.elevation_profile.evaluate(s)
+        # FIXME convert curvature for t unequal 0
+        curvature_abs = max(abs(curvature_plan_view), abs(curvature_elevation))
+        cos_hdg_t = cos(hdg_t)
+        sin_hdg_t = sin(hdg_t)
+        xyz = []
+        for t in t_vec:
+            xyz += [(x_s + t * cos_hdg_t, y_s + t * sin_hdg_t, z)]
+        return xyz, curvature_abs
+
+    def sample_cross_section_batch(self, s, t):
+        '''
+            Sample cross sections for an array of N s values in the local
+            coordinate system. The t values are either given as one array of M
+            values used for all s values or as a (N, M) matrix with one row per
+            s value. Return a (N, M, 3) array of points and an array of the
+            absolute curvature for each s value.
+        '''
+        s = np.atleast_1d(np.asarray(s, dtype=float))
+        x_s, y_s, curvature_plan_view, hdg_t = self.sample_plan_view_batch(s)
+        z, _, curvature_elevation = self.elevation_profile.evaluate(s)
+        return get_cross_section_points(x_s, y_s, hdg_t, z, t), \
+            get_curvature_cross_section(curvature_plan_view, curvature_elevation)
+
+class Geometry_line(Geometry):
+
+    def update_plan_view(self, params, geometry_solver):
+        if params['connected_start']:
+            point_end = project_point_vector(params['point_start'][0:2],
+                params['heading_start'], params['point_end'][0:2])
+            # Add height back to end point
+            point_end = np.array([point_end[0], point_end[1], params['point_end'][2]])
+        else:
+            point_end = params['point_end']
+
+        # Note: For the line geometry heading_start and heading_end input is ignored
+        # since the degrees of freedom are to low.
+        # Hence, recalculate start heading
+        heading_start_line = angle_signed(point_end[0:2] - params['point_start'][0:2],
+            np.array([1.0, 0.0]))
+        # Calculate transform between global and local coordinates
+        self.update_local_to_global(params['point_start'], heading_start_line,
+            point_end, heading_start_line,)
+        # Local starting point is 0 vector so length becomes length of end point vector
+        length = float(np.linalg.norm(self.point_end_local[0:2]))
+
+        # Remember geometry parameters
+        self.params['curve'] = 'line'
+        self.params['point_start'] = params['point_start']
+        self.params['heading_start'] = heading_start_line
+        self.params['curvature_start'] = 0
+        self.params['point_end'] = point_end
+        self.params['heading_end'] = heading_start_line
+        self.params['curvature_end'] = 0
+        self.params['length'] = length
+
+    def set_plan_view(self):
+        pass
+
+    # Since for this geometry, sample_plan_view below doesn't make sense,
+    # I'm writing another function just to get an xyz point somewhere along the road
+    def get_xyz_point_given_st(self, s=2.0, t=0.0):
+        road_vec = np.zeros(3)
+        road_vec[0:2] = self.params['point_end'][0:2] - self.params['point_start'][0:2]
+        road_vec = road_vec / np.linalg.norm(road_vec)
+        angle = atan2(s,t)
+        rotation_angle = (pi/2)-angle
+        road_vec = get_matrix_world(np.zeros(3), rotation_angle)[0:3, 0:3] @ road_vec
+        xyz = road_vec * (sqrt((s**2) + (t**2)))
+        return xyz
+
+    def sample_plan_view(self, s):
+        x_s = s
+        y_s = 0.0
+        curvature = 0
+        hdg_t = pi/2
+        return x_s, y_s, curvature, hdg_t
+
+    def sample_plan_view_batch(self, s):
+        x_s = np.array(s, dtype=float)
+        y_s = np.zeros_like(x_s)
+        curvature = np.zeros_like(x_s)
+        hdg_t = np.full_like(x_s, pi/2)
+        return x_s, y_s, curvature, hdg_t
+
+    def get_curvature_plan_view(self, s):
+        return 0 * s
+
+class Clothoid_solver_cache():
+    '''
+        Bounded LRU cache for clothoid solver results. The solver always runs
+        on the exact input, the inputs quantized with the configured
+        tolerances are only used as cache key. A hit for an input differing
+        from the cached one by less than the tolerances reaches the requested
+        end point within the point tolerance.
+    '''
+
+    def __init__(self, max_size=512, tolerance_point=1e-4, tolerance_heading=1e-6,
+                 tolerance_curvature=1e-8):
+        self.max_size = max_size
+        self.tolerance_point = tolerance_point
+        self.tolerance_heading = tolerance_heading
+        self.tolerance_curvature = tolerance_curvature
+        self.solutions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_size=None, tolerance_point=None, tolerance_heading=None,
+                  tolerance_curvature=None):
+        '''
+            Change cache size and quantization tolerances. Changing a
+            tolerance invalidates all cached solutions.
+        '''
+        if max_size is not None:
+            self.max_size = max_size
+        if tolerance_point is not None:
+            self.tolerance_point = tolerance_point
+            self.solutions.clear()
+        if tolerance_heading is not None:
+            self.tolerance_heading = tolerance_heading
+            self.solutions.clear()
+        if tolerance_curvature is not None:
+            self.tolerance_curvature = tolerance_curvature
+            self.solutions.clear()
+        while len(self.solutions) > self.max_size:
+            self.solutions.popitem(last=False)
+
+    def clear(self):
+        '''
+            Remove all cached solutions and reset the statistics.
+        '''
+        self.solutions.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get_statistics(self):
+        '''
+            Return dictionary with hit and miss counts, hit rate and size.
+        '''
+        num_requests = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / num_requests if num_requests > 0 else 0.0,
+                'size': len(self.solutions),
+                'max_size': self.max_size,}
+
+    def solve(self, geometry_solver, point_end_local, heading_end_local, curvature_start):
+        '''
+            Return the clothoid from the local origin to the local end point
+            either with given end heading (hermite) or given start curvature
+            (forward).
+        '''
+        if geometry_solver == 'forward':
+            # The end heading is a result of the forward solution
+            key = ('forward',
+                   round(point_end_local[0] / self.tolerance_point),
+                   round(point_end_local[1] / self.tolerance_point),
+                   0,
+                   round(curvature_start / self.tolerance_curvature))
+        else:
+            # The start curvature is a result of the hermite solution
+            key = ('hermite',
+                   round(point_end_local[0] / self.tolerance_point),
+                   round(point_end_local[1] / self.tolerance_point),
+                   round(heading_end_local / self.tolerance_heading),
+                   0)
+        solution = self.solutions.get(key)
+        if solution is not None:
+            self.hits += 1
+            self.solutions.move_to_end(key)
+            return solution
+        self.misses += 1
+        x_end = float(point_end_local[0])
+        y_end = float(point_end_local[1])
+        if geometry_solver == 'forward':
+            solution = Clothoid.Forward(0, 0, 0, curvature_start, x_end, y_end)
+        else:
+            solution = Clothoid.G1Hermite(0, 0, 0, x_end, y_end, heading_end_local)
+        self.solutions[key] = solution
+        if len(self.solutions) > self.max_size:
+            self.solutions.popitem(last=False)
+        return solution
+
+# Shared by all clothoid geometries, configure with clothoid_solver_cache.configure()
+clothoid_solver_cache = Clothoid_solver_cache()
+
+class Geometry_clothoid(Geometry):
+
+    def update_plan_view(self, params, geometry_solver='default'):
+        # Calculate transform between global and local coordinates
+        self.update_local_to_global(params['point_start'], params['heading_start'],
+            params['point_end'], params['heading_end'])
+
+        # Calculate geometry
+        if geometry_solver == 'hermite' or geometry_solver == 'default':
+            self.geometry_base = clothoid_solver_cache.solve('hermite',
+                self.point_end_local, self.heading_end_local, 0)
+
+            # When the heading of start and end point is colinear the curvature
+            # becomes very small and the length becomes huge (solution is a gigantic
+            # circle). Therefore as a workaround we limit the length to 10 km.
+            if self.geometry_base.length < 10000.0:
+                self.params['valid'] = True
+            else:
+                # Use old parameters
+                self.update_local_to_global(self.params['point_start'], self.params['heading_start'],
+                    self.params['point_end'], self.params['heading_end'])
+                self.geometry_base = clothoid_solver_cache.solve('hermite',
+                    self.point_end_local, self.heading_end_local, 0)
+                self.params['valid'] = False
+        elif geometry_solver == 'forward':
+            self.geometry_base = clothoid_solver_cache.solve('forward',
+                self.point_end_local, self.heading_end_local, params['curvature_start'])
+            # Check for a valid solution based on the length
+            if self.geometry_base.length > 0.0:
+                self.params['valid'] = True
+            else:
+                # Use old parameters
+                self.update_local_to_global(self.params['point_start'], self.params['heading_start'],
+                    self.params['point_end'], self.params['heading_end'])
+                self.geometry_base = clothoid_solver_cache.solve('forward',
+                    self.point_end_local, self.heading_end_local, self.params['curvature_start'])
+                self.params['valid'] = False
+
+        # Remember geometry parameters
+        if self.params['valid']:
+            self.params['curve'] = 'spiral'
+            self.params['point_start'] = params['point_start']
+            self.params['heading_start'] = params['heading_start']
+            self.params['point_end'] = params['point_end']
+            self.params['heading_end'] = params['heading_start'] + self.geometry_base.ThetaEnd
+            self.params['length'] = self.geometry_base.length
+            self.params['curvature_start'] = self.geometry_base.KappaStart
+            self.params['curvature_end'] = self.geometry_base.KappaEnd
+            self.params['angle_end'] = self.geometry_base.ThetaEnd
+
+    def set_plan_view(self):
+        length = self.params['length']
+        if length > 0.0:
+            dk = (self.params['curvature_end'] - self.params['curvature_start']) / length
+        else:
+            # Start and end point coincide, the clothoid degenerates to a point
+            dk = 0.0
+        self.geometry_base = clothoid.Clothoid_curve(self.params['curvature_start'], dk, length)
+
+    def sample_plan_view(self, s):
+        x_s = self.geometry_base.X(s)
+        y_s = self.geometry_base.Y(s)
+        curvature = self.geometry_base.KappaStart + self.geometry_base.dk * s
+        hdg_t = self.geometry_base.Theta(s) + pi/2
+        return x_s, y_s, curvature, hdg_t
+
+    def sample_plan_view_batch(self, s):
+        # Evaluate all samples at once with Fresnel integrals instead of
+        # calling pyclothoids for each sample
+        x_s, y_s, theta = clothoid.clothoid_xy_theta(s,
+            self.geometry_base.KappaStart, self.geometry_base.dk)
+        curvature = self.get_curvature_plan_view(s)
+        hdg_t = theta + pi/2
+        return x_s, y_s, curvature, hdg_t
+
+    def get_curvature_plan_view(self, s):
+        return self.geometry_base.KappaStart + self.geometry_base.dk * s
+
+class Arc():
+
+    def __init__(self, point_end):
+        valid, self.radius, self.angle, self.determinant = \
+            self.get_radius_angle_det(np.zeros(3), point_end)
+        if valid:
+            if self.determinant > 0:
+                self.offset_angle = 0
+                self.curvature = 1/self.radius
+                self.offset_y = self.radius
+                if self.angle < 0:
+                    # Limit angle to 180 degrees
+                    self.heading_end  = pi
+                    self.angle = pi
+                else:
+                    self.heading_end  = self.angle
+            else:
+                self.offset_angle = pi
+                self.curvature = -1/self.radius
+                self.offset_y = -self.radius
+                if self.angle > 0:
+                    # Limit angle to 180 degrees
+                    self.heading_end = pi
+                    self.angle = -pi
+                else:
+                    self.heading_end = self.angle
+            self.length = self.radius * abs(self.angle)
+        else:
+            self.radius = inf
+            self.curvature = 0
+            self.offset_y = self.radius
+            self.angle = 0
+            self.offset_angle = 0
+            self.heading_end = 0
+            self.length = float(np.linalg.norm(point_end))
+
+
+    def get_radius_angle_det(self, point_start, point_end):
+        '''
+            Calculate center and radius of the arc that is defined by the
+            starting point (predecessor connecting point), the start heading
+            (heading of the connected road) and the end point. Also return
+            determinant that tells us if point end is left or right of heading
+            direction.
+        '''
+        # The center of the arc is the crossing point of line orthogonal to the
+        # predecessor road in the connecting point and the perpendicular
+        # bisector of the connection between start and end point.
+        p = point_start[0:2]
+        a = np.array([0.0, 1.0])
+        q = 0.5 * (point_start + point_end)[0:2]
+        b_normal = (point_start - point_end)
+        b = np.array([-b_normal[1], b_normal[0]])
+        if orthogonal(a) @ b != 0:
+            # See https://mathepedia.de/Schnittpunkt.html for crossing point equation
+            center = 1 / (a @ orthogonal(b)) * ((q @ orthogonal(b)) * a - (p @ orthogonal(a)) * b)
+            radius = float(np.linalg.norm(center - p))
+            # Calculate determinant to know where to start drawing the arc {0, pi}
+            vector_start_end = (point_end - point_start)[0:2]
+            determinant = float(vector_start_end[1])
+            angle = angle_signed(point_end[0:2] - center, point_start[0:2] - center)
+            return True, radius, angle, determinant
+        else:
+            return False, 0, 0, 0
+
+class Geometry_arc(Geometry):
+
+    def update_plan_view(self, params, geometry_solver):
+        # Calculate transform between global and local coordinates
+        self.update_local_to_global(params['point_start'], params['heading_start'],
+            params['point_end'], params['heading_end'])
+
+        # Transform end point to local coordinates, constrain and transform back
+        if self.point_end_local[0] < 0:
+            self.point_end_local[0] = 0
+        point_end_global = transform_point(self.matrix_world, self.point_end_local)
+
+        # Calculate geometry
+        self.geometry_base = Arc(self.point_end_local)
+
+        # Remember geometry parameters
+        self.params['curve'] = 'arc'
+        self.params['point_start'] = params['point_start']
+        self.params['heading_start'] = params['heading_start']
+        self.params['point_end'] = point_end_global
+        self.params['heading_end'] = params['heading_start'] + self.geometry_base.heading_end
+        self.params['curvature_start'] = self.geometry_base.curvature
+        self.params['curvature_end'] = self.geometry_base.curvature
+        self.params['length'] = self.geometry_base.length
+
+    def set_plan_view(self):
+        self.geometry_base = Arc(self.point_end_local)
+
+    def sample_plan_view(self, s):
+        if self.geometry_base.radius == inf:
+            # Circle degenerates into a straight line
+            x_s = s
+            y_s = 0
+            hdg_t = pi/2
+        else:
+            # We have a circle
+            angle_s = s / self.geometry_base.radius
+            if self.geometry_base.determinant > 0:
+                x_s = cos(angle_s + self.geometry_base.offset_angle - pi/2) \
+                        * self.geometry_base.radius
+                y_s = sin(angle_s + self.geometry_base.offset_angle - pi/2) \
+                        * self.geometry_base.radius + self.geometry_base.offset_y
+                hdg_t = angle_s + pi/2
+            else:
+                x_s = cos(-angle_s + self.geometry_base.offset_angle - pi/2) \
+                        * self.geometry_base.radius
+                y_s = sin(-angle_s + self.geometry_base.offset_angle - pi/2) \
+                        * self.geometry_base.radius + self.geometry_base.offset_y
+                hdg_t = -angle_s + pi/2
+        curvature = self.geometry_base.curvature
+        return x_s, y_s, curvature, hdg_t
+
+    def sample_plan_view_batch(self, s):
+        s = np.asarray(s, dtype=float)
+        if self.geometry_base.radius == inf:
+            # Circle degenerates into a straight line
+            x_s = s.copy()
+            y_s = np.zeros_like(s)
+            hdg_t = np.full_like(s, pi/2)
+        else:
+            # We have a circle
+            angle_s = s / self.geometry_base.radius
+            if self.geometry_base.determinant <= 0:
+                angle_s = -angle_s
+            x_s = np.cos(angle_s + self.geometry_base.offset_angle - pi/2) \
+                    * self.geometry_base.radius
+            y_s = np.sin(angle_s + self.geometry_base.offset_angle - pi/2) \
+                    * self.geometry_base.radius + self.geometry_base.offset_y
+            hdg_t = angle_s + pi/2
+        curvature = np.full_like(s, self.geometry_base.curvature)
+        return x_s, y_s, curvature, hdg_t
+
+    def get_curvature_plan_view(self, s):
+        return self.geometry_base.curvature + 0 * s
+
+
+class Plan_view_cache():
+    '''
+        Cache of reference line samples (x, y, heading, curvature, elevation)
+        of one geometry keyed by s. Only valid while the geometry does not
+        change, e.g. during one mesh build or while only the lanes of a road
+        are edited. Cached values are exactly the ones of the geometry since
+        they are computed with the same batch functions.
+    '''
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        self.clear()
+
+    def clear(self):
+        # Sorted s values and one column of samples per s value
+        self.s = np.empty(0)
+        self.samples = np.empty((6, 0))
+        self.hits = 0
+        self.misses = 0
+
+    def get_statistics(self):
+        return {'size': len(self.s), 'hits': self.hits, 'misses': self.misses}
+
+    def sample(self, s):
+        '''
+            Return arrays x(s), y(s), hdg_t(s), plan view curvature(s),
+            height(s) and vertical curvature(s) for an array of s values.
+            Only s values not seen before are evaluated.
+        '''
+        s = np.atleast_1d(np.asarray(s, dtype=float))
+        idx = np.searchsorted(self.s, s)
+        hit = idx < len(self.s)
+        hit[hit] = self.s[idx[hit]] == s[hit]
+        num_hits = int(np.count_nonzero(hit))
+        self.hits += num_hits
+        self.misses += len(s) - num_hits
+        if num_hits < len(s):
+            s_new = np.unique(s[~hit])
+            x_s, y_s, curvature_plan_view, hdg_t = self.geometry.sample_plan_view_batch(s_new)
+            z, _, curvature_elevation = self.geometry.elevation_profile.evaluate(s_new)
+            samples_new = np.array(np.broadcast_arrays(x_s, y_s, hdg_t,
+                curvature_plan_view, z, curvature_elevation), dtype=float)
+            s_all = np.concatenate((self.s, s_new))
+            order = np.argsort(s_all, kind='stable')
+            self.s = s_all[order]
+            self.samples = np.concatenate((self.samples, samples_new), axis=1)[:, order]
+            idx = np.searchsorted(self.s, s)
+        return tuple(self.samples[:, idx])
+
+    def sample_cross_section_batch(self, s, t):
+        '''
+            Same as Geometry.sample_cross_section_batch using cached samples.
+        '''
+        x_s, y_s, hdg_t, curvature_plan_view, z, curvature_elevation = self.sample(s)
+        return get_cross_section_points(x_s, y_s, hdg_t, z, t), \
+            get_curvature_cross_section(curvature_plan_view, curvature_elevation)
+
+
+def get_geometry(curve):
+    '''
+        Return a new geometry object for the OpenDRIVE curve type.
+    '''
+    mapping_curve_geometry = {
+        'line': Geometry_line,
+        'arc': Geometry_arc,
+        'spiral': Geometry_clothoid,
+    }
+    return mapping_curve_geometry[curve]()
+
+
+def geometry_from_params(params):
+    '''
+        Return a geometry object restored from stored geometry parameters.
+    '''
+    geometry = get_geometry(params['curve'])
+    geometry.set_params(params)
+    return geometry
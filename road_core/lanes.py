@@ -0,0 +1,354 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from math import ceil
+import numpy as np
+
+
+class Lane():
+    '''
+        Plain lane description with the same attributes as the lane property
+        group of the Blender add-on.
+    '''
+
+    __slots__ = ('side', 'type', 'width', 'width_change', 'road_mark_type',
+                 'road_mark_weight', 'road_mark_width', 'road_mark_color', 'split_right')
+
+    def __init__(self, side='right', type='driving', width=4.0, width_change='none',
+                 road_mark_type='none', road_mark_weight='none', road_mark_width=0.12,
+                 road_mark_color='none', split_right=False):
+        self.side = side
+        self.type = type
+        self.width = width
+        self.width_change = width_change
+        self.road_mark_type = road_mark_type
+        self.road_mark_weight = road_mark_weight
+        self.road_mark_width = road_mark_width
+        self.road_mark_color = road_mark_color
+        self.split_right = split_right
+
+    @classmethod
+    def from_lane(cls, lane):
+        '''
+            Return a copy of any object with the lane attributes, e.g. a
+            Blender lane property group.
+        '''
+        return cls(**{name: getattr(lane, name) for name in cls.__slots__})
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def lanes_from_cross_section(params_cross_section):
+    '''
+        Return list of lanes from a cross section definition dictionary with
+        one list per lane attribute (see params_cross_section in properties).
+    '''
+    lanes = []
+    for idx in range(len(params_cross_section['sides'])):
+        lanes.append(Lane(side=params_cross_section['sides'][idx],
+                          type=params_cross_section['types'][idx],
+                          width=params_cross_section['widths'][idx],
+                          width_change=params_cross_section['widths_change'][idx],
+                          road_mark_type=params_cross_section['road_mark_types'][idx],
+                          road_mark_weight=params_cross_section['road_mark_weights'][idx],
+                          road_mark_width=params_cross_section['road_mark_widths'][idx],
+                          road_mark_color=params_cross_section['road_mark_colors'][idx]))
+    return lanes
+
+
+def get_width_road_mark(lane):
+    '''
+        Return the width of the road mark lines of a lane that lies on the
+        lane itself, i.e. half of the road mark.
+    '''
+    if lane.road_mark_type == 'none':
+        return 0.0
+    width_line = lane.road_mark_width
+    if lane.road_mark_type == 'solid_solid' or \
+        lane.road_mark_type == 'solid_broken' or \
+        lane.road_mark_type == 'broken_solid':
+            return width_line * 3.0 / 2.0
+    else:
+        return width_line / 2.0
+
+
+def get_width_road_left(lanes):
+    '''
+        Return the width of the left road side calculated by suming up all
+        lane widths.
+    '''
+    width_road_left = 0
+    for idx, lane in enumerate(lanes):
+        if idx == 0:
+            # If first lane has a line we need to add half its width
+            width_road_left += get_width_road_mark(lane)
+        # Stop when reaching the right side
+        if lane.side == 'right':
+            break
+        if lane.side == 'left':
+            width_road_left += lane.width
+    return width_road_left
+
+
+class Lane_layout():
+    '''
+        Cross section layout compiled once from a list of lanes. Each strip
+        border is t(s) = t_constant + t_open * p(s / length) + t_close * (1 - p(s / length))
+        where p(u) = 3u^2 - 2u^3 is the cubic width polynomial of opening
+        lanes and 1 - p the one of closing lanes. Keeping both separate makes
+        the width of tapered lanes exactly 0 at their ends.
+    '''
+
+    def __init__(self, lanes):
+        self.width_road_left = get_width_road_left(lanes)
+        self.strip_to_lane, self.strip_is_road_mark = get_strip_to_lane_mapping(lanes)
+        # Track constant, opening and closing part of t while walking through the lanes
+        t = np.array([self.width_road_left, 0.0, 0.0])
+        t_values = []
+        for idx_lane, lane in enumerate(lanes):
+            if lane.width_change == 'open':
+                lane_width = np.array([0.0, lane.width, 0.0])
+            elif lane.width_change == 'close':
+                lane_width = np.array([0.0, 0.0, lane.width])
+            else:
+                lane_width = np.array([lane.width, 0.0, 0.0])
+            # Add lane width for right side of road BEFORE (in t-direction) road mark lines
+            if lane.side == 'right':
+                width_lines_on_lane = get_width_road_mark(lanes[idx_lane - 1]) \
+                    + get_width_road_mark(lane)
+                t -= lane_width - (width_lines_on_lane, 0.0, 0.0)
+            # Add road mark lines
+            if lane.road_mark_type != 'none':
+                width_line = lane.road_mark_width
+                if lane.road_mark_type == 'solid_solid' or \
+                        lane.road_mark_type == 'solid_broken' or \
+                        lane.road_mark_type == 'broken_solid':
+                    num_lines = 3
+                else:
+                    num_lines = 1
+                for idx_line in range(num_lines + 1):
+                    t_values.append((t[0] - idx_line * width_line, t[1], t[2]))
+                t[0] -= num_lines * width_line
+            else:
+                t_values.append(tuple(t))
+            # Add lane width for left side of road AFTER (in t-direction) road mark lines
+            if lane.side == 'left':
+                width_lines_on_lane = get_width_road_mark(lane) \
+                    + get_width_road_mark(lanes[idx_lane + 1])
+                t -= lane_width - (width_lines_on_lane, 0.0, 0.0)
+        self.t_constants, self.t_open, self.t_close = np.array(t_values, dtype=float).reshape(-1, 3).T
+
+    def get_t_values(self, s, length):
+        '''
+            Return t values of all strip borders for a single s value (M,) or
+            an array of N s values (N, M) on a road of given length.
+        '''
+        s_norm = np.asarray(s, dtype=float) / length
+        p = (3.0 * s_norm**2 - 2.0 * s_norm**3)[..., np.newaxis]
+        return self.t_constants + self.t_open * p + self.t_close * (1.0 - p)
+
+    def get_t_abs_max(self, length):
+        '''
+            Return largest absolute t value of all strip borders.
+        '''
+        return float(np.max(np.abs(self.get_t_values(np.array([0.0, length]), length))))
+
+
+def get_strips_t_values(lanes, length, s):
+    '''
+        Return list of t values of strip borders at s for a road of given
+        length.
+    '''
+    return Lane_layout(lanes).get_t_values(s, length).tolist()
+
+
+def get_strips_s_boundaries(lanes, length, length_broken_line):
+    '''
+        Return list of tuples with a line marking toggle flag and a list
+        with the start and stop values of the faces in each strip.
+    '''
+    # Calculate line parameters
+    # TODO offset must be provided by predecessor road for each marking
+    offset = 0.5
+    if offset < length_broken_line:
+        offset_first = offset
+        line_toggle_start = True
+    else:
+        offset_first = offset % length_broken_line
+        line_toggle_start = False
+    s_values = []
+
+    for lane in lanes:
+        # Calculate broken line parameters
+        if lane.road_mark_type == 'broken':
+            num_faces_strip_line = ceil((length \
+                                    - (length_broken_line - offset_first)) \
+                                   / length_broken_line)
+            # Add one extra step for the shorter first piece
+            if offset_first > 0:
+                num_faces_strip_line += 1
+            length_first = min(length, length_broken_line - offset_first)
+            if num_faces_strip_line > 1:
+                length_last = length - length_first - (num_faces_strip_line - 2) * length_broken_line
+            else:
+                length_last = length_first
+        else:
+            num_faces_strip_line = 1
+
+        # Go in s direction along lane and calculate the start and stop values
+        # ASPHALT
+        if lane.side == 'right':
+            s_values.append((line_toggle_start, [0, length]))
+        # ROAD MARK
+        if lane.road_mark_type != 'none':
+            s_values_strip = [0]
+            for idx_face_strip in range(num_faces_strip_line):
+                # Calculate end points of the faces
+                s_stop = length
+                if lane.road_mark_type == 'broken':
+                    if idx_face_strip == 0:
+                        # First piece
+                        s_stop = length_first
+                    elif idx_face_strip > 0 and idx_face_strip + 1 == num_faces_strip_line:
+                        # Last piece and more than one piece
+                        s_stop = length_first + (idx_face_strip - 1) * length_broken_line \
+                                + length_last
+                    else:
+                        # Middle piece
+                        s_stop = length_first + idx_face_strip * length_broken_line
+                s_values_strip.append(s_stop)
+            if lane.road_mark_type == 'solid_solid':
+                s_values.append((line_toggle_start, s_values_strip))
+                s_values.append((line_toggle_start, s_values_strip))
+            s_values.append((line_toggle_start, s_values_strip))
+        # ASPHALT
+        if lane.side == 'left':
+            s_values.append((line_toggle_start, [0, length]))
+    return s_values
+
+
+def get_strips_s_boundaries_merged(lanes, strips_s_boundaries):
+    '''
+        Return strip face boundaries with the dashes of broken lines merged
+        into a single asphalt face, used for coarse levels of detail.
+    '''
+    strip_to_lane, strip_is_road_mark = get_strip_to_lane_mapping(lanes)
+    s_values = []
+    for idx_strip, (line_toggle, s_values_strip) in enumerate(strips_s_boundaries):
+        if strip_is_road_mark[idx_strip] and \
+                lanes[strip_to_lane[idx_strip]].road_mark_type == 'broken':
+            # A broken line starting with a gap is asphalt
+            s_values.append((False, [s_values_strip[0], s_values_strip[-1]]))
+        else:
+            s_values.append((line_toggle, s_values_strip))
+    return s_values
+
+
+def get_strip_to_lane_mapping(lanes):
+    '''
+        Return list of lane indices for strip indices.
+    '''
+    strip_to_lane = []
+    strip_is_road_mark = []
+    for idx_lane, lane in enumerate(lanes):
+        if lane.side == 'left':
+            if lane.road_mark_type != 'none':
+                if lane.road_mark_type == 'solid' or \
+                    lane.road_mark_type == 'broken':
+                    strip_to_lane.append(idx_lane)
+                    strip_is_road_mark.append(True)
+                else:
+                    # Double line
+                    strip_to_lane.append(idx_lane)
+                    strip_to_lane.append(idx_lane)
+                    strip_to_lane.append(idx_lane)
+                    strip_is_road_mark.append(True)
+                    strip_is_road_mark.append(False)
+                    strip_is_road_mark.append(True)
+            strip_to_lane.append(idx_lane)
+            strip_is_road_mark.append(False)
+        elif lane.side == 'center':
+            if lane.road_mark_type != 'none':
+                strip_to_lane.append(idx_lane)
+                strip_is_road_mark.append(True)
+        else:
+            # lane.side == 'right'
+            strip_to_lane.append(idx_lane)
+            strip_is_road_mark.append(False)
+            if lane.road_mark_type != 'none':
+                if lane.road_mark_type == 'solid' or \
+                    lane.road_mark_type == 'broken':
+                    strip_to_lane.append(idx_lane)
+                    strip_is_road_mark.append(True)
+                else:
+                    # Double line
+                    strip_to_lane.append(idx_lane)
+                    strip_to_lane.append(idx_lane)
+                    strip_to_lane.append(idx_lane)
+                    strip_is_road_mark.append(True)
+                    strip_is_road_mark.append(False)
+                    strip_is_road_mark.append(True)
+    return strip_to_lane, strip_is_road_mark
+
+
+def get_road_mark_material(color):
+    '''
+        Return material name for road mark color.
+    '''
+    mapping_color_material = {
+        'white': 'road_mark_white',
+        'yellow': 'road_mark_yellow',
+    }
+    return mapping_color_material[color]
+
+
+def get_face_materials(lanes, strips_s_boundaries):
+    '''
+        Return dictionary with index of faces for each material.
+    '''
+    materials = {'asphalt': [], 'road_mark_white': [], 'road_mark_yellow': [], 'grass': []}
+    idx_face = 0
+    strip_to_lane, strip_is_road_mark = get_strip_to_lane_mapping(lanes)
+    for idx_strip in range(len(strips_s_boundaries)):
+        idx_lane = strip_to_lane[idx_strip]
+        if strip_is_road_mark[idx_strip]:
+            line_toggle = strips_s_boundaries[idx_strip][0]
+            num_faces = int(len(strips_s_boundaries[idx_strip][1]) - 1)
+            material = get_road_mark_material(lanes[idx_lane].road_mark_color)
+            # Step through faces of a road mark strip
+            for idx in range(num_faces):
+                # Determine material
+                if lanes[idx_lane].road_mark_type == 'solid' or \
+                    lanes[idx_lane].road_mark_type == 'solid_solid':
+                    # Both lines of a double line are separate strips
+                    materials[material].append(idx_face)
+                    idx_face += 1
+                elif lanes[idx_lane].road_mark_type == 'broken':
+                    if line_toggle:
+                        materials[material].append(idx_face)
+                        line_toggle = False
+                    else:
+                        materials['asphalt'].append(idx_face)
+                        line_toggle = True
+                    idx_face += 1
+        else:
+            if lanes[idx_lane].type == 'median':
+                materials['grass'].append(idx_face)
+            elif lanes[idx_lane].type == 'shoulder':
+                materials['grass'].append(idx_face)
+            else:
+                materials['asphalt'].append(idx_face)
+            idx_face += 1
+
+    return materials
@@ -0,0 +1,69 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Placement of the dashes of broken road marks as instances of one dash mesh
+from math import pi
+import numpy as np
+
+from .lanes import Lane_layout, get_strips_s_boundaries
+
+# Dashes are lifted slightly above the road surface to avoid z-fighting
+HEIGHT_DASH = 0.002
+
+
+def get_dash_intervals(lanes, strips_s_boundaries):
+    '''
+        Return list of tuples with the strip index, road mark color and the
+        start and end s values of the dashes of each broken road mark strip.
+    '''
+    lane_layout = Lane_layout(lanes)
+    dash_intervals = []
+    for idx_strip, (line_toggle, s_values_strip) in enumerate(strips_s_boundaries):
+        lane = lanes[lane_layout.strip_to_lane[idx_strip]]
+        if not lane_layout.strip_is_road_mark[idx_strip] or lane.road_mark_type != 'broken':
+            continue
+        s_values_strip = np.array(s_values_strip, dtype=float)
+        # Faces alternate between dash and gap, the first one is a dash if toggled
+        is_dash = (np.arange(len(s_values_strip) - 1) % 2 == 0) == line_toggle
+        dash_intervals.append((idx_strip, lane.road_mark_color,
+            s_values_strip[:-1][is_dash], s_values_strip[1:][is_dash]))
+    return dash_intervals
+
+
+def get_dash_placements(geometry, lanes, length_broken_line):
+    '''
+        Return dictionary with the dash placements of all broken road marks
+        for each road mark color. A placement consists of the dash centers
+        (N, 3) in local coordinates, the heading (N,) and pitch (N,) of the
+        dashes in the local frame and their length (N,) and width (N,).
+    '''
+    length = geometry.params['length']
+    strips_s_boundaries = get_strips_s_boundaries(lanes, length, length_broken_line)
+    lane_layout = Lane_layout(lanes)
+    placements = {}
+    for idx_strip, color, s_start, s_end in get_dash_intervals(lanes, strips_s_boundaries):
+        s_mid = 0.5 * (s_start + s_end)
+        t_values = lane_layout.get_t_values(s_mid, length)
+        t_left = t_values[:, idx_strip]
+        t_right = t_values[:, idx_strip + 1]
+        xyz, _ = geometry.sample_cross_section_batch(s_mid,
+            (0.5 * (t_left + t_right))[:, np.newaxis])
+        xyz = xyz[:, 0, :]
+        xyz[:, 2] += HEIGHT_DASH
+        _, _, _, hdg_t = geometry.sample_plan_view_batch(s_mid)
+        _, slope, _ = geometry.elevation_profile.evaluate(s_mid)
+        placement = (xyz, hdg_t - pi / 2, np.arctan(slope), s_end - s_start, t_left - t_right)
+        if color in placements:
+            placement = tuple(np.concatenate((a, b)) for a, b in zip(placements[color], placement))
+        placements[color] = placement
+    return placements
@@ -0,0 +1,267 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Connectivity graph of a road network. Elements (roads and junctions) are
+# identified by their OpenDRIVE ID. Each element declares its own links, the
+# graph is the union of the links declared by all elements so that it does
+# not matter which side of a link has been written.
+from collections import deque
+import heapq
+
+CONTACTS_ROAD = ('start', 'end')
+
+
+def get_contact(cp_type):
+    '''
+        Return road contact ('start' or 'end') of a connecting point type,
+        None for junction connecting points or unknown types.
+    '''
+    if cp_type is None:
+        return None
+    if cp_type.startswith('cp_start'):
+        return 'start'
+    if cp_type.startswith('cp_end'):
+        return 'end'
+    return None
+
+
+class Road_network_graph():
+    '''
+        Adjacency structure over roads and junctions answering connected
+        component, dangling endpoint and shortest path queries. Elements are
+        only replaced when set again with a different version.
+    '''
+
+    def __init__(self):
+        self.elements = {}
+        self.adjacency = {}
+        self.components = None
+
+    def set_element(self, id_element, element_type, links, length=0.0, version=None):
+        '''
+            Add or replace an element and return True if the graph changed.
+            Links are tuples (contact, id_other, contact_other), contacts are
+            'start', 'end' or None for junctions and unknown contacts.
+        '''
+        element = self.elements.get(id_element)
+        if element is not None and version is not None and element['version'] == version:
+            return False
+        if element is not None:
+            self.remove_links(id_element, element['links'])
+        links = [tuple(link) for link in links]
+        self.elements[id_element] = {
+            'type': element_type,
+            'links': links,
+            'length': length,
+            'version': version,
+        }
+        self.adjacency.setdefault(id_element, {})
+        self.add_links(id_element, links)
+        self.components = None
+        return True
+
+    def remove_element(self, id_element):
+        '''
+            Remove element and the links it declared if present.
+        '''
+        element = self.elements.pop(id_element, None)
+        if element is None:
+            return
+        self.remove_links(id_element, element['links'])
+        if not self.adjacency.get(id_element):
+            self.adjacency.pop(id_element, None)
+        self.components = None
+
+    def clear(self):
+        self.elements.clear()
+        self.adjacency.clear()
+        self.components = None
+
+    def add_links(self, id_element, links):
+        '''
+            Count the links symmetrically, an edge exists as long as at least
+            one element declares it.
+        '''
+        for _, id_other, _ in links:
+            if id_other == id_element:
+                continue
+            neighbors = self.adjacency.setdefault(id_element, {})
+            neighbors[id_other] = neighbors.get(id_other, 0) + 1
+            neighbors = self.adjacency.setdefault(id_other, {})
+            neighbors[id_element] = neighbors.get(id_element, 0) + 1
+
+    def remove_links(self, id_element, links):
+        for _, id_other, _ in links:
+            if id_other == id_element:
+                continue
+            for id_a, id_b in [(id_element, id_other), (id_other, id_element)]:
+                neighbors = self.adjacency[id_a]
+                neighbors[id_b] -= 1
+                if neighbors[id_b] == 0:
+                    del neighbors[id_b]
+            # Drop entries of undeclared elements without any links left
+            if id_other not in self.elements and not self.adjacency[id_other]:
+                del self.adjacency[id_other]
+
+    def get_neighbors(self, id_element):
+        '''
+            Return set of IDs of the elements linked with the element.
+        '''
+        return set(self.adjacency.get(id_element, {}).keys())
+
+    def get_connected_components(self):
+        '''
+            Return list of sets of element IDs, one for each connected part of
+            the network. Only elements which have been set are included.
+        '''
+        if self.components is None:
+            self.components = []
+            visited = set()
+            for id_start in self.elements:
+                if id_start in visited:
+                    continue
+                component = set()
+                queue = deque([id_start])
+                visited.add(id_start)
+                while queue:
+                    id_element = queue.popleft()
+                    component.add(id_element)
+                    for id_other in self.adjacency.get(id_element, {}):
+                        # Links to removed elements do not connect anything
+                        if id_other not in visited and id_other in self.elements:
+                            visited.add(id_other)
+                            queue.append(id_other)
+                self.components.append(component)
+        return self.components
+
+    def get_component(self, id_element):
+        '''
+            Return set of element IDs connected with the element.
+        '''
+        for component in self.get_connected_components():
+            if id_element in component:
+                return component
+        return set()
+
+    def get_endpoint_links(self):
+        '''
+            Return dictionary mapping road endpoints (id, contact) to the set
+            of elements they are linked with, taking links declared by both
+            sides into account.
+        '''
+        endpoint_links = {}
+        for id_element, element in self.elements.items():
+            if element['type'] == 'road':
+                for contact in CONTACTS_ROAD:
+                    endpoint_links.setdefault((id_element, contact), set())
+            for contact, id_other, contact_other in element['links']:
+                if element['type'] == 'road' and contact is not None:
+                    endpoint_links[(id_element, contact)].add(id_other)
+                other = self.elements.get(id_other)
+                if other is not None and other['type'] == 'road' and contact_other is not None:
+                    endpoint_links.setdefault((id_other, contact_other), set()).add(id_element)
+        return endpoint_links
+
+    def get_dangling_endpoints(self):
+        '''
+            Return sorted list of road endpoints (id, contact) which are not
+            linked with any existing element.
+        '''
+        dangling = []
+        for endpoint, ids_other in self.get_endpoint_links().items():
+            if endpoint[0] not in self.elements:
+                continue
+            if not any(id_other in self.elements for id_other in ids_other):
+                dangling.append(endpoint)
+        return sorted(dangling, key=lambda endpoint: (str(endpoint[0]), endpoint[1]))
+
+    def get_shortest_path(self, id_start, id_end):
+        '''
+            Return list of element IDs on the shortest path between two
+            elements and its length, (None, inf) if they are not connected.
+            Roads are only traversed from one end to the other, all roads
+            linked with a junction are connected with each other.
+        '''
+        if id_start not in self.elements or id_end not in self.elements:
+            return None, float('inf')
+        if id_start == id_end:
+            return [id_start], 0.0
+        # Nodes are road endpoints (id, contact) and junctions (id, None)
+        edges = {}
+        def add_edge(node_a, node_b, cost):
+            edges.setdefault(node_a, []).append((node_b, cost))
+            edges.setdefault(node_b, []).append((node_a, cost))
+        for id_element, element in self.elements.items():
+            if element['type'] == 'road':
+                add_edge((id_element, 'start'), (id_element, 'end'), element['length'])
+        for (id_element, contact), ids_other in self.get_endpoint_links().items():
+            for id_other in ids_other:
+                other = self.elements.get(id_other)
+                if other is None:
+                    continue
+                if other['type'] == 'road':
+                    for contact_other in self.get_contacts_linked(id_other, id_element):
+                        add_edge((id_element, contact), (id_other, contact_other), 0.0)
+                else:
+                    add_edge((id_element, contact), (id_other, None), 0.0)
+
+        def get_nodes(id_element):
+            if self.elements[id_element]['type'] == 'road':
+                return [(id_element, contact) for contact in CONTACTS_ROAD]
+            return [(id_element, None)]
+        # Starting at either end of the first road, its length is not counted
+        costs = {}
+        predecessors = {}
+        heap = []
+        for node in get_nodes(id_start):
+            costs[node] = 0.0
+            predecessors[node] = None
+            heapq.heappush(heap, (0.0, str(node), node))
+        nodes_end = set(get_nodes(id_end))
+        node_found = None
+        while heap:
+            cost, _, node = heapq.heappop(heap)
+            if cost > costs[node]:
+                continue
+            if node in nodes_end:
+                node_found = node
+                break
+            for node_next, cost_edge in edges.get(node, []):
+                cost_next = cost + cost_edge
+                if cost_next < costs.get(node_next, float('inf')):
+                    costs[node_next] = cost_next
+                    predecessors[node_next] = node
+                    heapq.heappush(heap, (cost_next, str(node_next), node_next))
+        if node_found is None:
+            return None, float('inf')
+        path = []
+        node = node_found
+        while node is not None:
+            if not path or path[-1] != node[0]:
+                path.append(node[0])
+            node = predecessors[node]
+        return path[::-1], costs[node_found]
+
+    def get_contacts_linked(self, id_road, id_other):
+        '''
+            Return set of contacts of a road which are linked with the other
+            element.
+        '''
+        contacts = set()
+        for contact, id_linked, _ in self.elements[id_road]['links']:
+            if id_linked == id_other and contact is not None:
+                contacts.add(contact)
+        for contact, id_linked, contact_other in self.elements[id_other]['links']:
+            if id_linked == id_road and contact_other is not None:
+                contacts.add(contact_other)
+        return contacts
@@ -0,0 +1,215 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Compact binary record of the geometry and lane parameters of a road. The
+# record is stored as one bytes custom property per road object and decoded in
+# one pass. All strings are stored once in a table and referenced by index.
+import struct
+
+import numpy as np
+
+MAGIC = b'DSCR'
+# Version 2 adds the road mark widths
+VERSION = 2
+
+# Little endian: magic, version, number of strings
+FORMAT_HEADER = '<4sHH'
+# Curve (string index), valid, number of extra geometry values, number of
+# elevation records, number of left and right lanes, road split type (string
+# index) and lane index, center lane road mark type, weight and color (string
+# indices)
+FORMAT_COUNTS = '<HBHHHHHhHHH'
+# Scalar geometry parameters always present
+KEYS_GEOMETRY = ['length', 'heading_start', 'curvature_start', 'slope_start',
+                 'heading_end', 'curvature_end', 'slope_end']
+KEYS_ELEVATION = ['s', 'a', 'b', 'c', 'd']
+# Per lane string parameters, stored as string indices
+KEYS_LANE_STRINGS = ['widths_change', 'types', 'road_mark_types', 'road_mark_weights',
+                     'road_mark_colors']
+# Road mark widths by weight for records and properties without widths, same
+# as the defaults of the road properties
+ROAD_MARK_WIDTHS = {'none': 0.0, 'standard': 0.12, 'bold': 0.25}
+
+
+class Road_record():
+    '''
+        Geometry and lane parameters of a road with packing to and unpacking
+        from the binary record format. The lane parameters are named like
+        the custom properties they replace.
+    '''
+
+    __slots__ = ('geometry',
+                 'lanes_left_num', 'lanes_right_num',
+                 'lanes_left_widths', 'lanes_left_widths_change', 'lanes_left_types',
+                 'lanes_left_road_mark_types', 'lanes_left_road_mark_weights',
+                 'lanes_left_road_mark_colors', 'lanes_left_road_mark_widths',
+                 'lanes_right_widths', 'lanes_right_widths_change', 'lanes_right_types',
+                 'lanes_right_road_mark_types', 'lanes_right_road_mark_weights',
+                 'lanes_right_road_mark_colors', 'lanes_right_road_mark_widths',
+                 'lane_center_road_mark_type', 'lane_center_road_mark_weight',
+                 'lane_center_road_mark_color', 'lane_center_road_mark_width',
+                 'road_split_type', 'road_split_lane_idx')
+
+    def __init__(self, geometry, params):
+        '''
+            Create record from geometry parameters and a dictionary with the
+            lane parameters. Missing road mark widths are derived from the
+            road mark weights.
+        '''
+        self.geometry = dict(geometry)
+        for name in self.__slots__[1:]:
+            if name.endswith('road_mark_widths') and name not in params:
+                value = [ROAD_MARK_WIDTHS.get(weight, 0.0)
+                    for weight in params[name.replace('widths', 'weights')]]
+            elif name == 'lane_center_road_mark_width' and name not in params:
+                value = ROAD_MARK_WIDTHS.get(''.join(params['lane_center_road_mark_weight']), 0.0)
+            else:
+                value = params[name]
+            if isinstance(value, (list, tuple)) and not name.startswith('lanes_'):
+                # Unset center lane parameters
+                value = ''.join(value)
+            if name.startswith('lanes_') and not name.endswith('_num'):
+                value = list(value)
+            setattr(self, name, value)
+
+    def get_params(self):
+        '''
+            Return dictionary with the lane parameters.
+        '''
+        return {name: getattr(self, name) for name in self.__slots__[1:]}
+
+    def get_width_road_sides(self):
+        '''
+            Return the width of the left and right road side.
+        '''
+        return sum(self.lanes_left_widths), sum(self.lanes_right_widths)
+
+    def pack(self):
+        '''
+            Return the record as bytes.
+        '''
+        strings = []
+        indices = {}
+        def get_index(string):
+            string = str(string)
+            if string not in indices:
+                indices[string] = len(strings)
+                strings.append(string)
+            return indices[string]
+
+        geometry = self.geometry
+        keys_extra = sorted(key for key, value in geometry.items()
+            if key not in KEYS_GEOMETRY and isinstance(value, (int, float))
+            and not isinstance(value, bool))
+        elevation = np.array([[record[key] for key in KEYS_ELEVATION]
+            for record in geometry['elevation']], dtype='<f8').reshape(-1, 5)
+        counts = struct.pack(FORMAT_COUNTS,
+            get_index(geometry['curve']), bool(geometry.get('valid', True)),
+            len(keys_extra), len(elevation),
+            len(self.lanes_left_widths), len(self.lanes_right_widths),
+            get_index(self.road_split_type), self.road_split_lane_idx,
+            get_index(self.lane_center_road_mark_type),
+            get_index(self.lane_center_road_mark_weight),
+            get_index(self.lane_center_road_mark_color))
+        values = np.concatenate((
+            np.asarray(geometry['point_start'], dtype=float).ravel()[0:3],
+            np.asarray(geometry['point_end'], dtype=float).ravel()[0:3],
+            [geometry[key] for key in KEYS_GEOMETRY],
+            [geometry[key] for key in keys_extra],
+            elevation.ravel(),
+            self.lanes_left_widths,
+            self.lanes_right_widths,
+            self.lanes_left_road_mark_widths,
+            self.lanes_right_road_mark_widths,
+            [self.lane_center_road_mark_width],
+        )).astype('<f8')
+        index_extra = np.array([get_index(key) for key in keys_extra], dtype='<u2')
+        index_lanes = np.array([get_index(value) for side in ['left', 'right']
+            for key in KEYS_LANE_STRINGS for value in getattr(self, 'lanes_' + side + '_' + key)],
+            dtype='<u2')
+        # The lane number properties are stored separately from the list lengths
+        lanes_num = struct.pack('<HH', self.lanes_left_num, self.lanes_right_num)
+        strings_encoded = [string.encode('utf-8') for string in strings]
+        header = struct.pack(FORMAT_HEADER, MAGIC, VERSION, len(strings))
+        lengths = np.array([len(string) for string in strings_encoded], dtype='<u2')
+        return b''.join([header, lengths.tobytes()] + strings_encoded
+            + [counts, lanes_num, values.tobytes(), index_extra.tobytes(), index_lanes.tobytes()])
+
+    @classmethod
+    def unpack(cls, data):
+        '''
+            Return record decoded from bytes.
+        '''
+        data = bytes(data)
+        magic, version, num_strings = struct.unpack_from(FORMAT_HEADER, data, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a road record')
+        if version > VERSION:
+            raise ValueError('Road record version {} is not supported'.format(version))
+        offset = struct.calcsize(FORMAT_HEADER)
+        lengths = np.frombuffer(data, dtype='<u2', count=num_strings, offset=offset)
+        offset += 2 * num_strings
+        strings = []
+        for length in lengths:
+            strings.append(data[offset:offset + length].decode('utf-8'))
+            offset += int(length)
+        curve, valid, num_extra, num_elevation, num_left, num_right, split_type, \
+            split_lane_idx, center_type, center_weight, center_color = \
+            struct.unpack_from(FORMAT_COUNTS, data, offset)
+        offset += struct.calcsize(FORMAT_COUNTS)
+        lanes_left_num, lanes_right_num = struct.unpack_from('<HH', data, offset)
+        offset += 4
+        num_values = 6 + len(KEYS_GEOMETRY) + num_extra + 5 * num_elevation + num_left + num_right
+        if version >= 2:
+            num_values += num_left + num_right + 1
+        values = np.frombuffer(data, dtype='<f8', count=num_values, offset=offset).tolist()
+        offset += 8 * num_values
+        index_extra = np.frombuffer(data, dtype='<u2', count=num_extra, offset=offset).tolist()
+        offset += 2 * num_extra
+        index_lanes = np.frombuffer(data, dtype='<u2', offset=offset,
+            count=len(KEYS_LANE_STRINGS) * (num_left + num_right)).tolist()
+
+        geometry = {'curve': strings[curve], 'valid': bool(valid),
+                    'point_start': values[0:3], 'point_end': values[3:6]}
+        idx = 6
+        for key in KEYS_GEOMETRY:
+            geometry[key] = values[idx]
+            idx += 1
+        for idx_string in index_extra:
+            geometry[strings[idx_string]] = values[idx]
+            idx += 1
+        geometry['elevation'] = [dict(zip(KEYS_ELEVATION, values[idx + 5 * i:idx + 5 * (i + 1)]))
+            for i in range(num_elevation)]
+        idx += 5 * num_elevation
+        params = {
+            'lanes_left_num': lanes_left_num,
+            'lanes_right_num': lanes_right_num,
+            'lanes_left_widths': values[idx:idx + num_left],
+            'lanes_right_widths': values[idx + num_left:idx + num_left + num_right],
+            'lane_center_road_mark_type': strings[center_type],
+            'lane_center_road_mark_weight': strings[center_weight],
+            'lane_center_road_mark_color': strings[center_color],
+            'road_split_type': strings[split_type],
+            'road_split_lane_idx': split_lane_idx,
+        }
+        if version >= 2:
+            idx += num_left + num_right
+            params['lanes_left_road_mark_widths'] = values[idx:idx + num_left]
+            params['lanes_right_road_mark_widths'] = values[idx + num_left:idx + num_left + num_right]
+            params['lane_center_road_mark_width'] = values[idx + num_left + num_right]
+        idx = 0
+        for side, num in [('left', num_left), ('right', num_right)]:
+            for key in KEYS_LANE_STRINGS:
+                params['lanes_' + side + '_' + key] = [strings[i] for i in index_lanes[idx:idx + num]]
+                idx += num
+        return cls(geometry, params)
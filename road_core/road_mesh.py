@@ -0,0 +1,424 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Road mesh generation from a geometry and a list of lanes. Everything here is
+# plain Python/NumPy, the Blender operators only turn the result into objects.
+import numpy as np
+
+from . import sampling
+from .geometry import Plan_view_cache, get_geometry, geometry_from_params
+from .lanes import Lane, Lane_layout, get_strips_s_boundaries, get_strips_s_boundaries_merged, \
+    get_face_materials
+
+# Order of the material slots of road objects, see helper.assign_road_materials
+MATERIAL_SLOTS = ['road_asphalt', 'road_mark_white', 'road_mark_yellow', 'grass']
+MAPPING_MATERIAL_SLOT = {
+    'asphalt': 0,
+    'road_mark_white': 1,
+    'road_mark_yellow': 2,
+    'grass': 3,
+}
+# Minimum distance between cross sections
+TOLERANCE_S = 1e-6
+# Lane attributes by the part of the mesh they affect, see Road_mesh_builder
+LANE_ATTRIBUTES_TOPOLOGY = ('side', 'road_mark_type')
+LANE_ATTRIBUTES_BORDERS = ('width', 'width_change', 'road_mark_width')
+LANE_ATTRIBUTES_MATERIALS = ('type', 'road_mark_color')
+# Levels of detail as factor for chord tolerance and maximum edge length and
+# flag to merge broken lines into the asphalt, level n is exported as LODn
+LOD_LEVELS = [
+    (1.0, False),
+    (4.0, True),
+    (16.0, True),
+    (64.0, True),
+]
+
+
+def get_s_samples(geometry, lane_layout, tolerance_chord, length_edge_max):
+    '''
+        Return the s values of the regular cross section samples adapted
+        to the local curvature with bounded chord error.
+    '''
+    length = geometry.params['length']
+    # The outermost strip border has the largest chord error in curves
+    t_abs_max = lane_layout.get_t_abs_max(length)
+    s_samples = sampling.get_s_samples(geometry, tolerance_chord,
+        length_edge_max, t_abs_max)
+    return s_samples.tolist()
+
+
+def get_unique_s_boundaries(strips_s_boundaries):
+    '''
+        Return dictionary with the distinct face boundary sequences of all
+        strips as arrays keyed by their values.
+    '''
+    s_boundaries_unique = {}
+    for _, s_boundaries_strip in strips_s_boundaries:
+        key = tuple(s_boundaries_strip)
+        if key not in s_boundaries_unique:
+            s_boundaries_unique[key] = np.array(s_boundaries_strip, dtype=float)
+    return s_boundaries_unique
+
+
+def snap_s_samples(s_samples, s_snap):
+    '''
+        Return the sorted unique values of s_snap closest to the s samples.
+    '''
+    idx = np.clip(np.searchsorted(s_snap, s_samples), 1, len(s_snap) - 1)
+    closer_left = s_samples - s_snap[idx - 1] < s_snap[idx] - s_samples
+    return np.unique(s_snap[idx - closer_left])
+
+
+def get_s_grid(s_samples, strips_s_boundaries, length):
+    '''
+        Return the sorted s values of all cross sections of the mesh, the
+        regular samples merged with the face boundaries of all strips. Every
+        strip is sampled at every s value so all strips share the same rows.
+    '''
+    # Asphalt strips and the lines of a double line share the same boundaries
+    s_boundaries = list(get_unique_s_boundaries(strips_s_boundaries).values())
+    s_grid = np.unique(np.clip(np.concatenate([s_samples] + s_boundaries), 0.0, length))
+    # Drop values which only differ by rounding errors
+    keep = np.concatenate(([True], np.diff(s_grid) > TOLERANCE_S))
+    s_grid = s_grid[keep]
+    s_grid[-1] = length
+    return s_grid
+
+
+def get_road_sample_points(geometry, lane_layout, strips_s_boundaries, tolerance_chord,
+        length_edge_max, plan_view_cache=None, snap_to_cache=False):
+    '''
+        Adaptively sample road in s direction based on local curvature. Return
+        the s values (N,) of the sample grid, the t values (N, M) of the strip
+        borders and the sample points (N, M, 3) in local coordinates. With
+        snap_to_cache the samples are moved to the closest s values already
+        in the plan view cache, use this for coarse samplings only.
+    '''
+    if plan_view_cache is None:
+        plan_view_cache = Plan_view_cache(geometry)
+    length = geometry.params['length']
+    s_samples = get_s_samples(geometry, lane_layout, tolerance_chord, length_edge_max)
+    if snap_to_cache and len(plan_view_cache.s) > 1:
+        s_samples = snap_s_samples(np.array(s_samples), plan_view_cache.s)
+    s_grid = get_s_grid(s_samples, strips_s_boundaries, length)
+    # Sample all cross sections along the road in one batch
+    t_grid = lane_layout.get_t_values(s_grid, length)
+    xyz_grid, _ = plan_view_cache.sample_cross_section_batch(s_grid, t_grid)
+    return s_grid, t_grid, xyz_grid
+
+
+def get_vertex_new(t_grid):
+    '''
+        Return mask of the sample grid points which get their own vertex,
+        borders which coincide at the same s share one vertex.
+    '''
+    vertex_new = np.ones(t_grid.shape, dtype=bool)
+    vertex_new[:, 1:] = t_grid[:, 1:] != t_grid[:, :-1]
+    return vertex_new
+
+
+def get_road_mesh_arrays_from_samples(s_grid, t_grid, xyz_grid, strips_s_boundaries):
+    '''
+        Return flat arrays for a quad mesh from the sample grid: vertex
+        coordinates (V, 3), vertex index of each loop (L,), start and number
+        of loops of each polygon (P,) and the index of the strip face (see
+        get_face_materials) each polygon belongs to. Borders with equal t
+        share their vertices, quads next to zero width (tapered ends of
+        opening and closing lanes) become triangles. Edges are derived from
+        the polygons.
+    '''
+    num_s, num_t = t_grid.shape
+    vertex_new = get_vertex_new(t_grid)
+    idx_vertex = (np.cumsum(vertex_new) - 1).reshape(num_s, num_t)
+    vertices = xyz_grid[vertex_new]
+
+    # One quad per strip and row interval in strip major order, the left
+    # border of a strip is the one with the smaller index
+    idx_vertex_left = idx_vertex[:, :-1].T
+    idx_vertex_right = idx_vertex[:, 1:].T
+    quads = np.stack((idx_vertex_right[:, :-1], idx_vertex_right[:, 1:],
+                      idx_vertex_left[:, 1:], idx_vertex_left[:, :-1]), axis=2).reshape(-1, 4)
+    corners_keep = np.ones(quads.shape, dtype=bool)
+    corners_keep[:, 2] = quads[:, 2] != quads[:, 1]
+    corners_keep[:, 3] = quads[:, 3] != quads[:, 0]
+    loop_totals = np.sum(corners_keep, axis=1)
+
+    # Strip face of each quad from the face boundaries of its strip
+    s_mid = 0.5 * (s_grid[:-1] + s_grid[1:])
+    idx_faces_unique = {}
+    for key, s_boundaries_strip in get_unique_s_boundaries(strips_s_boundaries).items():
+        idx_face_strip = np.searchsorted(s_boundaries_strip, s_mid, side='right') - 1
+        idx_faces_unique[key] = np.clip(idx_face_strip, 0, len(s_boundaries_strip) - 2)
+    idx_faces_strips = []
+    num_faces = 0
+    for _, s_boundaries_strip in strips_s_boundaries:
+        idx_faces_strips.append(num_faces + idx_faces_unique[tuple(s_boundaries_strip)])
+        num_faces += len(s_boundaries_strip) - 1
+    idx_faces = np.concatenate(idx_faces_strips)
+
+    # Skip strips with zero width
+    valid = loop_totals >= 3
+    loops = quads[valid][corners_keep[valid]].astype(np.int32)
+    loop_totals = loop_totals[valid].astype(np.int32)
+    loop_starts = np.zeros(len(loop_totals), dtype=np.int32)
+    np.cumsum(loop_totals[:-1], out=loop_starts[1:])
+    return vertices, loops, loop_starts, loop_totals, idx_faces[valid]
+
+
+def get_material_indices(materials, num_faces):
+    '''
+        Return material slot index for each face from the dictionary with face
+        indices for each material.
+    '''
+    material_indices = np.zeros(num_faces, dtype=np.int32)
+    for material, idx_faces in materials.items():
+        material_indices[idx_faces] = MAPPING_MATERIAL_SLOT[material]
+    return material_indices
+
+
+def get_polygon_material_indices(lanes, strips_s_boundaries, idx_faces):
+    '''
+        Return material slot index of each polygon from the index of the
+        strip face each polygon belongs to.
+    '''
+    materials = get_face_materials(lanes, strips_s_boundaries)
+    num_faces = sum(len(s_boundaries) - 1 for _, s_boundaries in strips_s_boundaries)
+    return get_material_indices(materials, num_faces)[idx_faces]
+
+
+def get_road_mesh_arrays(geometry, lanes, length_broken_line, tolerance_chord, length_edge_max,
+        plan_view_cache=None, merge_markings=False, snap_to_cache=False):
+    '''
+        Return vertex coordinates, loop vertex indices, polygon loop starts
+        and totals and material slot index per polygon of the road mesh as
+        flat arrays in local coordinates. Pass a Plan_view_cache of the
+        geometry to reuse reference line samples of previous builds.
+    '''
+    length = geometry.params['length']
+    # Get values in s direction where the faces of the road start and end
+    strips_s_boundaries = get_strips_s_boundaries(lanes, length, length_broken_line)
+    if merge_markings:
+        strips_s_boundaries = get_strips_s_boundaries_merged(lanes, strips_s_boundaries)
+    lane_layout = Lane_layout(lanes)
+    s_grid, t_grid, xyz_grid = get_road_sample_points(geometry, lane_layout,
+        strips_s_boundaries, tolerance_chord, length_edge_max, plan_view_cache, snap_to_cache)
+    vertices, loops, loop_starts, loop_totals, idx_faces = \
+        get_road_mesh_arrays_from_samples(s_grid, t_grid, xyz_grid, strips_s_boundaries)
+    material_indices = get_polygon_material_indices(lanes, strips_s_boundaries, idx_faces)
+    return vertices, loops, loop_starts, loop_totals, material_indices
+
+
+def get_road_mesh_lods(geometry, lanes, length_broken_line, tolerance_chord, length_edge_max,
+        lod_levels=LOD_LEVELS):
+    '''
+        Return list with the flat mesh arrays (see get_road_mesh_arrays) for
+        each level of detail. The samples of coarser levels are snapped to the
+        samples of the first level so the plan view is evaluated only once.
+    '''
+    plan_view_cache = Plan_view_cache(geometry)
+    meshes = []
+    for idx_lod, (factor, merge_markings) in enumerate(lod_levels):
+        meshes.append(get_road_mesh_arrays(geometry, lanes, length_broken_line,
+            tolerance_chord * factor, length_edge_max * factor, plan_view_cache,
+            merge_markings, snap_to_cache=idx_lod > 0))
+    return meshes
+
+
+class Road_mesh_builder():
+    '''
+        Road mesh generation which keeps the intermediate results of the last
+        build and only redoes the parts affected by a change. update returns
+        what had to be rebuilt, each level includes the ones below:
+            'geometry': plan view resampled and everything rebuilt
+            'topology': new polygons from the cached plan view samples
+            'vertices': only vertex coordinates of moved strip borders
+            'materials': only material indices of the polygons
+            None: nothing changed
+        Width changes keep the s samples as long as the road gets narrower,
+        the samples of a wider road would be too coarse in curves.
+    '''
+
+    def __init__(self):
+        self.geometry = None
+        self.key_geometry = None
+        self.key_topology = None
+        self.key_borders = None
+        self.key_materials = None
+        self.plan_view_cache = None
+        # Mask of strip borders which moved in the last update
+        self.borders_dirty = None
+
+    def get_keys(self, geometry, lanes, length_broken_line, tolerance_chord, length_edge_max,
+            merge_markings):
+        '''
+            Return keys of the inputs affecting geometry, topology, strip
+            borders and materials of the mesh.
+        '''
+        def get_key_lanes(attributes):
+            return tuple(tuple(getattr(lane, name) for name in attributes) for lane in lanes)
+        key_geometry = repr(geometry.params)
+        key_topology = (length_broken_line, tolerance_chord, length_edge_max, merge_markings,
+            get_key_lanes(LANE_ATTRIBUTES_TOPOLOGY))
+        key_borders = get_key_lanes(LANE_ATTRIBUTES_BORDERS)
+        key_materials = get_key_lanes(LANE_ATTRIBUTES_MATERIALS)
+        return key_geometry, key_topology, key_borders, key_materials
+
+    def update(self, geometry, lanes, length_broken_line, tolerance_chord, length_edge_max,
+            merge_markings=False):
+        '''
+            Update the mesh for the given geometry and lanes and return which
+            part of the mesh changed. With merge_markings broken lines are
+            part of the asphalt (e.g. for dashes placed as instances).
+        '''
+        key_geometry, key_topology, key_borders, key_materials = self.get_keys(
+            geometry, lanes, length_broken_line, tolerance_chord, length_edge_max, merge_markings)
+        lanes = [Lane.from_lane(lane) for lane in lanes]
+        length = geometry.params['length']
+        if key_geometry != self.key_geometry:
+            dirty = 'geometry'
+            self.geometry = geometry
+            self.plan_view_cache = Plan_view_cache(geometry)
+        elif key_topology != self.key_topology:
+            dirty = 'topology'
+        elif key_borders != self.key_borders:
+            dirty = 'vertices'
+        elif key_materials != self.key_materials:
+            dirty = 'materials'
+        else:
+            self.borders_dirty[:] = False
+            return None
+        lane_layout = Lane_layout(lanes)
+        if dirty == 'vertices' and lane_layout.get_t_abs_max(length) > self.t_abs_max:
+            dirty = 'topology'
+
+        if dirty == 'geometry' or dirty == 'topology':
+            self.strips_s_boundaries = get_strips_s_boundaries(lanes, length, length_broken_line)
+            if merge_markings:
+                self.strips_s_boundaries = get_strips_s_boundaries_merged(lanes,
+                    self.strips_s_boundaries)
+            self.s_grid, self.t_grid, self.xyz_grid = get_road_sample_points(geometry, lane_layout,
+                self.strips_s_boundaries, tolerance_chord, length_edge_max, self.plan_view_cache)
+            self.t_abs_max = lane_layout.get_t_abs_max(length)
+            self.borders_dirty = np.ones(self.t_grid.shape[1], dtype=bool)
+            self.update_polygons()
+        elif dirty == 'vertices':
+            t_grid = lane_layout.get_t_values(self.s_grid, length)
+            self.borders_dirty = np.any(t_grid != self.t_grid, axis=0)
+            self.xyz_grid[:, self.borders_dirty], _ = self.plan_view_cache.sample_cross_section_batch(
+                self.s_grid, t_grid[:, self.borders_dirty])
+            vertex_new = get_vertex_new(t_grid)
+            self.t_grid = t_grid
+            if np.array_equal(vertex_new, self.vertex_new):
+                self.vertices = self.xyz_grid[vertex_new]
+            else:
+                # Opening or closing lanes changed which vertices are shared
+                dirty = 'topology'
+                self.update_polygons()
+        else:
+            self.borders_dirty = np.zeros(self.t_grid.shape[1], dtype=bool)
+        self.material_indices = get_polygon_material_indices(lanes, self.strips_s_boundaries,
+            self.idx_faces)
+
+        self.key_geometry = key_geometry
+        self.key_topology = key_topology
+        self.key_borders = key_borders
+        self.key_materials = key_materials
+        self.length_broken_line = length_broken_line
+        self.tolerance_chord = tolerance_chord
+        self.length_edge_max = length_edge_max
+        return dirty
+
+    def update_polygons(self):
+        '''
+            Create vertices and polygons from the current sample grid.
+        '''
+        self.vertex_new = get_vertex_new(self.t_grid)
+        self.vertices, self.loops, self.loop_starts, self.loop_totals, self.idx_faces = \
+            get_road_mesh_arrays_from_samples(self.s_grid, self.t_grid, self.xyz_grid,
+                self.strips_s_boundaries)
+
+    def get_mesh_arrays(self):
+        '''
+            Return the flat mesh arrays of the last update, see
+            get_road_mesh_arrays.
+        '''
+        return self.vertices, self.loops, self.loop_starts, self.loop_totals, self.material_indices
+
+    def get_mesh_arrays_lods(self, lanes, lod_levels):
+        '''
+            Return list with the flat mesh arrays of coarser levels of detail
+            (see get_road_mesh_lods) snapped to the samples of the last update.
+        '''
+        return [get_road_mesh_arrays(self.geometry, lanes, self.length_broken_line,
+                    self.tolerance_chord * factor, self.length_edge_max * factor,
+                    self.plan_view_cache, merge_markings, snap_to_cache=True)
+                for factor, merge_markings in lod_levels]
+
+
+def get_road_mesh(geometry, lanes, length_broken_line, tolerance_chord, length_edge_max):
+    '''
+        Return vertices, edges and faces in local coordinates and the face
+        indices for each material of the road mesh as lists.
+    '''
+    vertices, loops, loop_starts, loop_totals, material_indices = get_road_mesh_arrays(
+        geometry, lanes, length_broken_line, tolerance_chord, length_edge_max)
+    faces = [loops[start:start + total].tolist() for start, total
+             in zip(loop_starts.tolist(), loop_totals.tolist())]
+    edges = [[face[n - 1], face[n]] for face in faces for n in range(len(face))]
+    materials = {material: np.flatnonzero(material_indices == idx).tolist()
+                 for material, idx in MAPPING_MATERIAL_SLOT.items()}
+    return vertices.tolist(), edges, faces, materials
+
+
+def build_road(road_spec):
+    '''
+        Build a road mesh from a road specification dictionary. The result
+        only contains plain Python types and NumPy arrays so this can be used
+        with process pools.
+
+        The road specification contains either
+            'geometry': stored geometry parameters (see Geometry.set_params)
+        or
+            'curve': 'line', 'arc' or 'spiral'
+            'params_input': geometry input parameters (see Geometry.update)
+            'geometry_solver': optional, defaults to 'default'
+        and
+            'lanes': list of Lane objects or dictionaries with lane attributes
+            'length_broken_line': optional, defaults to 3.0
+            'tolerance_chord': optional, defaults to 0.05
+            'length_edge_max': optional, defaults to 5.0
+    '''
+    if 'geometry' in road_spec:
+        geometry = geometry_from_params(road_spec['geometry'])
+    else:
+        geometry = get_geometry(road_spec['curve'])
+        geometry.update(road_spec['params_input'], road_spec.get('geometry_solver', 'default'))
+    lanes = [Lane(**lane) if isinstance(lane, dict) else lane for lane in road_spec['lanes']]
+    vertices, loops, loop_starts, loop_totals, material_indices = get_road_mesh_arrays(
+        geometry, lanes,
+        road_spec.get('length_broken_line', 3.0),
+        road_spec.get('tolerance_chord', 0.05),
+        road_spec.get('length_edge_max', 5.0))
+    params = dict(geometry.params)
+    params['point_start'] = params['point_start'].tolist()
+    params['point_end'] = params['point_end'].tolist()
+    return {
+        'valid': geometry.params['valid'],
+        'geometry': params,
+        'matrix_world': geometry.matrix_world.tolist(),
+        'vertices': vertices,
+        'loops': loops,
+        'loop_starts': loop_starts,
+        'loop_totals': loop_totals,
+        'material_indices': material_indices,
+    }
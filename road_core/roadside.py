@@ -0,0 +1,75 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Placement of roadside objects (posts, trees, signs, ...) along road geometries
+from math import pi
+import numpy as np
+
+
+def get_spacing(spec):
+    '''
+        Return the distance between objects in s direction from a placement
+        spec with either 'spacing' in m or 'density' in objects per m.
+    '''
+    if spec.get('spacing', 0) > 0:
+        return spec['spacing']
+    elif spec.get('density', 0) > 0:
+        return 1.0 / spec['density']
+    else:
+        raise ValueError('Roadside placement needs a positive spacing or density.')
+
+
+def get_placements(geometry, t, spacing, s_start=0.0, s_end=None):
+    '''
+        Return world locations (N, 3), headings (N,) and s values (N,) of
+        objects placed every spacing meters at lateral position t between
+        s_start and s_end.
+    '''
+    length = geometry.params['length']
+    if s_end is None:
+        s_end = length
+    s_end = min(s_end, length)
+    if s_end < s_start:
+        return np.empty((0, 3)), np.empty(0), np.empty(0)
+    s = np.arange(s_start, s_end + 1e-9, spacing)
+    xyz_local, _ = geometry.sample_cross_section_batch(s, [t])
+    xyz_local = xyz_local[:, 0, :]
+    rotation = geometry.matrix_world[0:3, 0:3]
+    translation = geometry.matrix_world[0:3, 3]
+    xyz = xyz_local @ rotation.T + translation
+    _, _, _, hdg_t = geometry.sample_plan_view_batch(s)
+    heading = geometry.params['heading_start'] + hdg_t - pi / 2
+    return xyz, heading, s
+
+
+def get_roadside_placements(geometry, width_left, width_right, specs):
+    '''
+        Return dictionary with locations, headings and s values for each road
+        side with a placement spec. Specs are given per side ('left',
+        'right') as dictionaries with
+            'spacing' or 'density': distance or objects per m in s direction
+            'offset': distance from road edge to objects, default 0.5 m
+            's_start', 's_end': optional range in s direction
+    '''
+    placements = {}
+    for side, spec in specs.items():
+        offset = spec.get('offset', 0.5)
+        if side == 'left':
+            t = width_left + offset
+        elif side == 'right':
+            t = -(width_right + offset)
+        else:
+            raise ValueError('Unknown road side {}.'.format(side))
+        placements[side] = get_placements(geometry, t, get_spacing(spec),
+            spec.get('s_start', 0.0), spec.get('s_end', None))
+    return placements
@@ -0,0 +1,112 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Chord error bounded sampling of road geometries in s direction
+from math import ceil
+import numpy as np
+
+# Resolution of the grid the sample density is integrated on
+LENGTH_GRID_MAX = 0.5
+
+
+def get_step_chord_error(curvature_abs, tolerance_chord, length_edge_max):
+    '''
+        Return the maximum step length for which the chord deviates less than
+        tolerance_chord from a curve with the given curvature.
+    '''
+    curvature_abs = np.asarray(curvature_abs, dtype=float)
+    step = np.full(curvature_abs.shape, float(length_edge_max))
+    curved = curvature_abs > 0
+    # Sagitta of a chord with length h: h^2 * curvature / 8
+    step[curved] = np.minimum(step[curved],
+        np.sqrt(8.0 * tolerance_chord / curvature_abs[curved]))
+    return step
+
+
+def get_curvature_sampling(geometry, s, t_abs_max):
+    '''
+        Return the curvature relevant for sampling at an array of s values
+        combining plan view curvature on the outer road edge and vertical
+        curvature of the elevation profile.
+    '''
+    curvature_plan_view = np.abs(geometry.get_curvature_plan_view(s)) + np.zeros_like(s)
+    # Steps are taken along the reference line, the outer road edge covers a
+    # longer distance per step and hence has the larger chord error
+    curvature_plan_view = curvature_plan_view * (1.0 + t_abs_max * curvature_plan_view)
+    _, _, curvature_elevation = geometry.elevation_profile.evaluate(s)
+    return np.sqrt(curvature_plan_view**2 + curvature_elevation**2)
+
+
+def get_s_samples(geometry, tolerance_chord, length_edge_max, t_abs_max=0.0):
+    '''
+        Plan all s values of the cross section samples for a geometry up
+        front such that the straight edges between samples deviate at most
+        about tolerance_chord from the road surface and are not longer than
+        length_edge_max. The samples are distributed such that the error is
+        roughly equal along the road.
+    '''
+    length = geometry.params['length']
+    if length <= 0:
+        return np.array([0.0])
+    num_grid = max(2, ceil(length / min(LENGTH_GRID_MAX, length_edge_max)) + 1)
+    s_grid = np.linspace(0.0, length, num_grid)
+    curvature = get_curvature_sampling(geometry, s_grid, t_abs_max)
+    density = 1.0 / get_step_chord_error(curvature, tolerance_chord, length_edge_max)
+    # Use the larger density of both ends of each grid cell to stay conservative
+    density_cells = np.maximum(density[:-1], density[1:])
+    num_samples_cumulative = np.concatenate(([0.0],
+        np.cumsum(density_cells * np.diff(s_grid))))
+    num_steps = max(1, ceil(num_samples_cumulative[-1] - 1e-9))
+    targets = np.linspace(0.0, num_samples_cumulative[-1], num_steps + 1)
+    s_samples = np.interp(targets, num_samples_cumulative, s_grid)
+    s_samples[0] = 0.0
+    s_samples[-1] = length
+    return s_samples
+
+
+def get_chord_errors(geometry, s_samples, t_values):
+    '''
+        Return the distance of the road surface to the straight edges between
+        samples measured in the middle of each interval between s samples for
+        each t value.
+    '''
+    s_samples = np.asarray(s_samples, dtype=float)
+    s_mid = 0.5 * (s_samples[:-1] + s_samples[1:])
+    xyz_samples, _ = geometry.sample_cross_section_batch(s_samples, t_values)
+    xyz_mid, _ = geometry.sample_cross_section_batch(s_mid, t_values)
+    xyz_start = xyz_samples[:-1]
+    chord = xyz_samples[1:] - xyz_start
+    length_chord_squared = np.maximum(np.sum(chord**2, axis=2), 1e-24)
+    # Distance from the mid point to the closest point on the chord
+    ratio = np.clip(np.sum((xyz_mid - xyz_start) * chord, axis=2) / length_chord_squared, 0.0, 1.0)
+    xyz_chord = xyz_start + ratio[:, :, np.newaxis] * chord
+    return np.linalg.norm(xyz_mid - xyz_chord, axis=2)
+
+
+def get_sampling_report(geometry, t_values, tolerances_chord, length_edge_max):
+    '''
+        Return a list with one dictionary per chord tolerance containing the
+        number of s samples, the number of vertices and the maximum and mean
+        geometric error of the resulting cross section grid.
+    '''
+    t_abs_max = float(np.max(np.abs(t_values)))
+    report = []
+    for tolerance_chord in tolerances_chord:
+        s_samples = get_s_samples(geometry, tolerance_chord, length_edge_max, t_abs_max)
+        errors = get_chord_errors(geometry, s_samples, t_values)
+        report.append({'tolerance_chord': tolerance_chord,
+                       'num_samples': len(s_samples),
+                       'num_vertices': len(s_samples) * len(t_values),
+                       'error_max': float(errors.max()) if errors.size else 0.0,
+                       'error_mean': float(errors.mean()) if errors.size else 0.0,})
+    return report
@@ -0,0 +1,505 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Projection of world (x, y) points to road coordinates (road, s, t). Roads are
+# approximated by coarse polylines stored in a uniform grid, the closest
+# polyline segment is then refined with Newton iterations on the analytic
+# geometry. Connecting points for snapping are stored in a separate grid.
+import numpy as np
+
+from . import sampling
+from . import clothoid
+
+# Polyline approximation of the reference lines
+TOLERANCE_CHORD_POLYLINE = 0.2
+LENGTH_SEGMENT_MAX = 10.0
+# Edge length of the grid cells
+SIZE_CELL = 20.0
+# Edge length of the grid cells of the connector index
+SIZE_CELL_CONNECTOR = 10.0
+# Points farther than this from every road are not projected
+DISTANCE_SEARCH_MAX = 200.0
+NUM_ITERATIONS_NEWTON = 8
+TOLERANCE_NEWTON = 1e-9
+
+
+def project_points_segments(points, p_0, p_1):
+    '''
+        Return parameter along each segment, distance to the segment and the
+        signed (left positive) distance to the segment line for pairs of
+        points and segments.
+    '''
+    d = p_1 - p_0
+    v = points - p_0
+    length_squared = np.maximum(np.sum(d**2, axis=1), 1e-24)
+    ratio = np.clip(np.sum(v * d, axis=1) / length_squared, 0.0, 1.0)
+    distance = np.linalg.norm(v - ratio[:, np.newaxis] * d, axis=1)
+    t = (d[:, 0] * v[:, 1] - d[:, 1] * v[:, 0]) / np.sqrt(length_squared)
+    return ratio, distance, t
+
+
+def get_plan_view_coefficients(geometry):
+    '''
+        Return whether the plan view of a geometry is a spiral, its start
+        curvature and its curvature change per length. Lines and arcs are
+        described by their constant curvature.
+    '''
+    if geometry.params['curve'] == 'spiral':
+        return True, geometry.geometry_base.KappaStart, geometry.geometry_base.dk
+    return False, float(geometry.params['curvature_start']), 0.0
+
+
+def sample_plan_view_pairs(spiral, curvature_start, dk, s):
+    '''
+        Return arrays x(s), y(s), curvature(s) and hdg_t(s) of the local plan
+        views of many geometries at once, one geometry (given by the arrays
+        returned by get_plan_view_coefficients) per s value. Lines and arcs
+        are evaluated in closed form, only spirals need Fresnel integrals.
+    '''
+    x = np.empty_like(s)
+    y = np.empty_like(s)
+    # Lines and arcs
+    circular = ~spiral
+    s_c = s[circular]
+    curvature_c = curvature_start[circular]
+    straight = np.abs(curvature_c) < 1e-12
+    radius = 1.0 / np.where(straight, 1.0, curvature_c)
+    angle = curvature_c * s_c
+    x[circular] = np.where(straight, s_c, np.sin(angle) * radius)
+    y[circular] = np.where(straight, 0.0, (1.0 - np.cos(angle)) * radius)
+    # Spirals
+    if np.any(spiral):
+        x[spiral], y[spiral], _ = clothoid.clothoid_xy_theta(s[spiral],
+            curvature_start[spiral], dk[spiral])
+    curvature = curvature_start + dk * s
+    hdg_t = curvature_start * s + 0.5 * dk * s**2 + np.pi / 2
+    return x, y, curvature, hdg_t
+
+
+class Road_projection_index():
+    '''
+        Spatial index over the plan view of road geometries answering batched
+        (x, y) to (road, s, t) queries. Roads are identified by an arbitrary
+        hashable key and only resampled when added again with a different
+        version.
+    '''
+
+    def __init__(self, size_cell=SIZE_CELL):
+        self.size_cell = size_cell
+        self.roads = {}
+        self.dirty = True
+
+    def add_road(self, key, geometry, t_min=0.0, t_max=0.0, version=None):
+        '''
+            Add or replace a road geometry covering the t range [t_min, t_max]
+            and return True if the index changed. Nothing happens if the road
+            is already stored with the same version.
+        '''
+        road = self.roads.get(key)
+        if road is not None and version is not None and road['version'] == version:
+            return False
+        s = sampling.get_s_samples(geometry, TOLERANCE_CHORD_POLYLINE, LENGTH_SEGMENT_MAX)
+        x, y, _, _ = geometry.sample_plan_view_batch(s)
+        points_local = np.stack((x, y), axis=1)
+        rotation = geometry.matrix_world[0:2, 0:2]
+        translation = geometry.matrix_world[0:2, 3]
+        spiral, curvature_start, dk = get_plan_view_coefficients(geometry)
+        self.roads[key] = {
+            'geometry': geometry,
+            'version': version,
+            'spiral': spiral,
+            'curvature_start': curvature_start,
+            'dk': dk,
+            'length': geometry.params['length'],
+            'rotation': rotation,
+            'translation': translation,
+            't_min': min(t_min, t_max),
+            't_max': max(t_min, t_max),
+            's': s,
+            'points': points_local @ rotation.T + translation,
+        }
+        self.dirty = True
+        return True
+
+    def remove_road(self, key):
+        '''
+            Remove road from the index if present.
+        '''
+        if self.roads.pop(key, None) is not None:
+            self.dirty = True
+
+    def clear(self):
+        self.roads.clear()
+        self.dirty = True
+
+    def build(self):
+        '''
+            Concatenate the polylines of all roads and sort the segments into
+            the grid cells overlapped by their bounding box grown by the road
+            width.
+        '''
+        self.keys = list(self.roads.keys())
+        p_0, p_1, s_0, s_1, idx_road, t_min, t_max = [], [], [], [], [], [], []
+        for idx, key in enumerate(self.keys):
+            road = self.roads[key]
+            p_0.append(road['points'][:-1])
+            p_1.append(road['points'][1:])
+            s_0.append(road['s'][:-1])
+            s_1.append(road['s'][1:])
+            idx_road.append(np.full(len(road['s']) - 1, idx))
+            t_min.append(road['t_min'])
+            t_max.append(road['t_max'])
+        if len(self.keys) == 0:
+            self.segments_p_0 = np.empty((0, 2))
+            self.segments_p_1 = np.empty((0, 2))
+            self.segments_s_0 = np.empty(0)
+            self.segments_s_1 = np.empty(0)
+            self.segments_road = np.empty(0, dtype=int)
+            self.roads_t_min = np.empty(0)
+            self.roads_t_max = np.empty(0)
+            self.roads_spiral = np.empty(0, dtype=bool)
+            self.roads_curvature_start = np.empty(0)
+            self.roads_dk = np.empty(0)
+            self.roads_length = np.empty(0)
+            self.roads_rotation = np.empty((0, 2, 2))
+            self.roads_translation = np.empty((0, 2))
+            self.cells = np.empty(0, dtype=np.int64)
+            self.cells_start = np.zeros(1, dtype=int)
+            self.cells_segments = np.empty(0, dtype=int)
+            self.dirty = False
+            return
+        self.segments_p_0 = np.concatenate(p_0)
+        self.segments_p_1 = np.concatenate(p_1)
+        self.segments_s_0 = np.concatenate(s_0)
+        self.segments_s_1 = np.concatenate(s_1)
+        self.segments_road = np.concatenate(idx_road)
+        self.roads_t_min = np.array(t_min, dtype=float)
+        self.roads_t_max = np.array(t_max, dtype=float)
+        # Plan view parameters for the refinement of all roads at once
+        roads = [self.roads[key] for key in self.keys]
+        self.roads_spiral = np.array([road['spiral'] for road in roads], dtype=bool)
+        self.roads_curvature_start = np.array([road['curvature_start'] for road in roads], dtype=float)
+        self.roads_dk = np.array([road['dk'] for road in roads], dtype=float)
+        self.roads_length = np.array([road['length'] for road in roads], dtype=float)
+        self.roads_rotation = np.array([road['rotation'] for road in roads], dtype=float)
+        self.roads_translation = np.array([road['translation'] for road in roads], dtype=float)
+
+        # Cell ranges of the segment bounding boxes
+        width = np.maximum(np.abs(self.roads_t_min), np.abs(self.roads_t_max))[self.segments_road]
+        box_min = np.minimum(self.segments_p_0, self.segments_p_1) - width[:, np.newaxis]
+        box_max = np.maximum(self.segments_p_0, self.segments_p_1) + width[:, np.newaxis]
+        cell_min = np.floor(box_min / self.size_cell).astype(np.int64)
+        cell_max = np.floor(box_max / self.size_cell).astype(np.int64)
+        num_x = cell_max[:, 0] - cell_min[:, 0] + 1
+        num_y = cell_max[:, 1] - cell_min[:, 1] + 1
+        num_cells = num_x * num_y
+        # One entry per (segment, cell) pair
+        idx_segment = np.repeat(np.arange(len(num_cells)), num_cells)
+        offset = np.arange(num_cells.sum()) - np.repeat(np.cumsum(num_cells) - num_cells, num_cells)
+        cell_x = cell_min[idx_segment, 0] + offset % num_x[idx_segment]
+        cell_y = cell_min[idx_segment, 1] + offset // num_x[idx_segment]
+        cells = self.get_cell_keys(cell_x, cell_y)
+        order = np.argsort(cells, kind='stable')
+        self.cells, self.cells_start = np.unique(cells[order], return_index=True)
+        self.cells_start = np.append(self.cells_start, len(order))
+        self.cells_segments = idx_segment[order]
+        self.dirty = False
+
+    def get_cell_keys(self, cell_x, cell_y):
+        '''
+            Return one integer per grid cell.
+        '''
+        return (cell_x.astype(np.int64) << 32) + (cell_y.astype(np.int64) & 0xFFFFFFFF)
+
+    def get_point_cells(self, points):
+        '''
+            Return x and y index of the grid cell of each point.
+        '''
+        return np.floor(points[:, 0] / self.size_cell).astype(np.int64), \
+            np.floor(points[:, 1] / self.size_cell).astype(np.int64)
+
+    def get_candidates(self, points):
+        '''
+            Return pairs of point and segment indices of all segments sharing
+            a grid cell with the points.
+        '''
+        cell_x, cell_y = self.get_point_cells(points)
+        return self.get_candidates_cells(np.arange(len(points)), cell_x, cell_y)
+
+    def get_candidates_cells(self, idx_point, cell_x, cell_y):
+        '''
+            Return pairs of point and segment indices of all segments in the
+            cells given for each point index.
+        '''
+        cells = self.get_cell_keys(cell_x, cell_y)
+        idx_cell = np.searchsorted(self.cells, cells)
+        idx_cell = np.minimum(idx_cell, len(self.cells) - 1)
+        found = self.cells[idx_cell] == cells
+        start = np.where(found, self.cells_start[idx_cell], 0)
+        num = np.where(found, self.cells_start[idx_cell + 1] - start, 0)
+        idx_point = np.repeat(idx_point, num)
+        offset = np.arange(num.sum()) - np.repeat(np.cumsum(num) - num, num)
+        idx_segment = self.cells_segments[np.repeat(start, num) + offset]
+        return idx_point, idx_segment
+
+    def get_closest_segments(self, points, idx_point, idx_segment):
+        '''
+            Return closest segment, the ratio along it and its score (distance
+            outside the road surface) for each point with candidates. Points
+            on the road surface are preferred over points closer to the
+            reference line of another road.
+        '''
+        if len(idx_point) == 0:
+            return idx_point, idx_segment, np.empty(0), np.empty(0)
+        ratio, distance, t = project_points_segments(points[idx_point],
+            self.segments_p_0[idx_segment], self.segments_p_1[idx_segment])
+        idx_road = self.segments_road[idx_segment]
+        distance_edge = np.where(t > 0, self.roads_t_max[idx_road], -self.roads_t_min[idx_road])
+        distance_outside = np.maximum(distance - distance_edge, 0.0)
+        score = distance_outside + 1e-3 * distance
+        order = np.lexsort((score, idx_point))
+        first = order[np.concatenate(([True], np.diff(idx_point[order]) != 0))]
+        return idx_point[first], idx_segment[first], ratio[first], score[first]
+
+    def search_rings(self, points, idx_missing):
+        '''
+            Search the rings of cells around points without candidates in
+            their own cell, ring by ring until no closer segment can be found
+            in the next ring or DISTANCE_SEARCH_MAX is exceeded. Return point
+            and segment indices, ratio along the segment of the found points.
+        '''
+        cell_x, cell_y = self.get_point_cells(points[idx_missing])
+        score_best = np.full(len(idx_missing), np.inf)
+        segment_best = np.zeros(len(idx_missing), dtype=int)
+        ratio_best = np.zeros(len(idx_missing))
+        # Segments are sorted into cells by their bounding box grown by the
+        # road width, hence a lower bound of the score for ring r
+        width_max = max(float(np.max(np.abs(self.roads_t_min))),
+                        float(np.max(np.abs(self.roads_t_max))))
+        active = np.arange(len(idx_missing))
+        num_rings = int(np.ceil(DISTANCE_SEARCH_MAX / self.size_cell)) + 1
+        for ring in range(1, num_rings + 1):
+            if len(active) == 0:
+                break
+            # Cells with Chebyshev distance ring from the cell of the point
+            side = np.arange(-ring, ring + 1)
+            offset_x = np.concatenate((side, side, np.full(2 * ring - 1, -ring),
+                np.full(2 * ring - 1, ring)))
+            offset_y = np.concatenate((np.full(2 * ring + 1, -ring), np.full(2 * ring + 1, ring),
+                side[1:-1], side[1:-1]))
+            idx_active = np.repeat(active, len(offset_x))
+            idx_point, idx_segment = self.get_candidates_cells(idx_active,
+                cell_x[idx_active] + np.tile(offset_x, len(active)),
+                cell_y[idx_active] + np.tile(offset_y, len(active)))
+            idx_point, idx_segment, ratio, score = self.get_closest_segments(
+                points, idx_missing[idx_point], idx_segment) if len(idx_point) else \
+                (idx_point, idx_segment, np.empty(0), np.empty(0))
+            # Map back from point indices to indices into idx_missing
+            idx_local = np.searchsorted(idx_missing, idx_point)
+            better = score < score_best[idx_local]
+            score_best[idx_local[better]] = score[better]
+            segment_best[idx_local[better]] = idx_segment[better]
+            ratio_best[idx_local[better]] = ratio[better]
+            # Segments in further rings are at least ring cells away
+            score_bound = ring * self.size_cell - width_max
+            active = active[(score_best[active] > score_bound)
+                & (score_bound < DISTANCE_SEARCH_MAX)]
+        found = np.isfinite(score_best) & (score_best <= DISTANCE_SEARCH_MAX)
+        return idx_missing[found], segment_best[found], ratio_best[found]
+
+    def project(self, points):
+        '''
+            Project an (N, 2) or (N, 3) array of world points (only x and y
+            are used) onto the roads. Return
+            arrays with the index of the road in self.keys (-1 if there is no
+            road within DISTANCE_SEARCH_MAX), s, t and the plan view distance
+            of the point to the road surface (0 for points on the road, inf if
+            there is no road).
+        '''
+        if self.dirty:
+            self.build()
+        points = np.asarray(points, dtype=float)
+        if points.size == 0:
+            points = np.empty((0, 2))
+        points = points.reshape(-1, points.shape[-1])[:, 0:2]
+        num_points = len(points)
+        idx_road = np.full(num_points, -1, dtype=int)
+        s = np.zeros(num_points)
+        t = np.zeros(num_points)
+        distance = np.full(num_points, np.inf)
+        if num_points == 0 or len(self.segments_road) == 0:
+            return idx_road, s, t, distance
+
+        # Coarse search in the grid, points which are far away from any road
+        # search the surrounding cells ring by ring
+        idx_point, idx_segment = self.get_candidates(points)
+        idx_point, idx_segment, ratio, _ = self.get_closest_segments(points, idx_point, idx_segment)
+        missing = np.ones(num_points, dtype=bool)
+        missing[idx_point] = False
+        if np.any(missing):
+            idx_point_missing, idx_segment_missing, ratio_missing = \
+                self.search_rings(points, np.flatnonzero(missing))
+            idx_point = np.concatenate((idx_point, idx_point_missing))
+            idx_segment = np.concatenate((idx_segment, idx_segment_missing))
+            ratio = np.concatenate((ratio, ratio_missing))
+        s_segment = self.segments_s_0[idx_segment] \
+            + ratio * (self.segments_s_1[idx_segment] - self.segments_s_0[idx_segment])
+
+        # Refine on the analytic geometry of the roads, all pairs at once
+        idx_road[idx_point] = self.segments_road[idx_segment]
+        s[idx_point], t[idx_point], distance[idx_point] = self.refine(
+            points[idx_point], idx_road[idx_point], s_segment)
+        return idx_road, s, t, distance
+
+    def refine(self, points, idx_road, s):
+        '''
+            Newton iterations for the foot points of pairs of points and
+            roads on the reference line in local coordinates. Return s, t and
+            the plan view distance to the road surface of each pair.
+        '''
+        spiral = self.roads_spiral[idx_road]
+        curvature_start = self.roads_curvature_start[idx_road]
+        dk = self.roads_dk[idx_road]
+        length = self.roads_length[idx_road]
+        points_local = np.einsum('nij,ni->nj', self.roads_rotation[idx_road],
+            points - self.roads_translation[idx_road])
+        s = s.copy()
+        # Only pairs which have not converged yet are evaluated again
+        active = np.arange(len(s))
+        for _ in range(NUM_ITERATIONS_NEWTON):
+            x, y, curvature, hdg_t = sample_plan_view_pairs(spiral[active],
+                curvature_start[active], dk[active], s[active])
+            dx = points_local[active, 0] - x
+            dy = points_local[active, 1] - y
+            # Tangent is hdg_t rotated by -pi/2
+            tangent_x = np.sin(hdg_t)
+            tangent_y = -np.cos(hdg_t)
+            # Derivative of squared distance / -2 and its derivative
+            f = dx * tangent_x + dy * tangent_y
+            df = -1.0 + curvature * (dx * -tangent_y + dy * tangent_x)
+            # Newton step while the distance is convex, gradient step otherwise
+            step = np.where(df < -0.1, -f / np.minimum(df, -0.1), f)
+            s_new = np.clip(s[active] + step, 0.0, length[active])
+            converged = np.abs(s_new - s[active]) < TOLERANCE_NEWTON
+            s[active] = s_new
+            active = active[~converged]
+            if len(active) == 0:
+                break
+        x, y, _, hdg_t = sample_plan_view_pairs(spiral, curvature_start, dk, s)
+        dx = points_local[:, 0] - x
+        dy = points_local[:, 1] - y
+        t = dx * np.cos(hdg_t) + dy * np.sin(hdg_t)
+        along = dx * np.sin(hdg_t) - dy * np.cos(hdg_t)
+        outside = np.maximum(np.maximum(t - self.roads_t_max[idx_road],
+            self.roads_t_min[idx_road] - t), 0.0)
+        return s, t, np.hypot(outside, along)
+
+
+class Connector_index():
+    '''
+        Uniform grid over the plan view of connecting points answering
+        nearest point queries. Connectors are grouped by an arbitrary hashable
+        key (e.g. the owning object) and each carries an opaque payload.
+    '''
+
+    def __init__(self, size_cell=SIZE_CELL_CONNECTOR):
+        self.size_cell = size_cell
+        self.connectors = {}
+        self.cells = {}
+        self.z_range = None
+
+    def get_cell(self, x, y):
+        return (int(np.floor(x / self.size_cell)), int(np.floor(y / self.size_cell)))
+
+    def set_connectors(self, key, connectors):
+        '''
+            Add or replace the list of (point, payload) tuples of a key.
+        '''
+        self.remove(key)
+        connectors = [(tuple(float(value) for value in point), payload)
+            for point, payload in connectors]
+        self.connectors[key] = connectors
+        self.z_range = None
+        for idx, (point, _) in enumerate(connectors):
+            self.cells.setdefault(self.get_cell(point[0], point[1]), []).append((key, idx))
+
+    def remove(self, key):
+        '''
+            Remove connectors of key if present.
+        '''
+        connectors = self.connectors.pop(key, None)
+        if connectors is None:
+            return
+        self.z_range = None
+        for cell in set(self.get_cell(point[0], point[1]) for point, _ in connectors):
+            entries = [entry for entry in self.cells[cell] if entry[0] != key]
+            if entries:
+                self.cells[cell] = entries
+            else:
+                del self.cells[cell]
+
+    def clear(self):
+        self.connectors.clear()
+        self.cells.clear()
+        self.z_range = None
+
+    def get_z_range(self):
+        '''
+            Return minimum and maximum height of all connectors.
+        '''
+        if self.z_range is None:
+            z = [point[2] for connectors in self.connectors.values() for point, _ in connectors]
+            self.z_range = (min(z), max(z)) if z else (0.0, 0.0)
+        return self.z_range
+
+    def get_candidates(self, point_0, point_1, radius):
+        '''
+            Return list of (key, point, payload) of all connectors whose plan
+            view is closer than radius to the segment from point_0 to
+            point_1 (only x and y are used).
+        '''
+        p_0 = np.array(point_0[0:2], dtype=float)
+        p_1 = np.array(point_1[0:2], dtype=float)
+        cell_min = self.get_cell(*(np.minimum(p_0, p_1) - radius))
+        cell_max = self.get_cell(*(np.maximum(p_0, p_1) + radius))
+        candidates = []
+        for cell_x in range(cell_min[0], cell_max[0] + 1):
+            for cell_y in range(cell_min[1], cell_max[1] + 1):
+                for key, idx in self.cells.get((cell_x, cell_y), []):
+                    point, payload = self.connectors[key][idx]
+                    _, distance, _ = project_points_segments(np.array([point[0:2]]),
+                        p_0[np.newaxis], p_1[np.newaxis])
+                    if distance[0] <= radius:
+                        candidates.append((key, point, payload))
+        return candidates
+
+    def get_nearest(self, point_0, point_1, radius, get_distance=None):
+        '''
+            Return (key, point, payload) of the candidate connector with the
+            smallest distance, None if there is none. The distance is the plan
+            view distance to the segment unless a function mapping point and
+            payload to a distance (or None to reject the connector) is given.
+        '''
+        nearest = None
+        distance_min = float('inf')
+        for candidate in self.get_candidates(point_0, point_1, radius):
+            if get_distance is None:
+                _, distance, _ = project_points_segments(np.array([candidate[1][0:2]]),
+                    np.array([point_0[0:2]], dtype=float), np.array([point_1[0:2]], dtype=float))
+                distance = distance[0]
+            else:
+                distance = get_distance(candidate[1], candidate[2])
+            if distance is not None and distance < distance_min:
+                nearest = candidate
+                distance_min = distance
+        return nearest
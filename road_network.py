@@ -0,0 +1,128 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import bpy
+import helper
+from road_core.network import Road_network_graph, get_contact
+
+# Link properties written by helper.create_object_xodr_links
+KEYS_LINK_ROAD = [
+    ('start', 'link_predecessor_id_l', 'link_predecessor_cp_l'),
+    ('start', 'link_predecessor_id_r', 'link_predecessor_cp_r'),
+    ('end', 'link_successor_id_l', 'link_successor_cp_l'),
+    ('end', 'link_successor_id_r', 'link_successor_cp_r'),
+]
+KEYS_DIRECT_JUNCTION = [
+    ('start', 'id_direct_junction_start'),
+    ('end', 'id_direct_junction_end'),
+]
+
+
+def get_object_links(obj):
+    '''
+        Return element type, list of links (contact, id_other, contact_other)
+        and length of an OpenDRIVE object from its custom properties.
+    '''
+    dsc_type = obj.get('dsc_type')
+    links = []
+    if dsc_type in ['road', 'junction_connecting_road']:
+        for contact, key_id, key_cp in KEYS_LINK_ROAD:
+            if key_id in obj:
+                links.append((contact, obj[key_id], get_contact(obj.get(key_cp))))
+        for contact, key_id in KEYS_DIRECT_JUNCTION:
+            if key_id in obj:
+                links.append((contact, obj[key_id], None))
+        if 'id_junction' in obj:
+            links.append((None, obj['id_junction'], None))
+        return 'road', links, helper.get_road_record(obj).geometry['length']
+    if 'incoming_roads' in obj:
+        for id_other in obj['incoming_roads'].to_dict().values():
+            links.append((None, id_other, None))
+    return 'junction', links, 0.0
+
+
+class DSC_road_network():
+    '''
+        Connectivity graph of the roads and junctions in the OpenDRIVE
+        collection. Only objects reported as changed by the depsgraph handler
+        or by helper.create_object_xodr_links are re-read into the graph.
+    '''
+
+    def __init__(self):
+        self.graph = Road_network_graph()
+        # OpenDRIVE ID of each element object by object name
+        self.ids_xodr = {}
+
+    def update_object(self, obj):
+        '''
+            Add or update the element of an object, remove it if the object
+            is no road or junction (anymore).
+        '''
+        if not 'id_xodr' in obj or obj.get('dsc_type') == 'road_lod':
+            self.remove_object(obj.name)
+            return
+        id_xodr = obj['id_xodr']
+        if self.ids_xodr.get(obj.name, id_xodr) != id_xodr:
+            self.remove_object(obj.name)
+        # The object might have been renamed
+        for name in [name for name, id_other in self.ids_xodr.items() if id_other == id_xodr]:
+            del self.ids_xodr[name]
+        self.ids_xodr[obj.name] = id_xodr
+        element_type, links, length = get_object_links(obj)
+        self.graph.set_element(id_xodr, element_type, links, length,
+            version=(element_type, tuple(links), length))
+
+    def remove_object(self, name):
+        id_xodr = self.ids_xodr.pop(name, None)
+        if id_xodr is not None:
+            self.graph.remove_element(id_xodr)
+
+    def refresh(self):
+        '''
+            Synchronize the graph with the objects of the OpenDRIVE
+            collection, only changed objects are re-read.
+        '''
+        valid, names_dirty, check_removed = helper.get_object_tracker('road_network').pop_changes()
+        if not valid:
+            self.graph.clear()
+            self.ids_xodr = {}
+            collection = bpy.data.collections.get('OpenDRIVE')
+            if collection is not None:
+                for obj in collection.objects:
+                    self.update_object(obj)
+            return
+        for name in names_dirty:
+            obj = bpy.data.objects.get(name)
+            if obj is None:
+                self.remove_object(name)
+            else:
+                self.update_object(obj)
+        if check_removed:
+            for name in list(self.ids_xodr.keys()):
+                if bpy.data.objects.get(name) is None:
+                    self.remove_object(name)
+
+    def get_connected_components(self):
+        self.refresh()
+        return self.graph.get_connected_components()
+
+    def get_dangling_endpoints(self):
+        self.refresh()
+        return self.graph.get_dangling_endpoints()
+
+    def get_shortest_path(self, id_start, id_end):
+        self.refresh()
+        return self.graph.get_shortest_path(id_start, id_end)
+
+# Shared by all operators, refreshed lazily on each query
+road_network = DSC_road_network()
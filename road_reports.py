@@ -0,0 +1,149 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import bpy
+import numpy as np
+import os
+import sys
+import imp
+
+dir = os.path.dirname(bpy.data.filepath)
+if not dir in sys.path:
+    sys.path.append(dir)
+
+import helper
+imp.reload(helper)
+
+import road_core
+import road_core.sampling
+imp.reload(road_core.sampling)
+
+import mesh_cache
+import road_network
+
+
+class PR_OT_road_sampling_report(bpy.types.Operator):
+    bl_idname = 'pr.road_sampling_report'
+    bl_label = 'Road sampling report'
+    bl_description = 'Report number of cross sections versus geometric error of the active road ' \
+        'for several chord tolerances'
+    bl_options = {'REGISTER'}
+
+    tolerances_chord: bpy.props.FloatVectorProperty(
+        name='Chord tolerances',
+        description='Chord tolerances to compare',
+        size=5,
+        default=(0.1, 0.05, 0.02, 0.01, 0.005))
+
+    def execute(self, context):
+        obj = context.active_object
+        if obj is None or obj.get('dsc_type') != 'road':
+            self.report({'WARNING'}, 'Active object is not a road!')
+            return {'CANCELLED'}
+        record = helper.get_road_record(obj)
+        geometry = road_core.geometry_from_params(record.geometry)
+        # The chord error is largest at the outer borders of the road
+        width_left, width_right = record.get_width_road_sides()
+        t_values = np.array([width_left, 0.0, -width_right])
+        report = road_core.sampling.get_sampling_report(geometry, t_values,
+            list(self.tolerances_chord), context.scene.road_properties.sampling_length_edge_max)
+        self.report({'INFO'}, 'Sampling report for road {} of length {:.2f} m:'.format(
+            obj['id_xodr'], record.geometry['length']))
+        for row in report:
+            self.report({'INFO'}, 'tolerance {:.3f} m: {} cross sections, max error {:.4f} m, '
+                'mean error {:.4f} m'.format(row['tolerance_chord'], row['num_samples'],
+                row['error_max'], row['error_mean']))
+        return {'FINISHED'}
+
+class PR_OT_road_mesh_cache_report(bpy.types.Operator):
+    bl_idname = 'pr.road_mesh_cache_report'
+    bl_label = 'Road mesh cache report'
+    bl_description = 'Report how many road meshes have been reused from the mesh cache'
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        statistics = mesh_cache.road_mesh_cache.get_statistics()
+        self.report({'INFO'}, 'Road mesh cache: {} meshes, {} hits, {} misses, {:.1f} kB saved'.format(
+            statistics['meshes'], statistics['hits'], statistics['misses'],
+            statistics['bytes_saved'] / 1024))
+        return {'FINISHED'}
+
+class PR_OT_id_collision_report(bpy.types.Operator):
+    bl_idname = 'pr.id_collision_report'
+    bl_label = 'ID collision report'
+    bl_description = 'Check the OpenDRIVE and OpenSCENARIO IDs for duplicates and repair the ' \
+        'next free ID'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        messages = []
+        for allocator, collection_name in [(helper.id_allocator_xodr, 'OpenDRIVE'),
+                (helper.id_allocator_xosc, 'OpenSCENARIO')]:
+            # Problems found and repaired when the file was loaded
+            messages_load = allocator.messages
+            allocator.check_collisions(collection_name)
+            messages.extend(messages_load)
+            messages.extend(message for message in allocator.messages if message not in messages_load)
+        if not messages:
+            self.report({'INFO'}, 'No ID collisions found.')
+        for message in messages:
+            self.report({'WARNING'}, message)
+        return {'FINISHED'}
+
+class PR_OT_road_network_report(bpy.types.Operator):
+    bl_idname = 'pr.road_network_report'
+    bl_label = 'Road network report'
+    bl_description = 'Report the connected parts of the road network and the road ends ' \
+        'which are not linked with anything'
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        components = road_network.road_network.get_connected_components()
+        dangling = road_network.road_network.get_dangling_endpoints()
+        self.report({'INFO'}, 'Road network: {} elements in {} connected parts, '
+            '{} unlinked road ends'.format(sum(len(component) for component in components),
+            len(components), len(dangling)))
+        for id_xodr, contact in dangling:
+            self.report({'INFO'}, 'Road {} {} is not linked'.format(id_xodr, contact))
+        return {'FINISHED'}
+
+class PR_OT_stencil_mesh_report(bpy.types.Operator):
+    bl_idname = 'pr.stencil_mesh_report'
+    bl_label = 'Stencil mesh report'
+    bl_description = 'Report how often the stencil meshes have been rewritten and how many ' \
+        'temporary meshes are left'
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        statistics = helper.stencil_mesh_pool.get_statistics()
+        self.report({'INFO'}, 'Stencil meshes: {} writes, {} resizes, {} temporary meshes alive, '
+            '{} orphaned'.format(statistics['writes'], statistics['resizes'],
+            statistics['temporary_live'], statistics['temporary_orphans']))
+        return {'FINISHED'}
+
+def register():
+    bpy.utils.register_class(PR_OT_road_sampling_report)
+    bpy.utils.register_class(PR_OT_road_mesh_cache_report)
+    bpy.utils.register_class(PR_OT_id_collision_report)
+    bpy.utils.register_class(PR_OT_road_network_report)
+    bpy.utils.register_class(PR_OT_stencil_mesh_report)
+
+def unregister():
+    bpy.utils.unregister_class(PR_OT_road_sampling_report)
+    bpy.utils.unregister_class(PR_OT_road_mesh_cache_report)
+    bpy.utils.unregister_class(PR_OT_id_collision_report)
+    bpy.utils.unregister_class(PR_OT_road_network_report)
+    bpy.utils.unregister_class(PR_OT_stencil_mesh_report)
+
+if __name__ == '__main__':
+    register()
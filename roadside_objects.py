@@ -0,0 +1,143 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import bpy
+import numpy as np
+from math import pi
+import os
+import sys
+import imp
+
+dir = os.path.dirname(bpy.data.filepath)
+if not dir in sys.path:
+    sys.path.append(dir)
+
+import helper
+imp.reload(helper)
+
+import road_core
+import road_core.roadside
+imp.reload(road_core.roadside)
+
+
+class PR_OT_roadside_objects(bpy.types.Operator):
+    bl_idname = 'pr.roadside_objects'
+    bl_label = 'Roadside objects'
+    bl_description = 'Place instances of a collection along the selected roads'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    collection_source: bpy.props.StringProperty(
+        name='Collection',
+        description='Collection instanced at each location',
+        default='roadside_object')
+    side: bpy.props.EnumProperty(
+        name='Side',
+        items=(('left', 'Left', '', 0),
+               ('right', 'Right', '', 1),
+               ('both', 'Both', '', 2),
+              ),
+        default='both',
+    )
+    spacing: bpy.props.FloatProperty(
+        name='Spacing',
+        description='Distance between objects in s direction (0 to use density)',
+        default=10.0, min=0.0, max=1000.0, step=10)
+    density: bpy.props.FloatProperty(
+        name='Density',
+        description='Objects per meter, only used if spacing is 0',
+        default=0.0, min=0.0, max=100.0, step=1)
+    offset: bpy.props.FloatProperty(
+        name='Offset',
+        description='Distance of the objects from the road edge',
+        default=0.5, min=-100.0, max=100.0, step=10)
+
+    def get_specs(self):
+        '''
+            Return placement specs for road_core.roadside.
+        '''
+        spec = {'spacing': self.spacing, 'density': self.density, 'offset': self.offset}
+        if self.side == 'both':
+            return {'left': spec, 'right': spec}
+        else:
+            return {self.side: spec}
+
+    def get_roads(self, context):
+        '''
+            Return selected road objects.
+        '''
+        return [obj for obj in context.selected_objects
+                if helper.has_road_record(obj) and obj.get('dsc_type') == 'road']
+
+    def create_instances(self, context, obj_road, collection_source, placements):
+        '''
+            Create one point carrier object per road side which instances the
+            source collection on each placement with geometry nodes. Carriers
+            of an earlier run for the same road side are replaced.
+        '''
+        collection_name = 'roadside_' + str(obj_road['id_xodr'])
+        collection = bpy.data.collections.get(collection_name)
+        if collection is None:
+            collection = bpy.data.collections.new(collection_name)
+            context.scene.collection.children.link(collection)
+        node_group = helper.get_collection_instances_node_group()
+        num_objects = 0
+        for side, (locations, headings, _) in placements.items():
+            name = collection_name + '_' + side
+            obj = bpy.data.objects.get(name)
+            if obj is not None:
+                mesh = obj.data
+                bpy.data.objects.remove(obj, do_unlink=True)
+                if mesh is not None:
+                    bpy.data.meshes.remove(mesh)
+            # Objects on the left side face the road from the other direction
+            rotation_side = pi if side == 'left' else 0.0
+            rotations = np.zeros((len(headings), 3))
+            rotations[:, 2] = headings + rotation_side
+            mesh = helper.point_mesh_from_arrays(name, locations,
+                {'instance_rotation': ('FLOAT_VECTOR', rotations)})
+            obj = bpy.data.objects.new(name, mesh)
+            modifier = obj.modifiers.new('roadside_instances', 'NODES')
+            modifier.node_group = node_group
+            helper.set_modifier_input(modifier, 'Collection', collection_source)
+            collection.objects.link(obj)
+            num_objects += len(locations)
+        return num_objects
+
+    def execute(self, context):
+        collection_source = bpy.data.collections.get(self.collection_source)
+        if collection_source is None:
+            self.report({'WARNING'}, 'Collection {} not found!'.format(self.collection_source))
+            return {'CANCELLED'}
+        if self.spacing <= 0 and self.density <= 0:
+            self.report({'WARNING'}, 'Spacing or density must be larger than 0!')
+            return {'CANCELLED'}
+        specs = self.get_specs()
+        num_objects = 0
+        for obj_road in self.get_roads(context):
+            record = helper.get_road_record(obj_road)
+            geometry = road_core.geometry_from_params(record.geometry)
+            width_left, width_right = record.get_width_road_sides()
+            placements = road_core.roadside.get_roadside_placements(geometry,
+                width_left, width_right, specs)
+            num_objects += self.create_instances(context, obj_road, collection_source, placements)
+        self.report({'INFO'}, 'Placed {} roadside objects.'.format(num_objects))
+        return {'FINISHED'}
+
+def register():
+    bpy.utils.register_class(PR_OT_roadside_objects)
+
+def unregister():
+    bpy.utils.unregister_class(PR_OT_roadside_objects)
+
+if __name__ == '__main__':
+    register()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# road_core is imported from the repository root like the Blender scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import road_core
+from road_core.record import Road_record
+
+
+def get_params():
+    return {'lanes_left_num': 1, 'lanes_right_num': 2,
+            'lanes_left_widths': [3.5], 'lanes_left_widths_change': ['none'],
+            'lanes_left_types': ['driving'], 'lanes_left_road_mark_types': ['solid'],
+            'lanes_left_road_mark_weights': ['bold'], 'lanes_left_road_mark_colors': ['white'],
+            'lanes_right_widths': [3.5, 3.0], 'lanes_right_widths_change': ['none', 'open'],
+            'lanes_right_types': ['driving', 'driving'],
+            'lanes_right_road_mark_types': ['broken', 'solid'],
+            'lanes_right_road_mark_weights': ['standard', 'standard'],
+            'lanes_right_road_mark_colors': ['white', 'yellow'],
+            'lane_center_road_mark_type': 'solid', 'lane_center_road_mark_weight': 'standard',
+            'lane_center_road_mark_color': 'yellow',
+            'road_split_type': 'none', 'road_split_lane_idx': 0}
+
+
+def get_geometry_params():
+    geometry = road_core.geometry.get_geometry('line')
+    geometry.update({'point_start': (1.0, 2.0, 0.0), 'point_end': (51.0, 2.0, 1.0),
+                     'heading_start': 0.0, 'heading_end': 0.0,
+                     'curvature_start': 0.0, 'curvature_end': 0.0,
+                     'slope_start': 0.0, 'slope_end': 0.0,
+                     'connected_start': False, 'design_speed': 130.0}, 'default')
+    return geometry.params
+
+
+def test_pack_unpack():
+    params = dict(get_params(), lanes_left_road_mark_widths=[0.3],
+        lanes_right_road_mark_widths=[0.15, 0.15], lane_center_road_mark_width=0.15)
+    record = Road_record(get_geometry_params(), params)
+    record_unpacked = Road_record.unpack(record.pack())
+    assert record_unpacked.get_params() == record.get_params()
+    assert record_unpacked.geometry['length'] == record.geometry['length']
+    assert record_unpacked.geometry['point_end'] == list(record.geometry['point_end'])
+    assert record_unpacked.get_width_road_sides() == (3.5, 6.5)
+
+
+def test_road_mark_widths_from_weights():
+    # Properties of older files have no road mark widths
+    record = Road_record(get_geometry_params(), get_params())
+    assert record.lanes_left_road_mark_widths == [0.25]
+    assert record.lanes_right_road_mark_widths == [0.12, 0.12]
+    assert record.lane_center_road_mark_width == 0.12
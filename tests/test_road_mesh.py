@@ -0,0 +1,52 @@
+import numpy as np
+
+import road_core
+from road_core.lanes import Lane
+from road_core.road_mesh import Road_mesh_builder
+
+
+def get_geometry():
+    geometry = road_core.geometry.get_geometry('arc')
+    geometry.update({'point_start': (0.0, 0.0, 0.0), 'point_end': (60.0, 40.0, 0.0),
+                     'heading_start': 0.0, 'heading_end': 0.6,
+                     'curvature_start': 0.0, 'curvature_end': 0.0,
+                     'slope_start': 0.0, 'slope_end': 0.0,
+                     'connected_start': False, 'design_speed': 130.0}, 'default')
+    return geometry
+
+
+def get_lanes():
+    return [Lane(side='left', width=3.75, road_mark_type='solid', road_mark_color='white'),
+            Lane(side='center', width=0.0, road_mark_type='broken', road_mark_color='white'),
+            Lane(side='right', width=3.75, road_mark_type='solid', road_mark_color='white')]
+
+
+def update(mesh_builder, geometry, lanes):
+    return mesh_builder.update(geometry, lanes, 3.0, 0.05, 5.0)
+
+
+def assert_mesh_equal(mesh_builder, lanes):
+    mesh_builder_new = Road_mesh_builder()
+    update(mesh_builder_new, mesh_builder.geometry, lanes)
+    for array, array_new in zip(mesh_builder.get_mesh_arrays(), mesh_builder_new.get_mesh_arrays()):
+        np.testing.assert_allclose(array, array_new)
+
+
+def test_update_lanes_only():
+    geometry = get_geometry()
+    lanes = get_lanes()
+    mesh_builder = Road_mesh_builder()
+    assert update(mesh_builder, geometry, lanes) == 'geometry'
+    assert update(mesh_builder, geometry, lanes) is None
+    # Narrower lane only moves vertices
+    lanes[2].width = 3.0
+    assert update(mesh_builder, geometry, lanes) == 'vertices'
+    assert_mesh_equal(mesh_builder, lanes)
+    # Road mark color only changes materials
+    lanes[0].road_mark_color = 'yellow'
+    assert update(mesh_builder, geometry, lanes) == 'materials'
+    assert_mesh_equal(mesh_builder, lanes)
+    # Road mark type changes the faces
+    lanes[2].road_mark_type = 'broken'
+    assert update(mesh_builder, geometry, lanes) == 'topology'
+    assert_mesh_equal(mesh_builder, lanes)
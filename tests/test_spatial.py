@@ -0,0 +1,52 @@
+import numpy as np
+
+import road_core
+from road_core.spatial import Road_projection_index
+
+
+def get_geometry(curve, point_start, point_end, heading_start=0.0):
+    geometry = road_core.geometry.get_geometry(curve)
+    geometry.update({'point_start': point_start, 'point_end': point_end,
+                     'heading_start': heading_start, 'heading_end': heading_start + 0.4,
+                     'curvature_start': 0.0, 'curvature_end': 0.0,
+                     'slope_start': 0.0, 'slope_end': 0.0,
+                     'connected_start': False, 'design_speed': 130.0}, 'default')
+    return geometry
+
+
+def get_index():
+    index = Road_projection_index()
+    index.add_road(1, get_geometry('line', (10.0, 20.0, 0.0), (110.0, 20.0, 0.0)), -4.0, 4.0)
+    index.add_road(2, get_geometry('arc', (0.0, 100.0, 0.0), (60.0, 160.0, 0.0), 0.5), -4.0, 4.0)
+    index.add_road(3, get_geometry('spiral', (-100.0, 0.0, 0.0), (-160.0, 50.0, 0.0), 2.0), -4.0, 4.0)
+    return index
+
+
+def test_project_empty():
+    index = get_index()
+    for points in [[], np.empty((0, 2)), np.empty((0, 3))]:
+        idx_road, s, t, distance = index.project(points)
+        assert len(idx_road) == len(s) == len(t) == len(distance) == 0
+
+
+def test_project_points_on_roads():
+    index = get_index()
+    index.build()
+    for key in index.keys:
+        geometry = index.roads[key]['geometry']
+        s = np.linspace(0.05, 0.95, 7) * geometry.params['length']
+        t = np.linspace(-3.0, 3.0, 7)
+        xyz, _ = geometry.sample_cross_section_batch(s, t[:, np.newaxis])
+        points = xyz[np.arange(7), 0, 0:2] @ geometry.matrix_world[0:2, 0:2].T \
+            + geometry.matrix_world[0:2, 3]
+        idx_road, s_projected, t_projected, distance = index.project(points)
+        assert np.all(np.array(index.keys)[idx_road] == key)
+        np.testing.assert_allclose(s_projected, s, atol=1e-6)
+        np.testing.assert_allclose(t_projected, t, atol=1e-6)
+        np.testing.assert_allclose(distance, 0.0, atol=1e-6)
+
+
+def test_project_far_point():
+    idx_road, _, _, distance = get_index().project([[5000.0, 5000.0]])
+    assert idx_road[0] == -1
+    assert distance[0] == np.inf